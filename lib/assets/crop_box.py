@@ -1,7 +1,8 @@
 import math
-from PIL import Image
 
 from ..utils.enums import Eye
+from ..imaging.tiff_reader import open_reader
+from .crop_store import LOCATION_FIELDS, round_coordinates
 
 class CropBox:
     """
@@ -12,19 +13,35 @@ class CropBox:
         coordinates (tuple): The center coordinates of the crop box.
         top_left (tuple): The top-left coordinates of the reference area.
         scale (float): The scale (zoom) of the canvas at time of creation.
-        parameters (dict): Input parameters.
-        settings (dict): Settings for the crop box from the external settings module.
+        parameters (dict): Input parameters, shared by every crop rather than copied onto each.
+        settings (dict): Settings for the crop box from the external settings module, also shared.
 
     Methods:
         __init__: Initializes the crop box with specified parameters.
-        mark: Marks the crop box on the canvas.
-        locate: Calculates the relative location of the crop box to the centre point.
-        make_tiff: Creates a TIFF image of the crop area.
-        stamp: Stamps the crop box onto an image of the canvas.
+        project: Calculates the canvas positions of the box and its number at a given zoom.
+        mark: Marks the crop box on the canvas, optionally at a new position and zoom.
+        move: Moves the marked crop box to a new position and zoom.
+        unmark: Removes the crop box from the canvas.
+        locate: Calculates the relative location of the crop box to the centre point, in its crop store if it has one.
+        get_crop_corners: Calculates the corners of the crop in absolute image coordinates.
+        get_tiff_name: Returns the file name of the crop TIFF for a modality.
+        make_tiff: Creates a TIFF image of the crop area, optionally from an already open reader.
+        stamp: Stamps the crop box onto an image of the canvas, optionally at a reduced scale or offset.
         get_round_coordinates: Rounds the coordinates to opthalmic descriptions.
         get_ID: Returns the ID of the crop box.
         get_location_data: Returns the location data of the crop box.
+
+    Parameters and settings are read through attribute access (e.g. self.mpp), but live in
+    the shared dictionaries, so a crop only holds its own position and canvas items.
     """
+
+    # crop boxes are compact records, parameters and settings are shared rather than copied
+    __slots__ = ("ID", "coordinates", "top_left", "scale", "parameters", "settings", "store",
+                 "x_absolute", "y_absolute", "x0_box", "y0_box", "x1_box", "y1_box",
+                 "x_number", "y_number", "outline_pix", "ID_string", "box", "number",
+                 "x0", "y0", "x1", "y1") + LOCATION_FIELDS
+
+    OUTLINE_PC = 0.02
     
     def __init__(self, ID, coordinates, top_left, scale, parameters, settings):
 
@@ -32,36 +49,81 @@ class CropBox:
         self.coordinates = coordinates
         self.top_left = top_left
         self.scale = scale
-        
-        for k, v in parameters.items():
-            setattr(self, k, v)
-        
-        for k, v in settings.items():
-            setattr(self, k, v)
+        self.parameters = parameters
+        self.settings = settings
 
-        self.OUTLINE_PC = 0.02
+        # set when the crop is added to a crop store, which then holds its location
+        self.store = None
 
         # use top left and scale to get absolute coordinates
         self.x_absolute = (self.coordinates[0] - self.top_left[0]) / self.scale
         self.y_absolute = (self.coordinates[1] - self.top_left[1]) / self.scale
 
+        # coordinates for the box corners and ID number on the canvas at creation
+        self.project(self.top_left, self.scale)
+
+    def __getattr__(self, name):
+
+        # only called for attributes not set on the crop, so never for the three below
+        if name.startswith("__") or name in ("parameters", "settings", "store"):
+            raise AttributeError(name)
+
+        # locations held by a crop store
+        if name in LOCATION_FIELDS and self.store is not None:
+            return self.store.get(self.ID, name)
+
+        # and parameters and settings shared by every crop of the session
+        if name in self.parameters:
+            return self.parameters[name]
+        if name in self.settings:
+            return self.settings[name]
+
+        raise AttributeError(name)
+
+    @property
+    def size_pix(self):
+
+        return self.crop_size_μm / self.mpp
+
+    @property
+    def size_pix_scaled(self):
+
+        return self.size_pix * self.scale
+
+    @property
+    def size_pix_round(self):
+
         # round and scale the crop box size
-        self.size_pix = self.crop_size_μm / self.mpp
-        self.size_pix_scaled = self.size_pix * self.scale
-        self.size_pix_round = int(round(self.size_pix))
-        self.size_pix_scaled_round = int(round(self.size_pix_scaled))
+        return int(round(self.size_pix))
+
+    @property
+    def size_pix_scaled_round(self):
+
+        return int(round(self.size_pix_scaled))
+
+    def project(self, top_left, scale):
+
+        # canvas position of the crop centre for this top left corner and zoom
+        x = top_left[0] + (self.x_absolute * scale)
+        y = top_left[1] + (self.y_absolute * scale)
+        size = int(round(self.size_pix * scale))
 
         # coordinates for the box corners
-        self.x0_box = self.coordinates[0] - (self.size_pix_scaled_round * (0.5 - self.OUTLINE_PC/2))
-        self.y0_box = self.coordinates[1] - (self.size_pix_scaled_round * (0.5 - self.OUTLINE_PC/2))
-        self.x1_box = self.coordinates[0] + (self.size_pix_scaled_round * (0.5 + self.OUTLINE_PC/2))
-        self.y1_box = self.coordinates[1] + (self.size_pix_scaled_round * (0.5 + self.OUTLINE_PC/2))
+        self.x0_box = x - (size * (0.5 - self.OUTLINE_PC/2))
+        self.y0_box = y - (size * (0.5 - self.OUTLINE_PC/2))
+        self.x1_box = x + (size * (0.5 + self.OUTLINE_PC/2))
+        self.y1_box = y + (size * (0.5 + self.OUTLINE_PC/2))
 
         # cooridnates for the box ID number
-        self.x_number = self.coordinates[0] - (self.size_pix_scaled_round * 0.575)
-        self.y_number = self.coordinates[1] - (self.size_pix_scaled_round * 0.575)
+        self.x_number = x - (size * 0.575)
+        self.y_number = y - (size * 0.575)
 
-    def mark(self, canvas):
+        return (self.x0_box, self.y0_box, self.x1_box, self.y1_box, self.x_number, self.y_number)
+
+    def mark(self, canvas, top_left=None, scale=None):
+
+        if top_left is not None:
+            self.project(top_left, scale)
 
         # mark the smaller box
         self.outline_pix = int(round(self.size_pix_scaled * self.OUTLINE_PC * (1/self.scale)))
@@ -92,8 +154,23 @@ class CropBox:
                                          tags=(self.ID_string, "removable", "number"), 
                                          activefill=self.hover_colour)
 
+    def move(self, canvas, top_left, scale):
+
+        x0, y0, x1, y1, x_number, y_number = self.project(top_left, scale)
+
+        canvas.coords(self.box, x0, y0, x1, y1)
+        canvas.coords(self.number, x_number, y_number)
+
+    def unmark(self, canvas):
+
+        canvas.delete(self.ID_string)
+
     def locate(self, foveal_centre):
 
+        if self.store is not None:
+            self.store.locate(self.ID, foveal_centre)
+            return
+
         self.x_relative = self.x_absolute - foveal_centre[0]
         self.y_relative = self.y_absolute - foveal_centre[1]
         self.distance_μm = math.sqrt((self.x_relative**2) + (self.y_relative**2))
@@ -123,7 +200,7 @@ class CropBox:
         self.y_absolute_deg = math.fabs(self.y_degrees)
         self.y_ophth = (self.y_absolute_deg, self.y_meridian)
 
-    def make_tiff(self, modality, modality_path):
+    def get_crop_corners(self):
 
         # corners of the crop
         self.x0 = self.x_absolute - (self.size_pix_round/2)
@@ -131,43 +208,50 @@ class CropBox:
         self.x1 = self.x_absolute + (self.size_pix_round/2)
         self.y1 = self.y_absolute + (self.size_pix_round/2)
 
-        # cut the box out of the image
-        img = Image.open(modality_path)
-        tiff = img.crop((self.x0,self.y0,self.x1,self.y1))
+        return (self.x0, self.y0, self.x1, self.y1)
+
+    def get_tiff_name(self, modality):
 
         location_tuple = self.get_round_coordinates(1)
         location_string = ("_".join(map(str, location_tuple))).replace(".","p")
 
         tiff_name = self.id_number + "_" + self.eye.name + "_" + location_string + "_" + str(self.crop_size_μm) + "μm_crop-" + str(self.ID) + "_" + modality + ".tif"
 
+        return tiff_name
+
+    def make_tiff(self, modality, modality_path, reader=None):
+
+        box = self.get_crop_corners()
+
+        # cut the box out of the image, only reading the strips it overlaps where possible
+        if reader is None:
+            with open_reader(modality_path) as reader:
+                tiff = reader.crop(box)
+        else:
+            tiff = reader.crop(box)
+
+        tiff_name = self.get_tiff_name(modality)
+
         return (tiff, tiff_name)
 
-    def stamp(self, image, number_font):
+    def stamp(self, image, number_font, scale=1.0, offset=(0, 0)):
+
+        x0, y0, x1, y1 = [corner * scale for corner in self.get_crop_corners()]
+
+        # shift onto images that only hold part of the canvas
+        x0, x1 = x0 - offset[0], x1 - offset[0]
+        y0, y1 = y0 - offset[1], y1 - offset[1]
 
         # draw onto canvas - nudge number along depending on number of digits
         num_digits = len(str(self.ID))
-        image.rectangle([self.x0, self.y0, self.x1, self.y1], None, self.colour, width=8)
-        image.text([(self.x0 - (30*num_digits)), (self.y0 - 30)], str(self.ID), self.colour, font=number_font)
+        image.rectangle([x0, y0, x1, y1], None, self.colour, width=max(int(round(8 * scale)), 1))
+        image.text([(x0 - (30*num_digits*scale)), (y0 - 30*scale)], str(self.ID), self.colour, font=number_font)
 
         return image
 
     def get_round_coordinates(self, num_dec):
 
-        x_absolute_round = round(self.x_absolute_deg, num_dec)
-        if not num_dec: x_absolute_round = int(x_absolute_round)
-        y_absolute_round = round(self.y_absolute_deg, num_dec)
-        if not num_dec: y_absolute_round = int(y_absolute_round)
-
-        if (x_absolute_round == 0) and (y_absolute_round != 0):
-            round_coordinates = ((str(y_absolute_round) + self.y_meridian),)
-        elif (x_absolute_round != 0) and (y_absolute_round == 0):
-            round_coordinates = ((str(x_absolute_round) + self.x_meridian),)
-        elif (x_absolute_round == 0) and (y_absolute_round == 0):
-            round_coordinates = ("C",)
-        else:
-            round_coordinates = (str(y_absolute_round) + self.y_meridian, str(x_absolute_round) + self.x_meridian)
-
-        return round_coordinates
+        return round_coordinates(self.x_absolute_deg, self.x_meridian, self.y_absolute_deg, self.y_meridian, num_dec)
 
     def get_ID(self):
 
@@ -177,4 +261,4 @@ class CropBox:
 
         location_data = (self.ID, self.y_absolute_deg, self.y_meridian, self.x_absolute_deg, self.x_meridian, self.distance_deg, self.distance_μm, self.x_absolute, self.y_absolute)
 
-        return location_data
\ No newline at end of file
+        return location_data
@@ -0,0 +1,152 @@
+import math
+import numpy as np
+
+from ..utils.enums import Eye
+
+# image directions of the meridians for an OD eye, with x to the right and y down the image
+MERIDIAN_DIRECTIONS = {"N" : (1, 0), "T" : (-1, 0), "I" : (0, 1), "S" : (0, -1)}
+
+# eccentricity units, microns can also be written um so the config file stays ascii
+UNITS = ("deg", "μm", "um")
+MICRON_UNITS = ("μm", "um")
+
+def check_spec(spec):
+    """
+    Validates a crop grid spec, raising a ValueError if it can't be placed.
+
+    Args:
+        spec (dict): The grid spec, see get_grid_centres.
+    """
+
+    if not spec.get("meridians"):
+        raise ValueError("A crop grid needs at least one meridian")
+
+    for meridian in spec["meridians"]:
+
+        letters = set(str(meridian))
+        horizontal = letters & {"N", "T"}
+        vertical = letters & {"S", "I"}
+
+        # a meridian is one direction, or one horizontal and one vertical for the obliques
+        if not letters or letters - set(MERIDIAN_DIRECTIONS) or len(horizontal) > 1 or len(vertical) > 1 or len(str(meridian)) > 2:
+            raise ValueError("Not a valid meridian " + str(meridian) + " - should be N, T, S, I or an oblique such as SN")
+
+    if spec.get("units", "deg") not in UNITS:
+        raise ValueError("Not a valid grid unit " + str(spec.get("units")) + " - should be deg or μm")
+
+    if not spec.get("eccentricities") and not (spec.get("step", 0) > 0 and spec.get("max", 0) > 0):
+        raise ValueError("A crop grid needs a list of eccentricities, or a step and max eccentricity")
+
+    if spec.get("jitter", 0) < 0:
+        raise ValueError("The grid jitter can't be negative")
+
+def get_eccentricities(spec):
+    """
+    Returns the eccentricities of a crop grid, in the units of its spec.
+
+    Args:
+        spec (dict): The grid spec, see get_grid_centres.
+
+    Returns:
+        np.ndarray: The sorted eccentricities, without duplicates.
+    """
+
+    if spec.get("eccentricities"):
+        return np.unique(np.asarray(spec["eccentricities"], dtype=np.float64))
+
+    # a small tolerance so the max is included despite rounding, e.g. 0.1 steps to 1.0
+    count = int(math.floor(spec["max"] / spec["step"] + 1e-9))
+
+    return spec["step"] * np.arange(1, count + 1)
+
+def get_grid_offsets(spec, microns_per_degree):
+    """
+    Returns the offsets of every crop of a grid from the foveal centre, in degrees.
+
+    Args:
+        spec (dict): The grid spec, see get_grid_centres.
+        microns_per_degree (float): Microns per degree, to convert eccentricities given in microns.
+
+    Returns:
+        np.ndarray: An (n, 2) array of x and y offsets in degrees, for an OD eye.
+    """
+
+    eccentricities = get_eccentricities(spec)
+
+    if spec.get("units", "deg") in MICRON_UNITS:
+        eccentricities = eccentricities / microns_per_degree
+
+    offsets = []
+
+    # the centre is the same on every meridian, so it is only placed once
+    if np.any(eccentricities == 0):
+        offsets.append(np.zeros((1, 2)))
+        eccentricities = eccentricities[eccentricities != 0]
+
+    for meridian in spec["meridians"]:
+
+        direction = np.sum([MERIDIAN_DIRECTIONS[letter] for letter in str(meridian)], axis=0, dtype=np.float64)
+        direction /= np.hypot(*direction)
+
+        offsets.append(eccentricities[:, None] * direction[None, :])
+
+    return np.concatenate(offsets)
+
+def get_grid_centres(spec, foveal_centre, ppd, mpp, eye, image_size, crop_size_pix):
+    """
+    Returns the centres of the crops of a grid along meridians at fixed eccentricities.
+
+    The spec lists the meridians (N, T, S, I, or obliques such as SN halfway between two of
+    them) and either the eccentricities themselves or a step and max eccentricity, in
+    degrees or microns. An optional jitter moves each crop by a random amount, up to the
+    jitter in the same units, in x and y. Crops whose box would not fit inside the image
+    are left out.
+
+    Args:
+        spec (dict): The grid spec, with the keys
+            meridians (list of str): The meridians to place crops along.
+            eccentricities (list of float, optional): The eccentricities to place crops at.
+            step (float): The gap between eccentricities, if none are listed.
+            max (float): The furthest eccentricity, if none are listed.
+            units (str): deg or μm (or um), for the eccentricities, step, max and jitter.
+            jitter (float, optional): The largest random offset of each crop.
+            seed (int, optional): Seeds the jitter, so a grid can be placed again exactly.
+        foveal_centre (tuple): The foveal centre in absolute image coordinates.
+        ppd (float): Pixels per degree of the image.
+        mpp (float): Microns per pixel of the image.
+        eye (Eye): The eye of the image, OS grids are mirrored so nasal stays nasal.
+        image_size (tuple): The (width, height) of the image.
+        crop_size_pix (float): The edge length of a crop in pixels.
+
+    Returns:
+        tuple: A tuple containing:
+            - centres (list of tuple): The absolute image coordinates of the crops that fit.
+            - skipped (int): The number of crops left out as they would not fit inside the image.
+    """
+
+    check_spec(spec)
+
+    microns_per_degree = ppd * mpp
+    offsets = get_grid_offsets(spec, microns_per_degree)
+
+    if spec.get("jitter"):
+
+        jitter = spec["jitter"]
+
+        if spec.get("units", "deg") in MICRON_UNITS:
+            jitter = jitter / microns_per_degree
+
+        rng = np.random.default_rng(spec.get("seed"))
+        offsets = offsets + rng.uniform(-jitter, jitter, offsets.shape)
+
+    # nasal is to the left of the centre in OS images
+    if eye == Eye.OS:
+        offsets[:, 0] *= -1
+
+    centres = np.asarray(foveal_centre, dtype=np.float64) + offsets * ppd
+
+    half = crop_size_pix / 2
+    inside = ((centres[:, 0] >= half) & (centres[:, 0] <= image_size[0] - half)
+              & (centres[:, 1] >= half) & (centres[:, 1] <= image_size[1] - half))
+
+    return [tuple(centre) for centre in centres[inside].tolist()], int(np.count_nonzero(~inside))
@@ -0,0 +1,239 @@
+import math
+
+class CropIndex:
+    """
+    A uniform grid spatial index over crop boxes, in absolute image coordinates.
+
+    Every crop is registered in each grid cell its box overlaps, so finding the crops near a
+    point or inside a rectangle only has to look at the few cells around it rather than at
+    every crop placed so far. With the cell size set to the crop size, a box never covers
+    more than four cells. A rectangle covering more cells than are in use, e.g. the whole
+    image zoomed out, walks the used cells instead, so a query never costs more than the
+    crops themselves.
+
+    Attributes:
+        cell_size (float): The edge length of a grid cell in image pixels.
+
+    Methods:
+        __init__: Initializes an empty index.
+        add: Adds a crop box to the index.
+        remove: Removes a crop box from the index by ID.
+        clear: Removes every crop box from the index.
+        get: Returns the crop box with a given ID.
+        nearest: Returns the crop box closest to a point.
+        in_rect: Returns the crop boxes whose centres lie inside a rectangle.
+        overlapping: Returns the crop boxes overlapping a rectangle.
+        get_candidates: Returns the IDs registered in the cells a rectangle covers.
+    """
+
+    def __init__(self, cell_size):
+
+        self.cell_size = max(float(cell_size), 1.0)
+        self.cells = {}
+        self.boxes = {}
+        self.crops = {}
+
+        # the range of cells ever used, so a nearest search knows when to give up
+        self.bounds = None
+
+    def __len__(self):
+
+        return len(self.boxes)
+
+    def __contains__(self, ID):
+
+        return ID in self.boxes
+
+    def add(self, crop):
+
+        ID = crop.get_ID()
+        box = crop.get_crop_corners()
+
+        if ID in self.boxes:
+            self.remove(ID)
+
+        self.boxes[ID] = box
+        self.crops[ID] = crop
+
+        for cell in self.get_cells(box):
+            self.cells.setdefault(cell, set()).add(ID)
+
+        x0, y0, x1, y1 = self.get_cell_range(box)
+
+        if self.bounds is None:
+            self.bounds = (x0, y0, x1, y1)
+        else:
+            self.bounds = (min(self.bounds[0], x0), min(self.bounds[1], y0),
+                           max(self.bounds[2], x1), max(self.bounds[3], y1))
+
+    def remove(self, ID):
+
+        box = self.boxes.pop(ID)
+        self.crops.pop(ID)
+
+        for cell in self.get_cells(box):
+
+            self.cells[cell].discard(ID)
+
+            if not self.cells[cell]:
+                del self.cells[cell]
+
+    def clear(self):
+
+        self.cells = {}
+        self.boxes = {}
+        self.crops = {}
+        self.bounds = None
+
+    def get(self, ID):
+
+        return self.crops[ID]
+
+    def nearest(self, x, y, max_distance=math.inf):
+
+        if not self.boxes:
+            return None
+
+        cx, cy = self.get_cell(x, y)
+        best, best_distance = None, math.inf
+
+        # rings of cells closer or further than this can't hold a crop
+        first = max(self.bounds[0] - cx, cx - self.bounds[2], self.bounds[1] - cy, cy - self.bounds[3], 0)
+        last = max(cx - self.bounds[0], self.bounds[2] - cx, cy - self.bounds[1], self.bounds[3] - cy, 0)
+
+        for r in range(first, last + 1):
+
+            # every cell in ring r is at least (r - 1) cells away from the point
+            if (r - 1) * self.cell_size > min(best_distance, max_distance):
+                break
+
+            for ID in self.get_ring(cx, cy, r):
+
+                distance = box_distance(self.boxes[ID], x, y)
+
+                # a point inside several boxes picks the one whose centre is closest
+                if distance == 0:
+                    distance = -1 / (1 + centre_distance(self.boxes[ID], x, y))
+
+                if distance < best_distance or (distance == best_distance and ID > best):
+                    best, best_distance = ID, distance
+
+        if best is None or best_distance > max_distance:
+            return None
+
+        return self.crops[best]
+
+    def in_rect(self, rect):
+
+        x0, y0, x1, y1 = rect
+        found = set()
+
+        for IDs in self.get_candidates(rect):
+            for ID in IDs:
+
+                box = self.boxes[ID]
+                x, y = (box[0] + box[2]) / 2, (box[1] + box[3]) / 2
+
+                if x0 <= x <= x1 and y0 <= y <= y1:
+                    found.add(ID)
+
+        return [self.crops[ID] for ID in sorted(found)]
+
+    def overlapping(self, rect):
+
+        found = set()
+
+        for IDs in self.get_candidates(rect):
+            for ID in IDs:
+
+                box = self.boxes[ID]
+
+                if box[0] < rect[2] and rect[0] < box[2] and box[1] < rect[3] and rect[1] < box[3]:
+                    found.add(ID)
+
+        return [self.crops[ID] for ID in sorted(found)]
+
+    def get_candidates(self, rect):
+
+        if self.bounds is None:
+            return []
+
+        # only the part of the rectangle within the used cells can hold a crop
+        x0, y0, x1, y1 = self.get_cell_range(rect)
+        x0, y0 = max(x0, self.bounds[0]), max(y0, self.bounds[1])
+        x1, y1 = min(x1, self.bounds[2]), min(y1, self.bounds[3])
+
+        if x0 > x1 or y0 > y1:
+            return []
+
+        if (x1 - x0 + 1) * (y1 - y0 + 1) > len(self.cells):
+            return [IDs for (x, y), IDs in self.cells.items() if x0 <= x <= x1 and y0 <= y <= y1]
+
+        return [self.cells[cell] for cell in ((x, y) for y in range(y0, y1 + 1) for x in range(x0, x1 + 1)) if cell in self.cells]
+
+    def get_cell(self, x, y):
+
+        return (math.floor(x / self.cell_size), math.floor(y / self.cell_size))
+
+    def get_cell_range(self, box):
+
+        x0, y0 = self.get_cell(box[0], box[1])
+        x1, y1 = self.get_cell(box[2], box[3])
+
+        return (x0, y0, x1, y1)
+
+    def get_cells(self, box):
+
+        x0, y0, x1, y1 = self.get_cell_range(box)
+
+        return [(x, y) for y in range(y0, y1 + 1) for x in range(x0, x1 + 1)]
+
+    def get_ring(self, cx, cy, r):
+
+        if r == 0:
+            return set(self.cells.get((cx, cy), ()))
+
+        IDs = set()
+
+        for x in range(cx - r, cx + r + 1):
+            IDs.update(self.cells.get((x, cy - r), ()))
+            IDs.update(self.cells.get((x, cy + r), ()))
+
+        for y in range(cy - r + 1, cy + r):
+            IDs.update(self.cells.get((cx - r, y), ()))
+            IDs.update(self.cells.get((cx + r, y), ()))
+
+        return IDs
+
+def box_distance(box, x, y):
+    """
+    Returns the distance from a point to the nearest edge of a box, or 0 if it is inside.
+
+    Args:
+        box (tuple): The (x0, y0, x1, y1) corners of the box.
+        x (float): The x coordinate of the point.
+        y (float): The y coordinate of the point.
+
+    Returns:
+        float: The distance in pixels.
+    """
+
+    dx = max(box[0] - x, 0, x - box[2])
+    dy = max(box[1] - y, 0, y - box[3])
+
+    return math.hypot(dx, dy)
+
+def centre_distance(box, x, y):
+    """
+    Returns the distance from a point to the centre of a box.
+
+    Args:
+        box (tuple): The (x0, y0, x1, y1) corners of the box.
+        x (float): The x coordinate of the point.
+        y (float): The y coordinate of the point.
+
+    Returns:
+        float: The distance in pixels.
+    """
+
+    return math.hypot((box[0] + box[2]) / 2 - x, (box[1] + box[3]) / 2 - y)
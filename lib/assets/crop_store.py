@@ -0,0 +1,193 @@
+import numpy as np
+
+from ..utils.enums import Eye
+
+# location attributes of a crop box that are held in the store once it has been added
+LOCATION_FIELDS = ("x_relative", "y_relative", "distance_μm", "x_degrees", "y_degrees", "distance_deg",
+                   "x_meridian", "y_meridian", "x_absolute_deg", "y_absolute_deg", "x_ophth", "y_ophth")
+
+# meridians by code, as stored in the meridian columns
+X_MERIDIANS = ("N", "T")  # nasal, temporal
+Y_MERIDIANS = ("I", "S")  # inferior, superior
+
+class CropStore:
+    """
+    A struct-of-arrays store of the locations of every crop box, backed by NumPy arrays.
+
+    Each crop is a row of parallel columns holding its absolute position, its position
+    relative to the foveal centre in pixels and degrees, its distance and its meridians.
+    When the foveal centre moves, every crop is relocated in one vectorized operation
+    rather than one crop at a time. Rows are kept in the order the crops were added, and
+    as crop IDs only ever increase, a crop's row is found by binary search on its ID.
+
+    Attributes:
+        ppd (float): Pixels per degree of the image.
+        eye (Eye): The eye of the image, OS crops have their x degrees flipped.
+
+    Methods:
+        __init__: Initializes an empty store.
+        add: Adds a crop box to the store, optionally locating it straight away.
+        remove: Removes a crop box from the store by ID.
+        clear: Removes every crop box from the store.
+        relocate: Relocates every crop in relation to a new foveal centre.
+        locate: Relocates a single crop in relation to the foveal centre.
+        get: Returns a location attribute of a crop.
+        get_round_coordinates: Returns the rounded ophthalmic coordinates of every crop, or of a range of rows.
+    """
+
+    COLUMNS = {"ID": np.int64, "x_absolute": np.float64, "y_absolute": np.float64,
+               "x_relative": np.float64, "y_relative": np.float64, "distance_μm": np.float64,
+               "x_degrees": np.float64, "y_degrees": np.float64, "distance_deg": np.float64,
+               "x_meridian": np.int8, "y_meridian": np.int8}
+
+    def __init__(self, ppd, eye, capacity=64):
+
+        self.ppd = ppd
+        self.eye = eye
+        self.count = 0
+        self.columns = {name: np.zeros(capacity, dtype) for name, dtype in self.COLUMNS.items()}
+
+    def __len__(self):
+
+        return self.count
+
+    def add(self, crop, foveal_centre=None):
+
+        if self.count and crop.get_ID() <= self.columns["ID"][self.count - 1]:
+            raise ValueError("Crops must be added in order of increasing ID")
+
+        # double the capacity of every column when full
+        if self.count == len(self.columns["ID"]):
+            for name, column in self.columns.items():
+                grown = np.zeros(2 * len(column), column.dtype)
+                grown[:self.count] = column[:self.count]
+                self.columns[name] = grown
+
+        row = self.count
+        self.count += 1
+
+        self.columns["ID"][row] = crop.get_ID()
+        self.columns["x_absolute"][row] = crop.x_absolute
+        self.columns["y_absolute"][row] = crop.y_absolute
+
+        for name in LOCATION_FIELDS[:6]:
+            self.columns[name][row] = np.nan
+
+        crop.store = self
+
+        if foveal_centre is not None:
+            self.relocate(foveal_centre, slice(row, row + 1))
+
+    def remove(self, ID):
+
+        row = self.get_row(ID)
+
+        # shift the rows below up by one, keeping the order of the crops
+        for column in self.columns.values():
+            column[row:self.count - 1] = column[row + 1:self.count]
+
+        self.count -= 1
+
+    def clear(self):
+
+        self.count = 0
+
+    def relocate(self, foveal_centre, rows=None):
+
+        if rows is None:
+            rows = slice(0, self.count)
+
+        c = self.columns
+
+        c["x_relative"][rows] = c["x_absolute"][rows] - foveal_centre[0]
+        c["y_relative"][rows] = c["y_absolute"][rows] - foveal_centre[1]
+        c["distance_μm"][rows] = np.sqrt((c["x_relative"][rows]**2) + (c["y_relative"][rows]**2))
+
+        c["x_degrees"][rows] = c["x_relative"][rows] / self.ppd
+        c["y_degrees"][rows] = c["y_relative"][rows] / self.ppd
+        c["distance_deg"][rows] = c["distance_μm"][rows] / self.ppd
+
+        # flip the x coordinate if eye is OS instead of OD (used as default)
+        if self.eye == Eye.OS:
+            c["x_degrees"][rows] *= -1
+
+        # ophthal coordinates, nasal and inferior for zero or positive degrees
+        c["x_meridian"][rows] = c["x_degrees"][rows] < 0
+        c["y_meridian"][rows] = c["y_degrees"][rows] < 0
+
+    def locate(self, ID, foveal_centre):
+
+        row = self.get_row(ID)
+        self.relocate(foveal_centre, slice(row, row + 1))
+
+    def get_row(self, ID):
+
+        row = int(np.searchsorted(self.columns["ID"][:self.count], ID))
+
+        if row == self.count or self.columns["ID"][row] != ID:
+            raise KeyError(ID)
+
+        return row
+
+    def get(self, ID, name):
+
+        row = self.get_row(ID)
+
+        if name == "x_meridian":
+            return X_MERIDIANS[self.columns["x_meridian"][row]]
+        elif name == "y_meridian":
+            return Y_MERIDIANS[self.columns["y_meridian"][row]]
+        elif name == "x_absolute_deg":
+            return abs(float(self.columns["x_degrees"][row]))
+        elif name == "y_absolute_deg":
+            return abs(float(self.columns["y_degrees"][row]))
+        elif name == "x_ophth":
+            return (self.get(ID, "x_absolute_deg"), self.get(ID, "x_meridian"))
+        elif name == "y_ophth":
+            return (self.get(ID, "y_absolute_deg"), self.get(ID, "y_meridian"))
+
+        return float(self.columns[name][row])
+
+    def get_round_coordinates(self, num_dec, rows=None):
+
+        if rows is None:
+            rows = slice(0, self.count)
+
+        x_degrees = np.abs(self.columns["x_degrees"][rows]).tolist()
+        y_degrees = np.abs(self.columns["y_degrees"][rows]).tolist()
+        x_meridians = self.columns["x_meridian"][rows].tolist()
+        y_meridians = self.columns["y_meridian"][rows].tolist()
+
+        return [round_coordinates(x, X_MERIDIANS[xm], y, Y_MERIDIANS[ym], num_dec)
+                for x, xm, y, ym in zip(x_degrees, x_meridians, y_degrees, y_meridians)]
+
+def round_coordinates(x_absolute_deg, x_meridian, y_absolute_deg, y_meridian, num_dec):
+    """
+    Rounds a location to its ophthalmic description, e.g. ("1.5S", "2.0N") or ("C",).
+
+    Args:
+        x_absolute_deg (float): The horizontal distance from the centre in degrees.
+        x_meridian (str): The horizontal meridian, N or T.
+        y_absolute_deg (float): The vertical distance from the centre in degrees.
+        y_meridian (str): The vertical meridian, I or S.
+        num_dec (int): The number of decimal places to round to.
+
+    Returns:
+        tuple: The rounded coordinates as strings.
+    """
+
+    x_absolute_round = round(x_absolute_deg, num_dec)
+    if not num_dec: x_absolute_round = int(x_absolute_round)
+    y_absolute_round = round(y_absolute_deg, num_dec)
+    if not num_dec: y_absolute_round = int(y_absolute_round)
+
+    if (x_absolute_round == 0) and (y_absolute_round != 0):
+        coordinates = ((str(y_absolute_round) + y_meridian),)
+    elif (x_absolute_round != 0) and (y_absolute_round == 0):
+        coordinates = ((str(x_absolute_round) + x_meridian),)
+    elif (x_absolute_round == 0) and (y_absolute_round == 0):
+        coordinates = ("C",)
+    else:
+        coordinates = (str(y_absolute_round) + y_meridian, str(x_absolute_round) + x_meridian)
+
+    return coordinates
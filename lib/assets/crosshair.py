@@ -1,3 +1,5 @@
+import math
+
 class Crosshair:
     """
     A class using a crosshair representing the foveal centre.
@@ -15,33 +17,31 @@ class Crosshair:
 
     Methods:
         __init__: Initializes the crosshair with specified parameters.
+        get_degree_marks: Returns the degree marks within a range of distances from the centre.
+        update: Redraws the parts of the crosshair inside the visible area at a new position and zoom.
+        get_markers: Returns the visible degree markers along the crosshair lines.
+        get_rings: Returns the visible runs of the degree rings.
+        draw: Creates, moves or deletes canvas items to match a set of shapes.
+        unmark: Removes the crosshair from the canvas.
         calculate_length: Calculates the length of the crosshair lines based on the current scale.
-        find_original_coordinates: Recalculates the original coordinates of the crosshair based on a new top-left reference.
-        update_scale: Updates the scale factor for the crosshair.
-        add_degree_markers: Adds degree markers or rings to the crosshair on a canvas.
-        mark: Marks the crosshair on a canvas, updating its length and markers.
+        mark: Marks the crosshair on a canvas at its creation position and zoom.
         get_abs_location: Returns the absolute coordinates of the crosshair center.
-        stamp: Stamps the crosshair onto the image.
+        stamp: Stamps the crosshair onto the image, optionally at a reduced scale or offset.
     """
+
+    # approximate length in screen pixels of the straight segments making up a ring
+    RING_STEP = 4
     
     def __init__(self, coordinates, top_left, scale, parameters, settings):
 
         self.coordinates = coordinates
         self.top_left = top_left
         self.scale = scale
-        
-        for k, v in parameters.items():
-            setattr(self, k, v)
-            
-        for k, v in settings.items():
-            setattr(self, k, v)
-
-        # create a list of degree marking distances (every 1deg plus one at 0.5deg)
-        num_degmarks = int(self.length_pixels / self.ppd)
-        self.degree_marks = list(range(-num_degmarks, num_degmarks+1))
-        self.degree_marks.append(0.5)
-        self.degree_marks.append(-0.5)
-        self.degree_marks.remove(0)
+        self.parameters = parameters
+        self.settings = settings
+
+        # degree marks every 1deg plus one at 0.5deg, only generated for the visible range
+        self.max_degrees = int(self.length_pixels / self.ppd)
 
         self.x = self.coordinates[0]
         self.y = self.coordinates[1]
@@ -50,74 +50,198 @@ class Crosshair:
         self.x_absolute = (self.x - self.top_left[0]) / self.scale
         self.y_absolute = (self.y - self.top_left[1]) / self.scale
 
-    def calculate_length(self):
+        self.items = {}  # canvas items currently drawn, by what they show
 
-        length = self.length_pixels * self.scale
+    def __getattr__(self, name):
 
-        self.x_min = self.x - length
-        self.x_max = self.x + length
-        self.y_min = self.y - length
-        self.y_max = self.y + length
+        # parameters and settings are shared rather than copied onto the crosshair
+        if name.startswith("__") or name in ("parameters", "settings"):
+            raise AttributeError(name)
+
+        if name in self.parameters:
+            return self.parameters[name]
+        if name in self.settings:
+            return self.settings[name]
+
+        raise AttributeError(name)
 
-    def find_original_coordinates(self, new_top_left):
+    def get_degree_marks(self, low, high):
 
-        self.x = (self.x_absolute + (new_top_left[0]/self.scale)) * self.scale
-        self.y = (self.y_absolute + (new_top_left[1]/self.scale)) * self.scale
+        # the degree marks between two distances from the centre, in degrees
+        first = max(math.ceil(low), -self.max_degrees)
+        last = min(math.floor(high), self.max_degrees)
 
-    def update_scale(self, scale):
+        marks = [n for n in range(first, last + 1) if n != 0]
+        marks += [n for n in (-0.5, 0.5) if low <= n <= high]
+
+        return marks
+
+    def update(self, canvas, rings, top_left, scale, viewport):
 
         self.scale = scale
 
-    def add_degree_markers(self, canvas, rings, new_top_left, replacing=False):
+        # the centre on the canvas, and the visible area around it in canvas coordinates
+        self.x = top_left[0] + (self.x_absolute * scale)
+        self.y = top_left[1] + (self.y_absolute * scale)
+        self.calculate_length()
+
+        x0, y0, x1, y1 = viewport
+        shapes = {}
 
-        if not replacing:
+        # the cross itself, clipped to the visible area
+        if y0 <= self.y <= y1 and self.x_min < x1 and x0 < self.x_max:
+            shapes[("cross", "horizontal")] = (max(self.x_min, x0), self.y, min(self.x_max, x1), self.y)
+        if x0 <= self.x <= x1 and self.y_min < y1 and y0 < self.y_max:
+            shapes[("cross", "vertical")] = (self.x, max(self.y_min, y0), self.x, min(self.y_max, y1))
 
-            self.find_original_coordinates(new_top_left)
+        pixels_per_degree = self.ppd * scale
 
         if rings is False:
+            shapes.update(self.get_markers(viewport, pixels_per_degree))
+        elif rings is True:
+            shapes.update(self.get_rings(viewport, pixels_per_degree))
 
-            # create small degree markings along the crosshair
-            for n in self.degree_marks:
+        self.draw(canvas, shapes)
 
-                mark_width_scaled = self.mark_width * self.scale
-                radius = n * self.ppd * self.scale
+    def get_markers(self, viewport, pixels_per_degree):
 
-                x = radius + self.x
-                y = radius + self.y
+        x0, y0, x1, y1 = viewport
+        mark_width_scaled = self.mark_width * self.scale
+        shapes = {}
 
-                x_left = self.x - mark_width_scaled
-                x_right = self.x + mark_width_scaled
-                y_top = self.y - mark_width_scaled
-                y_bottom = self.y + mark_width_scaled
-                canvas.create_line(x_left, y, x_right, y, tags=("crosshair", "markers"), fill=self.colour)
-                canvas.create_line(x, y_top, x, y_bottom, tags=("crosshair", "markers"), fill=self.colour)
+        # small degree markings across the vertical line, for the visible rows
+        if x0 - mark_width_scaled <= self.x <= x1 + mark_width_scaled:
 
-        elif rings is True:
+            for n in self.get_degree_marks((y0 - self.y) / pixels_per_degree, (y1 - self.y) / pixels_per_degree):
+                y = self.y + n * pixels_per_degree
+                shapes[("markers", "y", n)] = (self.x - mark_width_scaled, y, self.x + mark_width_scaled, y)
 
-            # create circles at the degree distances
-            for n in self.degree_marks:
+        # and across the horizontal line, for the visible columns
+        if y0 - mark_width_scaled <= self.y <= y1 + mark_width_scaled:
 
-                if n != 0:
-                    radius = n * self.ppd * self.scale
-                    canvas.create_circle(canvas, self.x, self.y, radius, tags=("crosshair", "rings"), outline=self.colour)
+            for n in self.get_degree_marks((x0 - self.x) / pixels_per_degree, (x1 - self.x) / pixels_per_degree):
+                x = self.x + n * pixels_per_degree
+                shapes[("markers", "x", n)] = (x, self.y - mark_width_scaled, x, self.y + mark_width_scaled)
 
-    def mark(self, canvas, rings):
+        return shapes
 
-        self.calculate_length()
+    def get_rings(self, viewport, pixels_per_degree):
+
+        x0, y0, x1, y1 = viewport
+
+        # only rings passing between the nearest and furthest points of the visible area
+        nearest = math.hypot(max(x0 - self.x, 0, self.x - x1), max(y0 - self.y, 0, self.y - y1))
+        furthest = math.hypot(max(abs(x0 - self.x), abs(x1 - self.x)), max(abs(y0 - self.y), abs(y1 - self.y)))
+
+        marks = self.get_degree_marks(nearest / pixels_per_degree, furthest / pixels_per_degree)
+        shapes = {}
+
+        for n in marks:
+
+            radius = n * pixels_per_degree
+
+            # rings are drawn as the visible runs of a polyline rather than as huge ovals
+            for i, points in enumerate(arc_runs(self.x, self.y, radius, viewport, self.RING_STEP)):
+                shapes[("rings", n, i)] = points
+
+        return shapes
+
+    def draw(self, canvas, shapes):
+
+        for key in [key for key in self.items if key not in shapes]:
+            canvas.delete(self.items.pop(key))
+
+        for key, points in shapes.items():
 
-        self.horizontal = canvas.create_line(self.x_min, self.y, self.x_max, self.y, tags=("crosshair", "cross"), fill=self.colour)
-        self.vertical = canvas.create_line(self.x, self.y_min, self.x, self.y_max, tags=("crosshair", "cross"), fill=self.colour)
+            if key in self.items:
+                canvas.coords(self.items[key], *points)
+            else:
+                self.items[key] = canvas.create_line(*points, tags=("crosshair", key[0]), fill=self.colour)
 
-        self.add_degree_markers(canvas, rings, self.top_left, replacing=True)
+    def unmark(self, canvas):
+
+        canvas.delete("crosshair")
+        self.items = {}
+
+    def calculate_length(self):
+
+        length = self.length_pixels * self.scale
+
+        self.x_min = self.x - length
+        self.x_max = self.x + length
+        self.y_min = self.y - length
+        self.y_max = self.y + length
+
+    def mark(self, canvas, rings, viewport):
+
+        self.update(canvas, rings, self.top_left, self.scale, viewport)
 
     def get_abs_location(self):
 
         coordinates = (self.x_absolute, self.y_absolute)
         return coordinates
 
-    def stamp(self, image):
+    def stamp(self, image, scale=1.0, offset=(0, 0)):
+
+        x = (self.x_absolute * scale) - offset[0]
+        y = (self.y_absolute * scale) - offset[1]
+        length = 10000 * scale
+        width = max(int(round(4 * scale)), 1)
+
+        image.line([(x - length), y, (x + length), y], fill=self.colour, width=width)
+        image.line([x, (y - length), x, (y + length)], fill=self.colour, width=width)
+
+        return image
+
+def arc_runs(x, y, radius, viewport, step):
+    """
+    Approximates the parts of a circle inside a rectangle as polylines.
+
+    Only the range of angles facing the rectangle is sampled, so the number of points
+    depends on the visible length of the circle rather than on its radius.
+
+    Args:
+        x (float): The x coordinate of the centre.
+        y (float): The y coordinate of the centre.
+        radius (float): The radius of the circle.
+        viewport (tuple): The (x0, y0, x1, y1) rectangle, in the same coordinates.
+        step (float): The approximate length of each straight segment.
+
+    Returns:
+        list of list: The flattened point lists of each visible run.
+    """
+
+    x0, y0, x1, y1 = viewport
+
+    # pad the rectangle so runs don't stop just short of its edges
+    x0, y0, x1, y1 = x0 - step, y0 - step, x1 + step, y1 + step
+
+    if x0 <= x <= x1 and y0 <= y <= y1:
+        start, extent = 0, 2 * math.pi
+    else:
+        # a centre outside the rectangle sees it within a half turn
+        middle = math.atan2((y0 + y1) / 2 - y, (x0 + x1) / 2 - x)
+        offsets = [math.remainder(math.atan2(cy - y, cx - x) - middle, 2 * math.pi)
+                   for cx in (x0, x1) for cy in (y0, y1)]
+        start, extent = middle + min(offsets), max(offsets) - min(offsets)
+
+    count = min(max(int(extent * radius / step), 8), 2000)
+    runs, run = [], []
+
+    for i in range(count + 1):
+
+        angle = start + extent * i / count
+        px = x + radius * math.cos(angle)
+        py = y + radius * math.sin(angle)
+
+        if x0 <= px <= x1 and y0 <= py <= y1:
+            run += [px, py]
+        elif run:
+            runs.append(run)
+            run = []
 
-        image.line([(self.x_absolute - 10000), self.y_absolute, (self.x_absolute + 10000), self.y_absolute], fill=self.colour, width=4)
-        image.line([self.x_absolute, (self.y_absolute - 10000), self.x_absolute, (self.y_absolute + 10000)], fill=self.colour, width=4)
+    if run:
+        runs.append(run)
 
-        return image
\ No newline at end of file
+    # a single point can't be drawn as a line
+    return [run for run in runs if len(run) >= 4]
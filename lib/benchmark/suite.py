@@ -0,0 +1,625 @@
+import os
+import sys
+import copy
+import json
+import math
+import time
+import shutil
+import platform
+import subprocess
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import PIL
+import numpy as np
+from PIL import Image
+
+from ..assets.crop_box import CropBox
+from ..assets.crop_index import CropIndex
+from ..assets.crop_store import CropStore, LOCATION_FIELDS
+from ..assets.crosshair import Crosshair
+from ..imaging.extraction import extract_crops
+from ..imaging.pyramid import ImagePyramid
+from ..imaging.tiles import TileCache, TiledRenderer
+from ..gui.overlay import CropOverlay
+from ..utils import export
+from ..utils.enums import Eye
+from ..utils.util_func import define_parameters, set_max_pixels
+from . import synthetic
+
+REPORT_VERSION = 1
+
+# directions of the simulated pan paths, in screen pixels per step
+PAN_PATHS = {"horizontal": (1, 0), "vertical": (0, 1), "diagonal": (1, 1)}
+
+class NullCanvas:
+    """
+    A stand-in for the viewer's Tk canvas that accepts the crop overlay's drawing calls
+    without drawing anything, so the overlay's own cost can be timed without a display.
+
+    Methods:
+        create_rectangle: Returns a new item ID.
+        create_text: Returns a new item ID.
+        coords: Does nothing.
+        itemconfigure: Does nothing.
+        delete: Does nothing.
+    """
+
+    def __init__(self):
+
+        self.items = 0
+
+    def create_rectangle(self, *args, **kwargs):
+
+        self.items += 1
+        return self.items
+
+    def create_text(self, *args, **kwargs):
+
+        self.items += 1
+        return self.items
+
+    def coords(self, *args):
+
+        pass
+
+    def itemconfigure(self, *args, **kwargs):
+
+        pass
+
+    def delete(self, *args):
+
+        pass
+
+def peak_rss_mb():
+    """
+    Returns the peak resident memory of this process so far.
+
+    Returns:
+        float or None: The peak resident set size in megabytes, or None if unknown.
+    """
+
+    try:
+        import resource
+    except ImportError:
+        return windows_peak_rss_mb()
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # macOS reports bytes, everything else kilobytes
+    if sys.platform == "darwin":
+        return round(peak / 2**20, 1)
+
+    return round(peak / 2**10, 1)
+
+def children_peak_rss_mb():
+    """
+    Returns the largest peak resident memory of the finished child processes, e.g. export workers.
+
+    Returns:
+        float or None: The peak resident set size in megabytes, or None if unknown.
+    """
+
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+
+    if sys.platform == "darwin":
+        return round(peak / 2**20, 1)
+
+    return round(peak / 2**10, 1)
+
+def windows_peak_rss_mb():
+    """
+    Returns the peak working set of this process on Windows, which has no resource module.
+
+    Returns:
+        float or None: The peak working set in megabytes, or None if unknown.
+    """
+
+    try:
+        import ctypes
+        from ctypes import wintypes
+
+        class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+            _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD),
+                        ("PeakWorkingSetSize", ctypes.c_size_t), ("WorkingSetSize", ctypes.c_size_t),
+                        ("QuotaPeakPagedPoolUsage", ctypes.c_size_t), ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                        ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t), ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                        ("PagefileUsage", ctypes.c_size_t), ("PeakPagefileUsage", ctypes.c_size_t)]
+
+        counters = PROCESS_MEMORY_COUNTERS()
+        counters.cb = ctypes.sizeof(counters)
+        process = ctypes.windll.kernel32.GetCurrentProcess()
+
+        if not ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+            return None
+
+        return round(counters.PeakWorkingSetSize / 2**20, 1)
+
+    except (ImportError, AttributeError, OSError):
+        return None
+
+def frame_stats(frame_times):
+    """
+    Summarises a list of frame times.
+
+    Args:
+        frame_times (list of float): Frame times in seconds.
+
+    Returns:
+        dict: The frame count, and the mean, median, 95th percentile and slowest frame in ms.
+    """
+
+    if not frame_times:
+        return {"frames" : 0}
+
+    ms = np.array(frame_times) * 1000
+
+    stats = {
+        "frames" : len(frame_times),
+        "mean_ms" : round(float(ms.mean()), 2),
+        "p50_ms" : round(float(np.percentile(ms, 50)), 2),
+        "p95_ms" : round(float(np.percentile(ms, 95)), 2),
+        "max_ms" : round(float(ms.max()), 2)
+        }
+
+    return stats
+
+def get_crop_memory(crops):
+    """
+    Measures the memory used by a list of crop boxes, excluding the shared parameters,
+    settings and crop store.
+
+    Args:
+        crops (list of CropBox): The crop boxes to measure.
+
+    Returns:
+        dict: The total bytes, and the bytes per crop.
+    """
+
+    shared = ("parameters", "settings", "store")
+    total = 0
+
+    for crop in crops:
+
+        total += sys.getsizeof(crop)
+
+        for name in CropBox.__slots__:
+
+            if name in shared or not hasattr(crop, name) or (name in LOCATION_FIELDS and crop.store is not None):
+                continue
+
+            value = getattr(crop, name)
+            total += sys.getsizeof(value)
+
+            if isinstance(value, tuple):
+                total += sum(sys.getsizeof(item) for item in value)
+
+    return {"bytes" : total, "bytes_per_crop" : round(total / max(len(crops), 1))}
+
+def place_crops(parameters, settings, size, count):
+    """
+    Places a foveal centre in the middle of an image and crops on a spiral around it.
+
+    Crops are spaced a little more than a crop apart and are kept inside the image, so the
+    extraction and save benchmarks do the same work as a real session of that many crops.
+
+    Args:
+        parameters (dict): User parameters for the image.
+        settings (dict): Settings from the config file.
+        size (int): The edge length of the square image in pixels.
+        count (int): The number of crops to place.
+
+    Returns:
+        tuple: A tuple containing:
+            - crops (list of CropBox): The crops, located relative to the foveal centre.
+            - crosshair (Crosshair): The foveal centre crosshair.
+    """
+
+    centre = (size / 2, size / 2)
+
+    crosshair = Crosshair(coordinates=centre,
+                          top_left=(0, 0),
+                          scale=1.0,
+                          parameters=parameters,
+                          settings=settings["crosshair"])
+
+    spacing = 1.25 * parameters["crop_size_μm"] / parameters["mpp"]
+    limit = size / 2 - spacing
+
+    crops = []
+    store = CropStore(parameters["ppd"], parameters["eye"])
+    x, y, dx, dy = 0, 0, 1, 0
+    steps, leg = 0, 1
+
+    # walk a square spiral out from the centre, skipping positions outside the image
+    while len(crops) < count:
+
+        if abs(x * spacing) > limit and abs(y * spacing) > limit:
+            raise ValueError("Only " + str(len(crops)) + " crops fit in a " + str(size) + " pixel image")
+
+        if abs(x * spacing) <= limit and abs(y * spacing) <= limit:
+
+            crop = CropBox(ID=len(crops) + 1,
+                           coordinates=(centre[0] + x * spacing, centre[1] + y * spacing),
+                           top_left=(0, 0),
+                           scale=1.0,
+                           parameters=parameters,
+                           settings=settings["crop_box"])
+
+            store.add(crop)
+            crops.append(crop)
+
+        x, y = x + dx, y + dy
+        steps += 1
+
+        if steps == leg:
+            dx, dy = -dy, dx
+            steps = 0
+            if dy == 0:
+                leg += 1
+
+    store.relocate(crosshair.get_abs_location())
+
+    return crops, crosshair
+
+def bench_render(parameters, settings, options):
+    """
+    Times the viewer's redraws (as done by Cropper.show_image) at several zooms and pans.
+
+    The image is opened and its pyramid built as the viewer does, then at each zoom level a
+    cold full quality frame is rendered, followed by preview frames along each pan path and
+    the refinement of the last view back to full quality. Every frame also updates the crop
+    overlay, with the benchmark's crops placed, which is timed separately. The conversion to
+    a Tk PhotoImage and the drawing of the canvas items need a display and are not included.
+
+    Args:
+        parameters (dict): User parameters for the primary image.
+        settings (dict): Settings from the config file.
+        options (dict): The benchmark settings.
+
+    Returns:
+        dict: Load times, and frame and overlay update times by zoom level and pan path.
+    """
+
+    viewer = settings["viewer"]
+
+    start = time.perf_counter()
+    image = Image.open(parameters["image_path"])
+    image.load()
+    load_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    pyramid = ImagePyramid(image, viewer["pyramid_min_size"])
+    pyramid_seconds = time.perf_counter() - start
+
+    # the crops are indexed as in the viewer, which queries the index on every redraw
+    crops, _ = place_crops(parameters, settings, min(pyramid.width, pyramid.height), options["crops"])
+    crop_index = CropIndex(parameters["crop_size_μm"] / parameters["mpp"])
+
+    for crop in crops:
+        crop_index.add(crop)
+
+    view_width, view_height = options["viewport"]
+    details = {"load_seconds" : round(load_seconds, 3), "pyramid_seconds" : round(pyramid_seconds, 3),
+               "pyramid_levels" : len(pyramid.levels), "crops" : len(crops), "zoom" : {}}
+
+    for scale in options["zoom_levels"]:
+
+        cache = TileCache(viewer["tile_cache_mb"] * 2**20)
+        renderer = TiledRenderer(pyramid, cache, viewer["tile_size"], viewer["preview_coarser_levels"])
+        overlay = CropOverlay(NullCanvas(), crop_index, settings["crop_box"]["colour"])
+
+        # the visible part of the image at this zoom, starting in the middle
+        image_width, image_height = pyramid.width * scale, pyramid.height * scale
+        width, height = min(view_width, image_width), min(view_height, image_height)
+
+        x = (image_width - width) / 2
+        y = (image_height - height) / 2
+
+        start = time.perf_counter()
+        renderer.render(scale, (x, y, x + width, y + height))
+        results = {"first_frame_ms" : round((time.perf_counter() - start) * 1000, 2)}
+
+        for name, (dx, dy) in PAN_PATHS.items():
+
+            frame_times = []
+            overlay_times = []
+            px, py = x, y
+
+            for _ in range(options["pan_frames"]):
+
+                # bounce off the edges of the image
+                if not 0 <= px + dx * options["pan_step"] <= image_width - width:
+                    dx = -dx
+                if not 0 <= py + dy * options["pan_step"] <= image_height - height:
+                    dy = -dy
+
+                px = min(max(px + dx * options["pan_step"], 0), image_width - width)
+                py = min(max(py + dy * options["pan_step"], 0), image_height - height)
+
+                start = time.perf_counter()
+                renderer.render(scale, (px, py, px + width, py + height), preview=True)
+                frame_times.append(time.perf_counter() - start)
+
+                # the image's top left corner on the canvas, and the visible part of the canvas
+                start = time.perf_counter()
+                overlay.update((-px, -py), scale, (0, 0, width, height))
+                overlay_times.append(time.perf_counter() - start)
+
+            # once the view is still, the preview tiles are refined and it is drawn again
+            start = time.perf_counter()
+            renderer.refine(scale, (px, py, px + width, py + height), math.inf)
+            renderer.render(scale, (px, py, px + width, py + height))
+            refine_seconds = time.perf_counter() - start
+
+            results[name] = frame_stats(frame_times)
+            results[name]["refine_ms"] = round(refine_seconds * 1000, 2)
+            results[name]["overlay"] = frame_stats(overlay_times)
+
+        results["cache"] = cache.get_stats()
+        details["zoom"][str(scale)] = results
+
+    return details
+
+def bench_extract(parameters, settings, options):
+    """
+    Times cutting every crop out of every modality, without saving them.
+
+    Args:
+        parameters (dict): User parameters for the primary image.
+        settings (dict): Settings from the config file.
+        options (dict): The benchmark settings.
+
+    Returns:
+        dict: The crop count and memory, and seconds and crops per second for each modality.
+    """
+
+    crops, _ = place_crops(parameters, settings, options["size"], options["crops"])
+    details = {"crops" : len(crops), "crop_memory" : get_crop_memory(crops), "modalities" : {}}
+
+    for modality in parameters["modalities"]:
+
+        modality_path = parameters["folder"] + "/" + parameters["base_name"] + modality + ".tif"
+
+        start = time.perf_counter()
+
+        for crop, image, filename in extract_crops(modality, modality_path, crops):
+            pass
+
+        seconds = time.perf_counter() - start
+        details["modalities"][modality] = {"seconds" : round(seconds, 3), "crops_per_second" : round(len(crops) / seconds, 1)}
+
+    return details
+
+def bench_canvas(parameters, settings, options):
+    """
+    Times drawing and saving the crop location canvas of the primary modality, with every
+    crop stamped on it. The crop tiffs themselves are not written.
+
+    Args:
+        parameters (dict): User parameters for the primary image.
+        settings (dict): Settings from the config file.
+        options (dict): The benchmark settings, with the canvas mode to use.
+
+    Returns:
+        dict: The canvas mode and the size of the saved canvas.
+    """
+
+    crops, crosshair = place_crops(parameters, settings, options["size"], options["crops"])
+
+    output_folder = options["work_folder"] + "//canvas_" + options["canvas_mode"]
+    os.makedirs(output_folder, exist_ok=True)
+
+    canvas_settings = dict(settings["canvas"], mode=options["canvas_mode"], overview_scale=0)
+    canvas_path = output_folder + "//canvas.tif"
+
+    # the canvas is drawn with every crop on it, but no crop tiffs are written
+    job = {
+        "modality" : parameters["primary_modality"],
+        "modality_path" : parameters["image_path"],
+        "crops" : crops,
+        "crosshair" : crosshair,
+        "crops_folder" : output_folder,
+        "canvas_path" : canvas_path,
+        "font_size" : settings["text"]["font_size"],
+        "canvas" : canvas_settings,
+        "new_crops" : []
+        }
+
+    export.export_modality(job)
+
+    details = {"mode" : options["canvas_mode"], "megabytes" : round(os.path.getsize(canvas_path) / 2**20, 1)}
+
+    if not options["keep_outputs"]:
+        shutil.rmtree(output_folder, ignore_errors=True)
+
+    return details
+
+def bench_save(parameters, settings, options):
+    """
+    Times a complete save of N crops across every modality, as done by the save button.
+
+    Args:
+        parameters (dict): User parameters for the primary image.
+        settings (dict): Settings from the config file.
+        options (dict): The benchmark settings.
+
+    Returns:
+        dict: The crop, modality and worker counts, and the export summaries.
+    """
+
+    crops, crosshair = place_crops(parameters, settings, options["size"], options["crops"])
+
+    save_settings = copy.deepcopy(settings)
+    save_settings["export"]["incremental"] = False
+
+    output_folder = options["work_folder"] + "//save"
+
+    if os.path.isdir(output_folder):
+        shutil.rmtree(output_folder)
+
+    task = export.ExportTask(output_folder, crops, crosshair, parameters, save_settings)
+    task.run()
+
+    if task.error is not None:
+        raise task.error
+
+    details = {
+        "crops" : len(crops),
+        "modalities" : len(parameters["modalities"]),
+        "workers" : save_settings["export"]["workers"],
+        "canvas_mode" : save_settings["canvas"]["mode"],
+        "per_modality" : [{"modality" : result["modality"], "seconds" : round(result["seconds"], 3)} for result in task.results]
+        }
+
+    if not options["keep_outputs"]:
+        shutil.rmtree(output_folder, ignore_errors=True)
+
+    return details
+
+CASES = {"render" : bench_render, "extract" : bench_extract, "canvas" : bench_canvas, "save" : bench_save}
+
+def run_case(case, image_path, settings, options):
+    """
+    Runs a single benchmark case and measures its wall time and peak memory.
+
+    This is meant to be run in a fresh process, so the peak memory belongs to the case
+    alone. A failing case is reported rather than stopping the rest of the suite.
+
+    Args:
+        case (str): The name of the case, a key of CASES.
+        image_path (str): The path to the primary synthetic image.
+        settings (dict): Settings from the config file.
+        options (dict): The benchmark settings.
+
+    Returns:
+        dict: The case name, wall time, peak memory, case details and any error.
+    """
+
+    # the synthetic images are trusted, and can be larger than the usual limit
+    set_max_pixels(None)
+
+    result = {"case" : case, "seconds" : None, "peak_rss_mb" : None, "children_peak_rss_mb" : None,
+              "baseline_rss_mb" : peak_rss_mb(), "details" : None, "error" : None}
+
+    parameters = define_parameters(image_path, Eye.OD, settings)
+
+    start = time.perf_counter()
+
+    try:
+        result["details"] = CASES[case](parameters, settings, options)
+    except Exception as e:
+        result["error"] = repr(e)
+
+    result["seconds"] = round(time.perf_counter() - start, 3)
+    result["peak_rss_mb"] = peak_rss_mb()
+    result["children_peak_rss_mb"] = children_peak_rss_mb()
+
+    return result
+
+def run_suite(settings, options):
+    """
+    Generates every configured synthetic dataset and runs every benchmark case on it.
+
+    Each case runs in its own fresh worker process, so one case's memory use does not
+    carry over into the next and the peak memory of every case is measured separately.
+
+    Args:
+        settings (dict): Settings from the config file.
+        options (dict): The benchmark settings from the config file, with the work folder.
+
+    Returns:
+        dict: The report, with the environment, the datasets and every case result.
+    """
+
+    report = {
+        "version" : REPORT_VERSION,
+        "created" : time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "environment" : get_environment(),
+        "options" : options,
+        "datasets" : []
+        }
+
+    synthetic_folder = options["work_folder"] + "//synthetic"
+
+    for size in options["sizes"]:
+        for bits in options["bit_depths"]:
+            for layout in options["layouts"]:
+
+                name = synthetic.dataset_name(size, bits, layout)
+                print("Preparing " + name + "...")
+
+                start = time.perf_counter()
+                image_path = synthetic.create_dataset(synthetic_folder, size, bits, layout, options["chunk"])
+
+                dataset = {"name" : name, "size" : size, "bits" : bits, "layout" : layout,
+                           "prepare_seconds" : round(time.perf_counter() - start, 3), "results" : []}
+
+                for case in options["cases"]:
+
+                    # the canvas is benchmarked once for every canvas mode
+                    modes = options["canvas_modes"] if case == "canvas" else [None]
+
+                    for mode in modes:
+
+                        case_options = dict(options, size=size, canvas_mode=mode)
+
+                        print("Running " + case + (" (" + mode + ")" if mode else "") + " on " + name + "...")
+
+                        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+                            result = pool.submit(run_case, case, image_path, settings, case_options).result()
+
+                        if mode is not None:
+                            result["case"] = case + "_" + mode
+
+                        print(result["case"] + ": " + str(result["seconds"]) + " s, peak "
+                              + str(result["peak_rss_mb"]) + " MB" + (", failed: " + result["error"] if result["error"] else ""))
+
+                        dataset["results"].append(result)
+
+                report["datasets"].append(dataset)
+
+    return report
+
+def get_environment():
+    """
+    Describes the machine and versions a report was made with, so reports can be compared.
+
+    Returns:
+        dict: The platform, Python, Pillow and NumPy versions, CPU count and git commit.
+    """
+
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+
+    environment = {
+        "platform" : platform.platform(),
+        "python" : platform.python_version(),
+        "pillow" : PIL.__version__,
+        "numpy" : np.__version__,
+        "cpus" : os.cpu_count(),
+        "commit" : commit
+        }
+
+    return environment
+
+def write_report(report_path, report):
+    """
+    Writes a benchmark report as JSON.
+
+    Args:
+        report_path (str): The path of the report file.
+        report (dict): The report from run_suite.
+    """
+
+    with open(report_path, "w", encoding="utf-8") as report_file:
+        json.dump(report, report_file, indent=2)
+
+    print("Benchmark report saved to " + report_path)
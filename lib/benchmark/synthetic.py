@@ -0,0 +1,211 @@
+import os
+import math
+import struct
+import numpy as np
+
+from ..imaging.tiff_writer import SHORT, LONG, LONG8, write_ifd
+
+# modality names of the fake images, the first is the primary image crops are placed on
+MODALITIES = ("confocal", "split", "avg")
+
+# cone spacing in pixels at the fovea and at the edge of the montage
+CONE_SPACING = (5.0, 14.0)
+
+def dataset_name(size, bits, layout):
+    """
+    Returns the folder name of a synthetic dataset, which also identifies it in reports.
+
+    Args:
+        size (int): The edge length of the square images in pixels.
+        bits (int): The bit depth, 8 or 16.
+        layout (str): Either "strip" or "tiled".
+
+    Returns:
+        str: The dataset name, e.g. "10000px_8bit_strip".
+    """
+
+    return str(size) + "px_" + str(bits) + "bit_" + layout
+
+def create_dataset(folder, size, bits=8, layout="strip", chunk=256, modalities=MODALITIES, id_number="BENCH_0001", eye="OD"):
+    """
+    Writes a set of synthetic AOSLO-like modality images into their own folder.
+
+    The images are named <id>_<eye>_<modality>.tif like a real subject, so the
+    usual modality discovery finds every one of them. Images that already exist with the
+    right size are kept, as the largest ones take a while to generate.
+
+    Args:
+        folder (str): The folder to create the dataset folder in.
+        size (int): The edge length of the square images in pixels.
+        bits (int): The bit depth, 8 or 16.
+        layout (str): Either "strip" or "tiled".
+        chunk (int): The rows per strip, or the edge length of the tiles.
+        modalities (tuple of str): The modality names, the first is the primary image.
+        id_number (str): The subject ID at the start of the file names.
+        eye (str): The eye in the file names, "OD" or "OS".
+
+    Returns:
+        str: The path to the primary modality image.
+    """
+
+    dataset_folder = folder + "//" + dataset_name(size, bits, layout)
+    os.makedirs(dataset_folder, exist_ok=True)
+
+    paths = []
+
+    for i, modality in enumerate(modalities):
+
+        path = dataset_folder + "//" + id_number + "_" + eye + "_" + modality + ".tif"
+
+        if os.path.isfile(path) and os.path.getsize(path) >= size * size * bits // 8:
+            print(os.path.basename(path) + " already exists")
+        else:
+            write_synthetic_tiff(path, size, bits, layout, chunk, i)
+            print(os.path.basename(path) + " written")
+
+        paths.append(path)
+
+    return paths[0]
+
+def write_synthetic_tiff(path, size, bits=8, layout="strip", chunk=256, variant=0):
+    """
+    Streams a square, uncompressed greyscale tiff of a synthetic montage to disk.
+
+    The image is generated and written one band of rows at a time, so even 50k x 50k
+    images only need a band in memory. Classic tiff is written when the file fits in
+    4 GB, and BigTIFF otherwise.
+
+    Args:
+        path (str): The path of the tiff file to write.
+        size (int): The edge length of the image in pixels.
+        bits (int): The bit depth, 8 or 16.
+        layout (str): Either "strip" or "tiled".
+        chunk (int): The rows per strip, or the edge length of the tiles.
+        variant (int): Which modality to imitate, an index into MODALITIES.
+    """
+
+    if bits not in (8, 16):
+        raise ValueError("Synthetic images can only be 8 or 16 bit, not " + str(bits))
+    if layout not in ("strip", "tiled"):
+        raise ValueError("Synthetic images can only be strip or tiled, not " + str(layout))
+
+    pixel_bytes = bits // 8
+
+    if layout == "tiled":
+        tiles_across = math.ceil(size / chunk)
+        data_bytes = tiles_across * tiles_across * chunk * chunk * pixel_bytes
+        band_height = chunk
+    else:
+        data_bytes = size * size * pixel_bytes
+        band_height = chunk * max(256 // chunk, 1)
+
+    bigtiff = data_bytes + 2**20 >= 2**32
+
+    offsets = []
+    byte_counts = []
+
+    with open(path, "wb") as tiff:
+
+        # header, the offset of the directory is filled in once the pixels are written
+        if bigtiff:
+            tiff.write(b"II" + struct.pack("<HHHQ", 43, 8, 0, 0))
+        else:
+            tiff.write(b"II" + struct.pack("<HI", 42, 0))
+
+        for y0 in range(0, size, band_height):
+
+            band = synthetic_band(y0, min(band_height, size - y0), size, bits, variant)
+
+            if layout == "tiled":
+
+                # tiles are always full size, so the right and bottom edges are padded
+                padded = np.zeros((chunk, tiles_across * chunk), band.dtype)
+                padded[:band.shape[0], :size] = band
+                tiles = padded.reshape(chunk, tiles_across, chunk).swapaxes(0, 1)
+
+                for tile in tiles:
+                    offsets.append(tiff.tell())
+                    byte_counts.append(tiff.write(np.ascontiguousarray(tile).tobytes()))
+
+            else:
+
+                for s0 in range(0, band.shape[0], chunk):
+                    offsets.append(tiff.tell())
+                    byte_counts.append(tiff.write(band[s0:s0 + chunk].tobytes()))
+
+        entries = [
+            (256, LONG, [size]),
+            (257, LONG, [size]),
+            (258, SHORT, [bits]),
+            (259, SHORT, [1]),  # no compression
+            (262, SHORT, [1]),  # black is zero
+            (277, SHORT, [1]),
+            (284, SHORT, [1])
+            ]
+
+        chunk_type = LONG8 if bigtiff else LONG
+
+        if layout == "tiled":
+            entries += [(322, LONG, [chunk]), (323, LONG, [chunk]),
+                        (324, chunk_type, offsets), (325, chunk_type, byte_counts)]
+        else:
+            entries += [(273, chunk_type, offsets), (278, LONG, [chunk]), (279, chunk_type, byte_counts)]
+
+        ifd_offset = write_ifd(tiff, entries, bigtiff)
+
+        tiff.seek(8 if bigtiff else 4)
+        tiff.write(struct.pack("<Q" if bigtiff else "<I", ifd_offset))
+
+def synthetic_band(y0, height, size, bits=8, variant=0):
+    """
+    Generates a band of rows of a synthetic AOSLO montage.
+
+    The montage is a disc of cone-like spots on a dark background, with the spots getting
+    further apart away from the centre the way cones do, vignetting, noise, and black
+    outside the disc where a real montage has no data. Each modality variant shows the
+    same mosaic differently: bright spots (confocal), light/dark pairs (split detector) or
+    a softer mixture (avg). The pixels only depend on their position, so the same band is
+    generated every time.
+
+    Args:
+        y0 (int): The first row of the band.
+        height (int): The number of rows in the band.
+        size (int): The edge length of the whole image.
+        bits (int): The bit depth, 8 or 16.
+        variant (int): Which modality to imitate, an index into MODALITIES.
+
+    Returns:
+        numpy.ndarray: The band, as uint8 or little-endian uint16.
+    """
+
+    centre = size / 2
+    y = np.arange(y0, y0 + height, dtype=np.float32)[:, None] - centre
+    x = np.arange(size, dtype=np.float32)[None, :] - centre
+
+    radius = np.sqrt(x * x + y * y) / centre
+    spacing = CONE_SPACING[0] + (CONE_SPACING[1] - CONE_SPACING[0]) * np.minimum(radius, 1)
+
+    # three plane waves at 60 degrees make a triangular lattice of spots
+    a = (2 * np.pi / spacing) * x
+    b = (2 * np.pi / spacing) * (0.5 * x + 0.866 * y)
+
+    if variant % 3 == 0:
+        mosaic = (np.cos(a) + np.cos(b) + np.cos(a - b) + 1.5) / 4.5
+    elif variant % 3 == 1:
+        mosaic = 0.5 + 0.4 * np.sin(a) * np.cos(a - b)
+    else:
+        mosaic = 0.5 + 0.25 * (np.cos(a) + np.cos(b)) / 2
+
+    # noise from a hash of the pixel position, so it doesn't depend on the band height
+    rows = np.arange(y0, y0 + height, dtype=np.uint32)[:, None] * np.uint32(73856093)
+    columns = np.arange(size, dtype=np.uint32)[None, :] * np.uint32(19349663)
+    hashed = (rows ^ columns ^ np.uint32(variant * 83492791)) * np.uint32(2654435761)
+    noise = ((hashed >> np.uint32(16)).astype(np.float32) / 65535 - 0.5) * 0.25
+
+    image = (mosaic + noise) * (1 - 0.5 * radius * radius)
+    image[radius > 1] = 0
+
+    peak = 2**bits - 1
+    band = np.clip(image * peak, 0, peak)
+
+    return band.astype("<u2" if bits == 16 else np.uint8)
@@ -1,9 +1,9 @@
-import os
 import datetime
-import csv
 import tkinter as tk
 from tkinter import ttk
-from PIL import Image, ImageDraw, ImageFont
+from tkinter import messagebox as msg
+
+from lib.utils import export
 
 class ControlPanel(ttk.Frame):
     """
@@ -23,21 +23,23 @@ class ControlPanel(ttk.Frame):
         __init__: Initializes the control panel and its components.
         replace_centre: Removes and replaces the current centre of the image crop.
         toggle_rings: Toggles between showing rings or markers on the image.
+        place_grid: Places a grid of crops along the meridians set in the config file.
         enable_buttons: Enables various control buttons in the UI.
         add_crop: Adds a new crop to the list of crops.
+        add_crops: Adds several new crops to the end of the list of crops at once.
         delete_crop: Deletes a specific crop from the list.
         delete_all_crops: Clears all crops from the list.
         update_coords: Updates the coordinates of the crop locations.
-        create_results_folders: Creates folders for saving the results.
-        create_locations_csv: Generates a CSV file of crop locations.
-        create_canvas_tiff: Creates a TIFF image of the canvas.
-        create_crop_tiffs: Generates TIFF images for each crop.
-        create_lut: Creates a Look-Up Table (LUT) CSV file.
-        save: Saves all the crops and associated files.
-        save_close: Saves and closes the application.
-        close: Closes the application.
+        save: Starts saving all the crops and associated files in the background.
+        update_save_progress: Shows the progress of a background save, closing when it is done.
+        cancel_save: Cancels a background save, removing its partial output.
+        save_close: Saves in the background and closes the application once finished.
+        request_close: Closes the application when a window is closed, first waiting for or cancelling a running save.
+        close: Closes the application, once any background save has cleaned up.
     """
 
+    PROGRESS_POLL_MS = 100
+
     def __init__(self, master, cropper, parameters, settings):
 
         ttk.Frame.__init__(self, master=master)
@@ -48,6 +50,7 @@ class ControlPanel(ttk.Frame):
         for k, v in parameters.items():
             setattr(self, k, v)
             
+        self.parameters = parameters
         self.settings = settings
 
         panes = ttk.PanedWindow(self.master)
@@ -84,6 +87,8 @@ class ControlPanel(ttk.Frame):
         self.move_centre_button.grid(row=1, column=1, padx=2, pady=1, sticky="we")
         self.show_rings_toggle_button = tk.Button(self.controls_pane, text="Rings", command=self.toggle_rings, state=tk.DISABLED)
         self.show_rings_toggle_button.grid(row=1, column=2, padx=2, pady=1, sticky="we")
+        self.place_grid_button = tk.Button(self.controls_pane, text="Place grid", command=self.place_grid, state=tk.DISABLED)
+        self.place_grid_button.grid(row=1, column=3, padx=2, pady=1, sticky="we")
 
         self.crops_pane = ttk.Frame(panes)
         panes.add(self.crops_pane)
@@ -97,6 +102,7 @@ class ControlPanel(ttk.Frame):
         self.crop_list_label.grid(row=2, column=1, columnspan=4)
         self.crop_list = tk.Listbox(self.crops_pane, width=48, height=25)
         self.crop_list.grid(row=3, column=1, columnspan=5)
+        self.crop_entries = []  # the text of each listbox row, to only rewrite rows that change
 
         self.save_separator = ttk.Separator(self.crops_pane)
         self.save_separator.grid(row=4, columnspan=6, sticky="we", pady=4)
@@ -109,8 +115,23 @@ class ControlPanel(ttk.Frame):
         self.delete_button.grid(row=1, column=1, padx = 10, pady = 3)
         self.save_button = tk.Button(self.save_pane, text="Save", command=self.save_close)
         self.save_button.grid(row=1, column=2, padx = 10, pady = 3)
+        self.cancel_button = tk.Button(self.save_pane, text="Cancel", command=self.cancel_save, state=tk.DISABLED)
+        self.cancel_button.grid(row=1, column=3, padx = 10, pady = 3)
+
+        # progress of a save running in the background
+        self.save_progress = ttk.Progressbar(self.save_pane, orient="horizontal", mode="determinate")
+        self.save_progress.grid(row=2, column=1, columnspan=3, padx = 10, pady = 3, sticky="we")
+        self.save_status = tk.Label(self.save_pane, text="")
+        self.save_status.grid(row=3, column=1, columnspan=3, sticky="we")
 
-        self.font = ImageFont.truetype("arial.ttf", self.settings["text"]["font_size"])
+        self.save_task = None
+        self.close_after_save = False
+        self.save_edits = 0  # edit count of the crops being saved
+        self.close_when_done = False  # close once the save ends, whether it finished, failed or was cancelled
+
+        # closing either window mid-save must not kill the export thread before it cleans up
+        self.master.protocol("WM_DELETE_WINDOW", self.request_close)
+        self.cropper.master.protocol("WM_DELETE_WINDOW", self.request_close)
 
     def replace_centre(self):
 
@@ -118,6 +139,7 @@ class ControlPanel(ttk.Frame):
 
         self.move_centre_button.config(state=tk.DISABLED)
         self.show_rings_toggle_button.config(state=tk.DISABLED)
+        self.place_grid_button.config(state=tk.DISABLED)
 
     def toggle_rings(self):
 
@@ -128,145 +150,183 @@ class ControlPanel(ttk.Frame):
         elif show_rings is False:
             self.show_rings_toggle_button.config(text="Rings")
 
+    def place_grid(self):
+
+        try:
+            self.cropper.place_grid(self.settings["grid"])
+        except ValueError as e:
+            msg.showerror("Crop Grid", str(e))
+
     def enable_buttons(self):
 
         self.move_centre_button.config(state=tk.NORMAL, cursor="hand2")
         self.show_rings_toggle_button.config(state=tk.NORMAL, cursor="hand2")
+        self.place_grid_button.config(state=tk.NORMAL, cursor="hand2")
 
     def add_crop(self, id, location_tuple):
 
         location_string = ", ".join(map(str, location_tuple))
         entry = str(id) + ": " + location_string
         self.crop_list.insert(id, entry)
+        self.crop_entries.insert(min(id, len(self.crop_entries)), entry)
+
+    def add_crops(self, IDs, location_tuples):
+
+        entries = [str(id) + ": " + ", ".join(map(str, location_tuple)) for id, location_tuple in zip(IDs, location_tuples)]
+
+        # a single insert for every row, rather than one per crop
+        if entries:
+            self.crop_list.insert(tk.END, *entries)
+            self.crop_entries.extend(entries)
 
     def delete_crop(self, i):
 
+        # a crop that was never listed has no row to remove
+        if i >= len(self.crop_entries):
+            return
+
         self.crop_list.delete(i)
+        self.crop_entries.pop(i)
 
     def delete_all_crops(self):
 
         self.crop_list.delete(0, tk.END)
+        self.crop_entries = []
 
     def update_coords(self, new_location):
 
-        number_of_crops = self.crop_list.size()
-
-        self.crop_list.delete(0, tk.END)
+        number_of_crops = len(new_location)
 
         for x in range(0, number_of_crops):
 
             id = self.cropper.get_crop_IDs(x)
             location_string = ", ".join(map(str, new_location[x]))
             entry = str(id) + ": " + location_string
-            self.crop_list.insert(x, entry)
 
-    def create_results_folders(self):
+            # rows missing from the list are added at the end
+            if x == len(self.crop_entries):
+                self.crop_list.insert(tk.END, entry)
+                self.crop_entries.append(entry)
 
-        # create main output folder
-        self.output_folder = self.folder + "//" + "ao_crops_" + datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-        os.makedirs(self.output_folder)
+            # only rewrite the rows whose location has changed
+            elif entry != self.crop_entries[x]:
+                self.crop_list.delete(x)
+                self.crop_list.insert(x, entry)
+                self.crop_entries[x] = entry
 
-        # folder to store the crop tifs
-        self.crops_folder = self.output_folder + "//Crops"
-        os.makedirs(self.crops_folder)
+    def save(self):
 
-        # folder to store the canvases displaying the crop locations
-        self.canvas_folder = self.output_folder + "//Canvases"
-        os.makedirs(self.canvas_folder)
+        if self.save_task is not None and self.save_task.is_running():
+            return
 
-        # folders for each modality within the crops folder
-        self.crop_modality_folders = {}
+        # the modalities are still being found in the background
+        if self.parameters["modalities"] is None:
+            self.save_status.config(text="Still loading, please save again in a moment")
+            return
 
-        for modality in self.modalities:
-            modality_folder = self.crops_folder + "//" + modality
-            os.makedirs(modality_folder)
-            self.crop_modality_folders[modality] = modality_folder
+        # incremental saves keep updating the same folder, otherwise every save gets a new one
+        if self.settings["export"]["incremental"]:
+            output_folder = self.folder + "//" + self.settings["export"]["incremental_folder"]
+        else:
+            output_folder = self.folder + "//" + "ao_crops_" + datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
 
-    def create_locations_csv(self):
+        # the export works on a copy of the crops, in a background thread and worker processes
+        self.save_task = export.ExportTask(output_folder,
+                                           self.cropper.get_crops(),
+                                           self.cropper.get_foveal_centre(),
+                                           self.parameters,
+                                           self.settings)
+        self.save_task.start()
 
-        csv_path = self.output_folder + "//" + "crop_location_data.csv"
-        header = [("Crop Number", "CoordV (°)", "MeridianV", "CoordH (°)", "MeridianH", "Distance (°)", "Distance (um)", "Centre Pixel (x)", "Centre Pixel (y)")]
-        location_data = [crop.get_location_data() for crop in self.final_crops]
+        # edits made while saving aren't in the export, so they must stay in the journal
+        self.save_edits = self.cropper.get_edit_count()
 
-        with open(csv_path, "w", newline='') as csvFile:
-            writer = csv.writer(csvFile)
-            writer.writerow(header)
-            writer.writerows(location_data)
+        self.save_button.config(state=tk.DISABLED)
+        self.cancel_button.config(state=tk.NORMAL)
+        self.save_progress.config(maximum=max(self.save_task.crops_total, 1), value=0)
 
-        csvFile.close()
-        print("Crop location data CSV saved")
+        self.master.after(self.PROGRESS_POLL_MS, self.update_save_progress)
 
-    def create_canvas_tiff(self, modality_path):
+    def update_save_progress(self):
 
-        crosshair = self.cropper.get_foveal_centre()
+        progress = self.save_task.get_progress()
 
-        canvas_grey = Image.open(modality_path)
-        canvas_colour = Image.new("RGBA", canvas_grey.size)
-        canvas_colour.paste(canvas_grey)
-        draw_canvas = ImageDraw.Draw(canvas_colour)
+        self.save_progress.config(maximum=max(progress["crops_total"], 1), value=progress["crops_done"])
+        self.save_status.config(text="Crops " + str(progress["crops_done"]) + "/" + str(progress["crops_total"])
+                                     + ", modalities " + str(progress["modalities_done"]) + "/" + str(progress["modalities_total"])
+                                     + ", " + str(round(progress["crops_per_second"], 1)) + " crops/s")
 
-        draw_canvas = crosshair.stamp(draw_canvas)
+        if self.save_task.is_running():
+            self.master.after(self.PROGRESS_POLL_MS, self.update_save_progress)
+            return
 
-        return canvas_colour, draw_canvas
+        self.cancel_button.config(state=tk.DISABLED)
 
-    def create_crop_tiffs(self, modality, modality_path, canvas):
+        saved = not self.save_task.cancelled and self.save_task.error is None
+        changed = self.cropper.get_edit_count() != self.save_edits
 
-        for crop in self.final_crops:
+        if self.close_when_done:
+            if saved and not changed:
+                self.cropper.clear_journal()
+            self.close()
+            return
 
-            # create tifs of every crop location in the current modality
-            (image, filename) = crop.make_tiff(modality, modality_path)
-            image.save(self.crops_folder + "/" + modality + "/" + filename)
-            print(filename + " saved")
+        if not saved:
+            self.save_status.config(text="Saving cancelled" if self.save_task.cancelled else "Saving failed")
+            self.save_button.config(state=tk.NORMAL)
+            self.close_after_save = False
+        elif changed:
+            # the journal still holds the newer crops, which need saving again before closing
+            self.save_status.config(text="Crops changed while saving, please save again")
+            self.save_button.config(state=tk.NORMAL)
+            self.close_after_save = False
+        else:
+            # the session is saved, so there is nothing left to resume from the journal
+            self.cropper.clear_journal()
 
-            # stamp each crop location on to the draw object canvas for this modality
-            canvas = crop.stamp(canvas, self.font)
+            if self.close_after_save:
+                self.close()
 
-        return canvas
+    def cancel_save(self):
 
-    def create_lut(self):
+        if self.save_task is not None:
+            self.save_task.cancel()
+            self.save_status.config(text="Cancelling...")
 
-        lut_data = (self.id_number, self.mpp)
-        lut_path = self.output_folder + "//" + "LUT.csv"
-
-        with open(lut_path, "w") as csvFile:
-            writer = csv.writer(csvFile)
-            writer.writerow(lut_data)
-
-        csvFile.close()
-        print("LUT.csv saved")
-
-    def save(self) :
-
-        print("Saving crops as tiffs...")
-
-        self.create_results_folders()
-
-        self.final_crops = self.cropper.get_crops()
+    def save_close(self):
 
-        self.create_locations_csv()
+        self.close_after_save = True
+        self.save()
 
-        # create crops/canvases for every modality found in the original folder
-        for modality in self.modalities:
+    def request_close(self):
 
-            modality_path = self.folder + "/" + self.base_name + modality + ".tif"
-            canvas_tiff, canvas_draw = self.create_canvas_tiff(modality_path)
-            self.create_crop_tiffs(modality, modality_path, canvas_draw)
+        if self.close_when_done:
+            return
 
-            canvas_tiff_name = self.id_number + "_" + self.eye.name + "_crop_locations_" + modality + ".tif"
-            canvas_tiff.save(self.canvas_folder+ "//" + canvas_tiff_name)
-            print(canvas_tiff_name + " saved")
+        if self.save_task is None or not self.save_task.is_running():
+            self.close()
+            return
 
-        self.create_lut()
+        wait = msg.askyesnocancel("Saving In Progress",
+                                  "Crops are still being saved. Wait for the save to finish before closing?\n\n"
+                                  "Yes waits for the save, No cancels it, Cancel keeps the window open.")
 
-        print("Saving complete!")
+        if wait is None:
+            return
 
-    def save_close(self):
+        # the progress poll closes the application once the export has finished or cleaned up
+        if not wait:
+            self.save_task.cancel()
 
-        self.save()
-        self.close()
+        self.close_when_done = True
+        self.save_status.config(text="Closing once saving is done..." if wait else "Cancelling, then closing...")
 
     def close(self):
 
+        # the export thread is a daemon, so it has to finish its cleanup before the gui goes
+        if self.save_task is not None:
+            self.save_task.join()
+
         self.cropper.master.destroy()
 
 
@@ -1,3 +1,6 @@
+import time
+import bisect
+import threading
 import tkinter as tk
 from tkinter import ttk
 from tkinter import messagebox as msg
@@ -5,8 +8,20 @@ from PIL import Image, ImageTk
 
 from lib.gui.auto_scrollbar import AutoScrollbar
 from lib.gui.control_panel import ControlPanel
+from lib.gui.render_scheduler import RenderScheduler
+from lib.gui.overlay import CropOverlay
+from lib.gui.latency_overlay import LatencyOverlay
 from lib.assets.crosshair import Crosshair
 from lib.assets.crop_box import CropBox
+from lib.assets.crop_index import CropIndex
+from lib.assets.crop_store import CropStore
+from lib.assets import crop_grid
+from lib.imaging.pyramid import ImagePyramid
+from lib.imaging.thumbnail import read_thumbnail, read_placeholder
+from lib.imaging.disk_cache import PyramidCache
+from lib.imaging.tiles import TileCache, TiledRenderer
+from lib.utils import journal
+from lib.utils import profiling
 from lib.utils.util_func import *
 
 class Cropper(ttk.Frame):
@@ -27,28 +42,54 @@ class Cropper(ttk.Frame):
     Methods:
         __init__: Initializes the Cropper interface with image and parameters.
         open_control_panel: Opens the control panel for additional parameters and controls.
+        open_disk_cache: Opens the on-disk cache of thumbnails and pyramid levels, if enabled.
+        get_thumbnail: Returns a thumbnail of the image, from the disk cache if possible.
+        start_loading: Starts loading the full image and finding the modalities in the background.
+        load: Loads the full image and its pyramid and finds the modalities, off the gui thread.
+        update_disk_cache: Stores the thumbnail and pyramid levels of the image in the disk cache.
+        check_loading: Switches the view to the full image once the background loading is done.
+        set_modalities: Sets the modalities found in the background, reporting any that don't match the image.
+        set_pyramid: Switches the view to a new image pyramid.
+        open_journal: Opens the session journal, offering to resume an unsaved session.
+        restore_session: Rebuilds the centre and crops replayed from the session journal.
+        record: Appends an edit to the session journal.
+        get_edit_count: Returns the number of edits made so far, to tell if the crops changed during a save.
+        clear_journal: Empties the session journal once the session has been saved.
         scroll_y: Vertical scrolling action for the canvas.
         scroll_x: Horizontal scrolling action for the canvas.
         move_from: Marks the start position for canvas dragging.
         move_to: Drags the canvas to a new position.
         wheel: Handles zooming in and out of the image with mouse wheel.
+        interact: Redraws a moving view as a quick preview and cancels any refinement.
+        cancel_refine: Cancels a pending or in progress full quality refinement.
+        refine: Renders the full quality tiles of a still view a few at a time.
         show_image: Displays the image on the canvas, adjusting for zoom and scroll.
         dbutton_click: Handles double-click events for setting crops or foveal center.
         toggle_rings: Toggles the visibility of rings or degree markers on the canvas.
         new_centre: Sets a new foveal center on the canvas.
         delete_centre: Removes the foveal center from the canvas.
         new_crop: Adds a new crop box at the clicked location.
+        place_grid: Places crops along meridians at fixed eccentricities from the foveal centre.
+        add_crops: Adds crop boxes at several locations in one bulk operation.
         advance_crop_iterator: Increments the crop box ID iterator.
         delete_crop: Deletes a specified crop box.
         delete_all: Deletes all crop boxes.
+        get_viewport: Returns the visible area in canvas coordinates.
         get_image_corners: Returns the corner coordinates of the image.
         get_image_scale: Returns the current scale of the image.
+        get_tile_cache_stats: Returns the hit, miss and eviction counters of the tile cache.
+        get_render_stats: Returns the redraw request, frame and drop counters.
         get_crops: Returns the list of current crop boxes.
         get_crop_IDs: Returns the ID of a specified crop box.
         get_foveal_centre: Returns the current foveal center.
         get_master: Returns the master widget.
     """
 
+    LOAD_POLL_MS = 100
+
+    # longest side of the blank image shown until an image without a thumbnail has loaded
+    PLACEHOLDER_SIZE = 64
+
     def __init__(self, master, image_path, parameters, settings):
 
         ttk.Frame.__init__(self, master=master)
@@ -86,8 +127,13 @@ class Cropper(ttk.Frame):
         self.master.rowconfigure(0, weight=1)
         self.master.columnconfigure(0, weight=1)
 
+        # Redraws requested by events are merged into at most one per frame
+        self.render = RenderScheduler(self.canvas, self.show_image,
+                                      self.settings["viewer"]["frame_ms"],
+                                      self.settings["viewer"]["latency_budget_ms"])
+
         # Bind events to the Canvas
-        self.canvas.bind("<Configure>", self.show_image)  # canvas is resized
+        self.canvas.bind("<Configure>", self.render.request)  # canvas is resized
         self.canvas.bind("<ButtonPress-1>", self.move_from)
         self.canvas.bind("<B1-Motion>",     self.move_to)
         self.canvas.bind("<MouseWheel>", self.wheel)  # with Windows and MacOS, but not Linux
@@ -96,14 +142,39 @@ class Cropper(ttk.Frame):
         self.canvas.bind("<Double-Button-1>", self.dbutton_click)
         self.canvas.tag_bind("removable", "<ButtonPress-3>", self.delete_crop)
 
-        self.image = Image.open(self.image_path)  # open image
-        self.width, self.height = self.image.size
+        # show a quick thumbnail straight away, while the full image loads in the background
+        self.disk_cache = self.open_disk_cache()
+        thumbnail, cached = None, False
+
+        if self.settings["viewer"]["thumbnail_size"]:
+            thumbnail, size, thumbnail_scale, cached = self.get_thumbnail()
+
+        # only a newly sampled thumbnail needs to go into the disk cache
+        new_thumbnail = (thumbnail, size, thumbnail_scale) if thumbnail is not None and not cached else None
+
+        # without one, e.g. for a compressed tiff, the view is blank until the image has been decoded
+        self.placeholder = thumbnail is None
+
+        if self.placeholder:
+            thumbnail, size, thumbnail_scale = read_placeholder(self.image_path, self.PLACEHOLDER_SIZE)
+
+        self.image = None
+        self.width, self.height = size
+        self.pyramid = ImagePyramid(thumbnail, self.settings["viewer"]["pyramid_min_size"], size, thumbnail_scale)
+
+        self.tile_cache = TileCache(self.settings["viewer"]["tile_cache_mb"] * 2**20)
+        self.renderer = TiledRenderer(self.pyramid, self.tile_cache,
+                                      self.settings["viewer"]["tile_size"],
+                                      self.settings["viewer"]["preview_coarser_levels"])
+        self.preview = False  # draw cheap preview tiles while the view is moving
+        self.refine_job = None
         self.imscale = 1.0  # scale for the canvas image
         self.delta = 2  # zoom magnitude
         self.crop_box_colour = self.settings["crop_box"]["colour"]
 
         # Put image into container rectangle and use it to set proper coordinates to the image
         self.container = self.canvas.create_rectangle(0, 0, self.width, self.height, width=0)
+        self.imageid = None  # the background image item, reused for every redraw
 
         # set up some preliminary booleans and empty lists
         self.centre_is_placed = False
@@ -112,24 +183,289 @@ class Cropper(ttk.Frame):
         self.foveal_centre = None
         self.crop_IDs = []
         self.crops = []
+        self.crop_index = CropIndex(self.crop_size_μm / self.mpp)  # grid of crops in image coordinates
+        self.crop_store = CropStore(self.ppd, self.eye)  # crop locations, relocated all at once
+        self.overlay = CropOverlay(self.canvas, self.crop_index, self.crop_box_colour)  # only visible crops are drawn
+
+        # frame time and tile cache panel in the corner of the view, if switched on
+        self.latency_overlay = LatencyOverlay(self.canvas) if self.settings["profiling"]["overlay"] else None
 
         self.show_image()
         self.open_control_panel()
 
+        self.loader = None
+        self.load_result = None
+        self.partial_pyramid = None  # cached pyramid levels, shown until the full image is loaded
+        self.modality_result = None  # modalities and their problems, reported before the full image is loaded
+
+        self.start_loading(new_thumbnail)
+
+        # record every edit, and offer to resume a session that was never saved
+        self.journal = None
+        self.edits = 0  # counted even without a journal
+
+        if self.settings["session"]["journal"]:
+            self.open_journal()
+
     def open_control_panel(self):
 
         self.control_panel_master = tk.Toplevel(self.master)
         self.control_panel = ControlPanel(self.control_panel_master, self, self.parameters, self.settings)
 
+    def open_disk_cache(self):
+
+        if not self.settings["cache"]["enabled"]:
+            return None
+
+        try:
+            return PyramidCache(self.settings["cache"]["folder"], self.settings["cache"]["max_mb"] * 2**20)
+        except OSError as e:
+            print("Disk cache disabled: " + str(e))
+            return None
+
+    def get_thumbnail(self):
+
+        # a thumbnail from an earlier session is reused, otherwise one is sampled from the file
+        if self.disk_cache is not None:
+
+            try:
+                thumbnail, size, scale = self.disk_cache.get_thumbnail(self.image_path)
+            except OSError:
+                thumbnail = None
+
+            if thumbnail is not None:
+                return thumbnail, size, scale, True
+
+        thumbnail, size, scale = read_thumbnail(self.image_path, self.settings["viewer"]["thumbnail_size"])
+
+        return thumbnail, size, scale, False
+
+    def start_loading(self, new_thumbnail=None):
+
+        self.loader = threading.Thread(target=self.load, args=(new_thumbnail,), daemon=True)
+        self.loader.start()
+
+        self.canvas.after(self.LOAD_POLL_MS, self.check_loading)
+
+    def load(self, new_thumbnail=None):
+
+        # this runs in the background thread, so it must not touch the gui
+        result = {"image" : None, "pyramid" : None, "error" : None}
+        min_size = self.settings["viewer"]["pyramid_min_size"]
+        levels = None
+
+        try:
+
+            if self.parameters["modalities"] is None:
+
+                with profiling.span("find_modalities"):
+                    modalities, _, _, problems = get_modalities(self.filename, self.folder,
+                                                                self.settings["modalities"]["workers"],
+                                                                self.settings["modalities"]["index_cache"])
+
+                self.modality_result = (modalities, problems)
+
+            if self.disk_cache is not None:
+                with profiling.span("read_cached_levels"):
+                    levels = self.disk_cache.get_levels(self.image_path, min_size)
+
+            # cached levels can be shown while the full resolution image is still loading
+            if levels:
+                self.partial_pyramid = ImagePyramid(levels[0], min_size, (self.width, self.height),
+                                                    levels[0].width / self.width, levels[1:])
+
+            with profiling.span("load_image"):
+                image = Image.open(self.image_path)
+                image.load()
+
+            with profiling.span("build_pyramid"):
+                result["pyramid"] = ImagePyramid(image, min_size, levels=levels)
+
+            # the coarsest level stands in for the thumbnail that couldn't be sampled, next time
+            if self.placeholder and new_thumbnail is None:
+                coarsest = result["pyramid"].levels[-1]
+                new_thumbnail = (coarsest, (self.width, self.height), coarsest.width / self.width)
+
+            result["image"] = image
+
+        except Exception as e:
+            result["error"] = e
+
+        self.load_result = result
+
+        # the cache is only written once the gui has everything it needs
+        if self.disk_cache is not None:
+            self.update_disk_cache(new_thumbnail, result["pyramid"] if levels is None else None)
+
+    def update_disk_cache(self, new_thumbnail, pyramid):
+
+        try:
+
+            if new_thumbnail is not None:
+                self.disk_cache.put_thumbnail(self.image_path, *new_thumbnail)
+
+            if pyramid is not None:
+                with profiling.span("write_cached_levels"):
+                    self.disk_cache.put_levels(self.image_path, pyramid.levels[1:], pyramid.min_size)
+
+        except OSError as e:
+            print("Warning: The image could not be added to the disk cache - " + str(e))
+
+    def check_loading(self):
+
+        if self.modality_result is not None:
+            self.set_modalities(*self.modality_result)
+            self.modality_result = None
+
+        if self.load_result is None:
+
+            if self.partial_pyramid is not None:
+                self.set_pyramid(self.partial_pyramid)
+                self.partial_pyramid = None
+
+            self.canvas.after(self.LOAD_POLL_MS, self.check_loading)
+            return
+
+        result = self.load_result
+        self.partial_pyramid = None
+
+        # without the other modalities, at least the image being cropped can be saved
+        if self.parameters["modalities"] is None:
+            self.parameters["modalities"] = [self.primary_modality]
+
+        self.modalities = self.parameters["modalities"]
+
+        if result["error"] is not None:
+            print("Error: The full resolution image could not be loaded - " + str(result["error"]))
+            msg.showerror("Loading Failed", "The full resolution image could not be loaded, "
+                                            + ("so it can't be shown." if self.placeholder else "only a preview will be shown.")
+                                            + "\n\n" + str(result["error"]))
+
+        if result["pyramid"] is not None:
+
+            self.image = result["image"]
+            self.set_pyramid(result["pyramid"])
+
+            print("Full resolution image loaded.")
+
+    def set_modalities(self, modalities, problems):
+
+        self.parameters["modalities"] = modalities
+        self.modalities = modalities
+
+        print("Modalities found: " + ", ".join(modalities))
+
+        # mismatched modalities are reported now, rather than when the crops are saved
+        if problems:
+
+            for problem in problems:
+                print("Warning: Modality " + problem)
+
+            msg.showwarning("Modality Mismatch", "Some modalities don't match " + self.primary_modality
+                            + " and differently sized ones won't be cropped:\n\n" + "\n".join(problems))
+
+    def set_pyramid(self, pyramid):
+
+        # tiles drawn from the old pyramid are replaced by ones from the new one
+        self.pyramid = pyramid
+        self.renderer.pyramid = pyramid
+        self.tile_cache.clear()
+        self.render.request()
+
+    def open_journal(self):
+
+        try:
+            session_journal = journal.SessionJournal(journal.journal_path(self.parameters),
+                                                     self.settings["session"]["sync"])
+        except (OSError, ValueError) as e:
+            print("Session journal disabled: " + str(e))
+            return
+
+        state = session_journal.replay()
+
+        if state["centre"] is not None or state["crops"]:
+
+            resume = msg.askquestion("Resume Session",
+                                     "An unsaved session with " + str(len(state["crops"])) + " crops was found for this image. Resume it?")
+
+            if resume == "yes":
+                self.restore_session(state)
+                session_journal.compact(state)
+            else:
+                session_journal.reset()
+
+        self.journal = session_journal
+
+    def restore_session(self, state):
+
+        # crops and centre are rebuilt at a scale of 1 with no offset, then projected on the next redraw
+        if state["centre"] is not None:
+
+            self.foveal_centre = Crosshair(coordinates=state["centre"],
+                                           top_left=(0, 0),
+                                           scale=1.0,
+                                           parameters=self.parameters,
+                                           settings=self.settings["crosshair"])
+
+            self.centre_abs = self.foveal_centre.get_abs_location()
+            self.centre_is_placed = True
+            self.control_panel.enable_buttons()
+
+        for ID, location in state["crops"].items():
+
+            crop = CropBox(ID=ID,
+                           coordinates=location,
+                           top_left=(0, 0),
+                           scale=1.0,
+                           parameters=self.parameters,
+                           settings=self.settings["crop_box"])
+
+            self.crops.append(crop)
+            self.crop_IDs.append(ID)
+            self.crop_index.add(crop)
+            self.crop_store.add(crop)
+
+        self.crop_iterator = state["next_ID"]
+
+        # crops can only be located once there is a centre to locate them from, until then they are listed without
+        if self.centre_is_placed:
+
+            self.crop_store.relocate(self.centre_abs)
+
+            self.control_panel.update_coords(self.crop_store.get_round_coordinates(1))
+
+        else:
+            self.control_panel.add_crops(self.crop_IDs, [("no centre",)] * len(self.crop_IDs))
+
+        self.render.request()
+
+        print("Session restored with " + str(len(self.crops)) + " crops.")
+
+    def record(self, event, ID=0, location=(0.0, 0.0)):
+
+        self.edits += 1
+
+        if self.journal is not None:
+            self.journal.record(event, ID, *location)
+
+    def get_edit_count(self):
+
+        return self.edits
+
+    def clear_journal(self):
+
+        if self.journal is not None:
+            self.journal.reset()
+
     def scroll_y(self, *args, **kwargs):
 
         self.canvas.yview(*args, **kwargs)  # scroll vertically
-        self.show_image()  # redraw the image
+        self.interact()  # redraw the image
 
     def scroll_x(self, *args, **kwargs):
 
         self.canvas.xview(*args, **kwargs)  # scroll horizontally
-        self.show_image()  # redraw the image
+        self.interact()  # redraw the image
 
     def move_from(self, event):
 
@@ -138,7 +474,7 @@ class Cropper(ttk.Frame):
     def move_to(self, event):
 
         self.canvas.scan_dragto(event.x, event.y, gain=1)
-        self.show_image()  # redraw the image
+        self.interact()  # redraw the image
 
     def wheel(self, event):
 
@@ -162,26 +498,48 @@ class Cropper(ttk.Frame):
             self.imscale *= self.delta
             scale        *= self.delta
 
-        # hide all marked boxes if zoomed far away
-        if self.imscale <= 0.2:
-            self.canvas.itemconfigure("box", outline="")
-        else:
-            self.canvas.itemconfigure("box", outline=self.crop_box_colour)
+        # rescale the image area, crops and crosshair are projected again on the next redraw
+        with profiling.span("wheel", scale=self.imscale):
+            self.canvas.scale(self.container, x, y, scale, scale)
+        self.interact()
 
-        self.canvas.scale("all", x, y, scale, scale)  # rescale all canvas objects
-        self.show_image()
+    def interact(self):
+
+        # a moving view is drawn as a quick preview, and any refinement is abandoned
+        self.cancel_refine()
+        self.preview = True
+        self.render.request()
+
+    def cancel_refine(self):
+
+        if self.refine_job is not None:
+            self.canvas.after_cancel(self.refine_job)
+            self.refine_job = None
+
+    def refine(self):
+
+        # fill in a few full quality tiles at a time so new events can still get through
+        with profiling.span("refine", scale=self.imscale):
+            done = self.renderer.refine(self.imscale, self.visible_region,
+                                        self.settings["viewer"]["refine_tiles_per_step"])
+
+        if done:
+            self.refine_job = None
+            self.preview = False
+            self.render.request()
+        else:
+            self.refine_job = self.canvas.after(1, self.refine)
 
     def show_image(self, event=None, *kwargs):
 
+        start = time.perf_counter()
+
         bbox1 = self.canvas.bbox(self.container)  # get image area
 
         # Remove 1 pixel shift at the sides of the bbox1
         bbox1 = (bbox1[0] + 1, bbox1[1] + 1, bbox1[2] - 1, bbox1[3] - 1)
         
-        bbox2 = (self.canvas.canvasx(0),  # get visible area of the canvas
-                 self.canvas.canvasy(0),
-                 self.canvas.canvasx(self.canvas.winfo_width()),
-                 self.canvas.canvasy(self.canvas.winfo_height()))
+        bbox2 = self.get_viewport()  # get visible area of the canvas
         
         bbox = [min(bbox1[0], bbox2[0]), min(bbox1[1], bbox2[1]),  # get scroll region box
                 max(bbox1[2], bbox2[2]), max(bbox1[3], bbox2[3])]
@@ -203,20 +561,50 @@ class Cropper(ttk.Frame):
         
         if int(x2 - x1) > 0 and int(y2 - y1) > 0:  # show image if it in the visible area
             
-            x = min(int(x2 / self.imscale), self.width)   # sometimes it is larger on 1 pixel...
-            y = min(int(y2 / self.imscale), self.height)  # ...and sometimes not
-            
-            image = self.image.crop((int(x1 / self.imscale), int(y1 / self.imscale), x, y))
-            imagetk = ImageTk.PhotoImage(image.resize((int(x2 - x1), int(y2 - y1))))
-            imageid = self.canvas.create_image(max(bbox2[0], bbox1[0]), max(bbox2[1], bbox1[1]),
-                                               anchor="nw", image=imagetk)
+            # paste the view together from cached tiles, only rendering newly exposed ones
+            self.visible_region = (x1, y1, x2, y2)
+
+            with profiling.span("render", scale=self.imscale, preview=self.preview):
+                image = self.renderer.render(self.imscale, self.visible_region, self.preview)
+
+            with profiling.span("photoimage"):
+                imagetk = ImageTk.PhotoImage(image)
+
+            # move and update the one background image item rather than creating a new one
+            if self.imageid is None:
+                self.imageid = self.canvas.create_image(bbox1[0] + int(x1), bbox1[1] + int(y1),
+                                                        anchor="nw", image=imagetk)
+                self.canvas.lower(self.imageid)  # set image into background
+            else:
+                self.canvas.coords(self.imageid, bbox1[0] + int(x1), bbox1[1] + int(y1))
+                self.canvas.itemconfigure(self.imageid, image=imagetk)
             
-            self.canvas.lower(imageid)  # set image into background
             self.canvas.imagetk = imagetk  # keep an extra reference to prevent garbage-collection
             self.image_corners = bbox1
 
+            # once the view has been still for a moment, refine any preview tiles
+            if not self.renderer.complete:
+                self.cancel_refine()
+                self.refine_job = self.canvas.after(self.settings["viewer"]["refine_delay_ms"], self.refine)
+
+        # draw the crops and crosshair inside the visible area, and remove the rest
+        with profiling.span("overlay", crops=len(self.overlay.drawn)):
+
+            self.overlay.update(bbox1[0:2], self.imscale, bbox2)
+
+            if self.centre_is_placed:
+                self.foveal_centre.update(self.canvas, self.show_rings, bbox1[0:2], self.imscale, bbox2)
+
+        if self.latency_overlay is not None:
+            self.latency_overlay.update(bbox2, self.get_render_stats(), self.get_tile_cache_stats(),
+                                        self.preview, profiling.PROFILER.get_last_ms("render"))
+
+        profiling.PROFILER.add("show_image", start, time.perf_counter(), {"scale" : self.imscale})
+
     def dbutton_click(self, event):
 
+        self.render.flush()  # make sure the image corners are up to date
+
         dclickxy = [self.canvas.canvasx(event.x), self.canvas.canvasy(event.y)]
 
         if self.centre_is_placed:
@@ -225,25 +613,23 @@ class Cropper(ttk.Frame):
         else:
             self.new_centre(dclickxy)
 
-        self.show_image("dbclick")
+        self.render.request()
 
     def toggle_rings(self):
 
-        self.show_rings = not self.show_rings
+        self.render.flush()  # make sure the image corners are up to date
 
-        if self.show_rings is True:
-            self.canvas.delete("markers")
-            
-        elif self.show_rings is False:
-            self.canvas.delete("rings")
+        self.show_rings = not self.show_rings
 
-        self.foveal_centre.update_scale(self.imscale)
-        self.foveal_centre.add_degree_markers(self.canvas, self.show_rings, self.image_corners[0:2])
+        # markers or rings are only generated for the visible area
+        self.foveal_centre.update(self.canvas, self.show_rings, self.image_corners[0:2], self.imscale, self.get_viewport())
 
         return self.show_rings
 
     def new_centre(self, location):
 
+        start = time.perf_counter()
+
         # create new crosshair instance on placement of new centre
         self.foveal_centre = Crosshair(coordinates=location,
                                        top_left=self.image_corners[0:2],
@@ -252,24 +638,28 @@ class Cropper(ttk.Frame):
                                        settings=self.settings["crosshair"])
 
         # mark the crosshair, and record the foveal centre coordinates
-        self.foveal_centre.mark(self.canvas, self.show_rings)
+        self.foveal_centre.mark(self.canvas, self.show_rings, self.get_viewport())
         self.centre_abs = self.foveal_centre.get_abs_location()
         self.centre_is_placed = True
+        self.record(journal.CENTRE_PLACED, location=self.centre_abs)
 
         self.control_panel.enable_buttons()
 
         # relocate all crops in relation to this new centre and update their distances to it
-        [x.locate(self.centre_abs) for x in self.crops]
-        new_crop_distances = [x.get_round_coordinates(1) for x in self.crops]
+        self.crop_store.relocate(self.centre_abs)
+        new_crop_distances = self.crop_store.get_round_coordinates(1)
 
         self.control_panel.update_coords(new_crop_distances)
 
+        profiling.PROFILER.add("new_centre", start, time.perf_counter(), {"crops" : len(self.crops)})
+
         print('Foveal centre location updated.')
 
     def delete_centre(self):
 
-        self.canvas.delete("crosshair")
+        self.foveal_centre.unmark(self.canvas)
         self.centre_is_placed = False
+        self.record(journal.CENTRE_REMOVED)
 
     def new_crop(self, location):
 
@@ -281,10 +671,19 @@ class Cropper(ttk.Frame):
                                    parameters=self.parameters,
                                    settings=self.settings["crop_box"]))
 
+        # warn about overlapping crops, as they will share pixels
+        overlaps = self.crop_index.overlapping(self.crops[-1].get_crop_corners())
+
+        if overlaps:
+            print("Warning: Crop #" + str(self.crop_iterator) + " overlaps crop(s) "
+                  + ", ".join("#" + str(crop.get_ID()) for crop in overlaps) + ".")
+
         # add crop to the cache and contorl panel list
+        self.crop_index.add(self.crops[-1])
         self.crop_IDs.append(self.crops[-1].get_ID())
-        self.crops[-1].mark(self.canvas)
-        self.crops[-1].locate(self.centre_abs)
+        self.overlay.show(self.crops[-1], self.image_corners[0:2], self.imscale)
+        self.crop_store.add(self.crops[-1], self.centre_abs)
+        self.record(journal.CROP_ADDED, self.crop_IDs[-1], (self.crops[-1].x_absolute, self.crops[-1].y_absolute))
 
         crop_distance = self.crops[-1].get_round_coordinates(1)
 
@@ -292,29 +691,99 @@ class Cropper(ttk.Frame):
 
         self.advance_crop_iterator()
 
+    def place_grid(self, spec):
+
+        if not self.centre_is_placed:
+            print("Error: Place the foveal centre before placing a grid of crops.")
+            return []
+
+        centres, skipped = crop_grid.get_grid_centres(spec, self.centre_abs, self.ppd, self.mpp, self.eye,
+                                                      (self.width, self.height), self.crop_size_μm / self.mpp)
+
+        if skipped:
+            print("Warning: " + str(skipped) + " grid crop(s) fall outside the image and were not placed.")
+
+        crops = self.add_crops(centres)
+
+        print(str(len(crops)) + " grid crops placed.")
+
+        return crops
+
+    def add_crops(self, locations):
+
+        start = time.perf_counter()
+
+        # crops are made in absolute image coordinates, then projected on the next redraw
+        crops = [CropBox(ID=self.crop_iterator + i,
+                         coordinates=location,
+                         top_left=(0, 0),
+                         scale=1.0,
+                         parameters=self.parameters,
+                         settings=self.settings["crop_box"]) for i, location in enumerate(locations)]
+
+        overlapping = []
+
+        for crop in crops:
+
+            # warn about overlapping crops, including ones from the same grid
+            if self.crop_index.overlapping(crop.get_crop_corners()):
+                overlapping.append("#" + str(crop.get_ID()))
+
+            self.crop_index.add(crop)
+            self.crop_store.add(crop)
+
+        if overlapping:
+            print("Warning: Crop(s) " + ", ".join(overlapping) + " overlap other crops.")
+
+        self.crops.extend(crops)
+        self.crop_IDs.extend(crop.get_ID() for crop in crops)
+        self.crop_iterator += len(crops)
+        self.edits += len(crops)
+
+        if self.journal is not None:
+            self.journal.record_many([(journal.CROP_ADDED, crop.get_ID(), crop.x_absolute, crop.y_absolute) for crop in crops])
+
+        # locate the new crops all at once, and list them in one go
+        rows = slice(len(self.crop_store) - len(crops), len(self.crop_store))
+
+        if self.centre_is_placed:
+            self.crop_store.relocate(self.centre_abs, rows)
+            self.control_panel.add_crops([crop.get_ID() for crop in crops], self.crop_store.get_round_coordinates(1, rows))
+
+        # only the crops in view get canvas items, on the next redraw
+        self.render.request()
+
+        profiling.PROFILER.add("add_crops", start, time.perf_counter(), {"crops" : len(crops)})
+
+        return crops
+
     def advance_crop_iterator(self):
 
         self.crop_iterator += 1
 
     def delete_crop(self, event):
 
+        self.render.flush()  # make sure the image corners are up to date
+
         rclickxy = [self.canvas.canvasx(event.x), self.canvas.canvasy(event.y)]
 
         try:
 
-            # delete the nearest crop box to right click
-            selection = self.canvas.find_closest(rclickxy[0], rclickxy[1])
-            select_tags = self.canvas.gettags(selection)
-            ID = select_tags[0]
+            # delete the nearest crop box to right click, found in absolute image coordinates
+            x = (rclickxy[0] - self.image_corners[0]) / self.imscale
+            y = (rclickxy[1] - self.image_corners[1]) / self.imscale
+
+            crop_ID = self.crop_index.nearest(x, y).get_ID()
+            ID = "Crop #" + str(crop_ID)
 
-            to_delete = self.canvas.find_withtag(ID)
-            self.canvas.delete(ID)
+            self.overlay.remove(crop_ID)
 
-            # delete crop, crop ID, and wipe from control panel list
-            index = ID.find("#") + 1
-            crop_ID = int(ID[index:])
-            i = self.crop_IDs.index(crop_ID)
+            # delete crop, crop ID, and wipe from control panel list, IDs are always increasing
+            i = bisect.bisect_left(self.crop_IDs, crop_ID)
 
+            self.crop_index.remove(crop_ID)
+            self.crop_store.remove(crop_ID)
+            self.record(journal.CROP_DELETED, crop_ID)
             self.crops.pop(i)
             self.crop_IDs.pop(i)
             self.control_panel.delete_crop(i)
@@ -333,11 +802,21 @@ class Cropper(ttk.Frame):
         if delete == "yes":
             self.crop_IDs = []
             self.crops = []
+            self.crop_index.clear()
+            self.crop_store.clear()
+            self.record(journal.CROPS_CLEARED)
 
             self.control_panel.delete_all_crops()
-            self.canvas.delete("removable")
+            self.overlay.clear()
             print("All crops removed.")
 
+    def get_viewport(self):
+
+        return (self.canvas.canvasx(0),
+                self.canvas.canvasy(0),
+                self.canvas.canvasx(self.canvas.winfo_width()),
+                self.canvas.canvasy(self.canvas.winfo_height()))
+
     def get_image_corners(self):
 
         return self.image_corners
@@ -346,6 +825,14 @@ class Cropper(ttk.Frame):
 
         return self.imscale
 
+    def get_tile_cache_stats(self):
+
+        return self.tile_cache.get_stats()
+
+    def get_render_stats(self):
+
+        return self.render.get_stats()
+
     def get_crops(self):
 
         return self.crops
@@ -0,0 +1,74 @@
+class LatencyOverlay:
+    """
+    A small panel in the corner of the viewer showing redraw times and the tile cache state.
+
+    The panel is redrawn at the end of every redraw, pinned to the top left corner of the
+    visible area and kept above the image, crops and crosshair. It shows the time the last
+    frame took, the current gap between frames and how many redraws were merged away, along
+    with how full the tile cache is, its hit rate and whether the view is a preview.
+
+    Attributes:
+        canvas (tk.Canvas): The canvas the panel is drawn on.
+        colour (str): The colour of the text.
+
+    Methods:
+        __init__: Initializes the panel, which is drawn on the first update.
+        update: Redraws the panel with the latest frame and cache statistics.
+        format: Returns the lines of text shown in the panel.
+        clear: Removes the panel from the canvas.
+    """
+
+    # screen pixels between the panel and the corner of the visible area
+    PADDING = 8
+
+    def __init__(self, canvas, colour="yellow"):
+
+        self.canvas = canvas
+        self.colour = colour
+        self.text = None
+        self.background = None
+
+    def update(self, viewport, render_stats, cache_stats, preview=False, render_ms=None):
+
+        text = "\n".join(self.format(render_stats, cache_stats, preview, render_ms))
+
+        x = viewport[0] + self.PADDING
+        y = viewport[1] + self.PADDING
+
+        if self.text is None:
+            self.background = self.canvas.create_rectangle(x, y, x, y, fill="black", outline="", tags="latency")
+            self.text = self.canvas.create_text(x, y, text=text, anchor="nw", fill=self.colour,
+                                                font=("Courier", 10), tags="latency")
+        else:
+            self.canvas.coords(self.text, x, y)
+            self.canvas.itemconfigure(self.text, text=text)
+
+        bbox = self.canvas.bbox(self.text)
+        self.canvas.coords(self.background, bbox[0] - 4, bbox[1] - 2, bbox[2] + 4, bbox[3] + 2)
+
+        # keep the panel above everything else drawn on the canvas
+        self.canvas.tag_raise("latency")
+
+    def format(self, render_stats, cache_stats, preview, render_ms):
+
+        lookups = cache_stats["hits"] + cache_stats["misses"]
+        hit_rate = 100 * cache_stats["hits"] / lookups if lookups else 0
+
+        lines = [
+            "frame " + str(render_stats["last_frame_ms"]) + " ms, gap " + str(render_stats["interval_ms"]) + " ms",
+            "frames " + str(render_stats["frames"]) + ", merged " + str(render_stats["dropped"]),
+            "tiles " + str(cache_stats["tiles"]) + ", " + str(cache_stats["megabytes"]) + "/" + str(cache_stats["limit_megabytes"]) + " MB",
+            "hits " + str(round(hit_rate)) + "%, evicted " + str(cache_stats["evictions"]) + (", preview" if preview else "")
+            ]
+
+        # the time spent resampling tiles is only known while profiling
+        if render_ms is not None:
+            lines.insert(1, "render " + str(round(render_ms, 1)) + " ms")
+
+        return lines
+
+    def clear(self):
+
+        self.canvas.delete("latency")
+        self.text = None
+        self.background = None
@@ -0,0 +1,86 @@
+class CropOverlay:
+    """
+    A virtualized canvas layer drawing only the crop boxes inside the current view.
+
+    Crop geometry lives in absolute image coordinates in the crop index, and canvas items
+    only exist for the crops that are visible. On every redraw the crops in the viewport
+    are looked up in the index and projected to canvas coordinates at the current zoom,
+    crops that scrolled into view are marked, and crops that left it are removed, so the
+    cost of a pan or zoom depends on the number of visible crops rather than on how many
+    have been placed.
+
+    Attributes:
+        canvas (tk.Canvas): The canvas the crops are drawn on.
+        crop_index (CropIndex): The spatial index holding every crop.
+        colour (str): The outline colour of the crop boxes.
+        hide_scale (float): Zoom scale at or below which box outlines are hidden.
+
+    Methods:
+        __init__: Initializes an empty overlay.
+        update: Redraws the crops visible in a viewport at a given zoom.
+        show: Draws a single crop at a given zoom, e.g. when it has just been placed.
+        remove: Removes a crop from the canvas.
+        clear: Removes every crop from the canvas.
+    """
+
+    # screen pixels around the viewport still drawn, so labels next to boxes aren't cut off
+    MARGIN = 50
+
+    def __init__(self, canvas, crop_index, colour, hide_scale=0.2):
+
+        self.canvas = canvas
+        self.crop_index = crop_index
+        self.colour = colour
+        self.hide_scale = hide_scale
+
+        self.drawn = {}  # crops with items on the canvas, by ID
+        self.hidden = False
+
+    def update(self, top_left, scale, viewport):
+
+        # the viewport in absolute image coordinates, grown to include labels
+        margin = self.MARGIN / scale + self.crop_index.cell_size * 0.1
+
+        rect = ((viewport[0] - top_left[0]) / scale - margin,
+                (viewport[1] - top_left[1]) / scale - margin,
+                (viewport[2] - top_left[0]) / scale + margin,
+                (viewport[3] - top_left[1]) / scale + margin)
+
+        visible = {crop.get_ID(): crop for crop in self.crop_index.overlapping(rect)}
+
+        for ID in [ID for ID in self.drawn if ID not in visible]:
+            self.remove(ID)
+
+        self.set_hidden(scale <= self.hide_scale)
+
+        for ID, crop in visible.items():
+
+            if ID in self.drawn:
+                crop.move(self.canvas, top_left, scale)
+            else:
+                self.show(crop, top_left, scale)
+
+    def show(self, crop, top_left, scale):
+
+        crop.mark(self.canvas, top_left, scale)
+        self.drawn[crop.get_ID()] = crop
+
+        if self.hidden:
+            self.canvas.itemconfigure(crop.box, outline="")
+
+    def remove(self, ID):
+
+        if ID in self.drawn:
+            self.drawn.pop(ID).unmark(self.canvas)
+
+    def clear(self):
+
+        self.canvas.delete("removable")
+        self.drawn = {}
+
+    def set_hidden(self, hidden):
+
+        # hide all marked boxes if zoomed far away
+        if hidden != self.hidden:
+            self.canvas.itemconfigure("box", outline="" if hidden else self.colour)
+            self.hidden = hidden
@@ -0,0 +1,83 @@
+import time
+
+class RenderScheduler:
+    """
+    Collapses bursts of redraw requests from a Tk widget into at most one redraw per frame.
+
+    Drag, scrollbar and wheel events each ask for a redraw, but only the state at the time
+    the frame is drawn matters, so any requests arriving while a redraw is already pending
+    are dropped as stale. If redraws start taking longer than the latency budget, the gap
+    between frames is widened (up to the budget) so that more stale frames are dropped, and
+    it shrinks back to the frame interval once redraws are fast again.
+
+    Attributes:
+        widget (tk.Widget): The widget used to schedule the redraws.
+        render (callable): The redraw function.
+        frame_ms (int): The shortest gap between redraws in milliseconds.
+        latency_budget_ms (int): The longest a redraw should take in milliseconds.
+
+    Methods:
+        __init__: Initializes the scheduler with a widget and redraw function.
+        request: Asks for a redraw, merging it with one that is already pending.
+        flush: Runs a pending redraw straight away.
+        run: Runs the redraw and adapts the frame interval.
+        get_stats: Returns the request, frame and drop counters.
+    """
+
+    def __init__(self, widget, render, frame_ms=16, latency_budget_ms=50):
+
+        self.widget = widget
+        self.render = render
+        self.frame_ms = frame_ms
+        self.latency_budget_ms = latency_budget_ms
+
+        self.interval = frame_ms
+        self.pending = None
+        self.last_frame_ms = 0.0
+
+        self.requests = 0
+        self.frames = 0
+        self.dropped = 0
+
+    def request(self, *args):
+
+        self.requests += 1
+
+        if self.pending is not None:
+            self.dropped += 1
+            return
+
+        self.pending = self.widget.after(int(self.interval), self.run)
+
+    def flush(self):
+
+        if self.pending is not None:
+            self.widget.after_cancel(self.pending)
+            self.run()
+
+    def run(self):
+
+        self.pending = None
+
+        start = time.perf_counter()
+        self.render()
+        self.last_frame_ms = (time.perf_counter() - start) * 1000
+        self.frames += 1
+
+        # slow frames widen the gap between redraws, fast ones narrow it again
+        if self.last_frame_ms > self.latency_budget_ms:
+            self.interval = min(self.interval * 2, self.latency_budget_ms)
+        else:
+            self.interval = max(self.interval / 2, self.frame_ms)
+
+    def get_stats(self):
+
+        stats = {
+            "requests" : self.requests,
+            "frames" : self.frames,
+            "dropped" : self.dropped,
+            "last_frame_ms" : round(self.last_frame_ms, 1),
+            "interval_ms" : round(self.interval, 1)
+            }
+
+        return stats
@@ -0,0 +1,189 @@
+import os
+import json
+import shutil
+import hashlib
+from PIL import Image
+
+# bytes from each end of a file hashed into its key, covering the header and directories
+HASH_BYTES = 65536
+
+class PyramidCache:
+    """
+    A persistent on-disk cache of the thumbnails and pyramid levels of opened images.
+
+    Each source image gets its own entry folder, named by a key made from its absolute path,
+    file size, modification time and a hash of the start and end of the file (where tiffs
+    keep their header and image file directories), so an entry is never used for a file
+    that has been replaced or changed. Entries are shared by every session and every
+    modality opened on the machine. When the cache grows past its size limit, the least
+    recently used entries are removed.
+
+    Attributes:
+        folder (str): The cache folder.
+        max_bytes (int): The size limit of the cache, in bytes.
+
+    Methods:
+        __init__: Creates the cache folder if needed.
+        get_key: Returns the cache key of a source image.
+        get_thumbnail: Returns a cached thumbnail of an image.
+        put_thumbnail: Stores a thumbnail of an image.
+        get_levels: Returns the cached reduced pyramid levels of an image.
+        put_levels: Stores the reduced pyramid levels of an image.
+        evict: Removes the least recently used entries until the cache fits its limit.
+    """
+
+    def __init__(self, folder, max_bytes):
+
+        self.folder = os.path.expanduser(folder)
+        self.max_bytes = max_bytes
+        self.keys = {}
+
+        os.makedirs(self.folder, exist_ok=True)
+
+    def get_key(self, path):
+
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+
+        # the file is only hashed once per session, unless it changes in the meantime
+        if (path, stat.st_size, stat.st_mtime_ns) in self.keys:
+            return self.keys[(path, stat.st_size, stat.st_mtime_ns)]
+
+        digest = hashlib.sha1()
+        digest.update(json.dumps([path, stat.st_size, stat.st_mtime_ns]).encode("utf-8"))
+
+        with open(path, "rb") as source:
+            digest.update(source.read(HASH_BYTES))
+            source.seek(max(stat.st_size - HASH_BYTES, 0))
+            digest.update(source.read(HASH_BYTES))
+
+        key = digest.hexdigest()
+        self.keys[(path, stat.st_size, stat.st_mtime_ns)] = key
+
+        return key
+
+    def get_thumbnail(self, path):
+
+        entry, meta = self.open_entry(path)
+
+        if meta is None or "thumbnail_scale" not in meta:
+            return None, None, None
+
+        thumbnail = self.read_image(entry + "//thumbnail.tif")
+
+        if thumbnail is None:
+            return None, None, None
+
+        return thumbnail, tuple(meta["size"]), meta["thumbnail_scale"]
+
+    def put_thumbnail(self, path, thumbnail, size, scale):
+
+        entry, meta = self.open_entry(path, create=True)
+
+        self.write_image(entry + "//thumbnail.tif", thumbnail)
+        meta.update({"size" : list(size), "thumbnail_scale" : scale})
+        self.write_meta(entry, meta)
+
+        self.evict(keep=entry)
+
+    def get_levels(self, path, min_size):
+
+        entry, meta = self.open_entry(path)
+
+        # levels built down to a different size would give a different pyramid
+        if meta is None or meta.get("min_size") != min_size:
+            return None
+
+        levels = [self.read_image(entry + "//level_" + str(i) + ".tif") for i in range(1, meta["levels"] + 1)]
+
+        if any(level is None for level in levels):
+            return None
+
+        return levels
+
+    def put_levels(self, path, levels, min_size):
+
+        entry, meta = self.open_entry(path, create=True)
+
+        for i, level in enumerate(levels, start=1):
+            self.write_image(entry + "//level_" + str(i) + ".tif", level)
+
+        meta.update({"levels" : len(levels), "min_size" : min_size})
+        self.write_meta(entry, meta)
+
+        self.evict(keep=entry)
+
+    def open_entry(self, path, create=False):
+
+        entry = self.folder + "//" + self.get_key(path)
+
+        try:
+            with open(entry + "//meta.json", encoding="utf-8") as meta_file:
+                meta = json.load(meta_file)
+        except (OSError, ValueError):
+            meta = None
+
+        if meta is None and create:
+            os.makedirs(entry, exist_ok=True)
+            meta = {"source" : os.path.abspath(path)}
+
+        # using an entry makes it the most recently used
+        if meta is not None and os.path.isfile(entry + "//meta.json"):
+            os.utime(entry + "//meta.json")
+
+        return entry, meta
+
+    def write_meta(self, entry, meta):
+
+        with open(entry + "//meta.json.tmp", "w", encoding="utf-8") as meta_file:
+            json.dump(meta, meta_file)
+
+        os.replace(entry + "//meta.json.tmp", entry + "//meta.json")
+
+    def read_image(self, image_path):
+
+        try:
+            image = Image.open(image_path)
+            image.load()
+        except (OSError, ValueError):
+            return None
+
+        return image
+
+    def write_image(self, image_path, image):
+
+        # written alongside and swapped in, so a half-written file is never read back
+        image.save(image_path + ".tmp.tif")
+        os.replace(image_path + ".tmp.tif", image_path)
+
+    def evict(self, keep=None):
+
+        entries = []
+
+        for name in os.listdir(self.folder):
+
+            entry = self.folder + "//" + name
+
+            if not os.path.isdir(entry):
+                continue
+
+            files = [entry + "//" + file for file in os.listdir(entry)]
+            size = sum(os.path.getsize(file) for file in files if os.path.isfile(file))
+            meta_path = entry + "//meta.json"
+            last_used = os.path.getmtime(meta_path) if os.path.isfile(meta_path) else 0
+
+            entries.append((last_used, size, entry))
+
+        total = sum(size for _, size, _ in entries)
+
+        # remove the least recently used entries first, but never the one just written
+        for last_used, size, entry in sorted(entries):
+
+            if total <= self.max_bytes:
+                break
+
+            if entry == keep:
+                continue
+
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
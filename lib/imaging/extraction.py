@@ -0,0 +1,33 @@
+from .tiff_reader import open_reader
+from ..utils import profiling
+
+def extract_crops(modality, modality_path, crops):
+    """
+    Cuts every crop out of one modality image in a single sequential sweep.
+
+    The modality is opened once, and the crops are visited in the order their first
+    pixels appear in the file's strip or tile layout, so the file is read from start to
+    end instead of being reopened and jumped around once per crop.
+
+    Args:
+        modality (str): The name of the modality, used in the crop file names.
+        modality_path (str): The path to the modality image.
+        crops (list of CropBox): The crops to extract.
+
+    Yields:
+        tuple: A tuple containing:
+            - crop (CropBox): The crop that was extracted.
+            - tiff (PIL.Image): The cropped image.
+            - tiff_name (str): The file name for the cropped image.
+    """
+
+    with open_reader(modality_path) as reader:
+
+        ordered_crops = sorted(crops, key=lambda crop: reader.offset(crop.get_crop_corners()))
+
+        for crop in ordered_crops:
+
+            with profiling.span("make_tiff", crop=crop.get_ID()):
+                (tiff, tiff_name) = crop.make_tiff(modality, modality_path, reader)
+
+            yield crop, tiff, tiff_name
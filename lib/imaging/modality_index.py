@@ -0,0 +1,189 @@
+import os
+import json
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+
+# bumped whenever the cached headers change meaning, so old index files are ignored
+INDEX_VERSION = 1
+
+# bits per sample of the PIL modes, for comparing bit depths
+MODE_BITS = {"1" : 1, "L" : 8, "P" : 8, "LA" : 8, "RGB" : 8, "RGBA" : 8, "CMYK" : 8,
+             "I;16" : 16, "I;16B" : 16, "I;16L" : 16, "I;16N" : 16, "I" : 32, "F" : 32}
+
+class ModalityIndex:
+    """
+    An index of the modality images of a subject, built from their tiff headers only.
+
+    The modalities of an image are the other tiffs in its folder sharing its base name,
+    e.g. MM_0364_OS_confocal.tif next to MM_0364_OS_split.tif. Only the header of each one
+    is read (PIL opens images lazily), in parallel across a pool of threads as each read is
+    mostly waiting on the disk or network share, and its size and bit depth are checked
+    against the primary image. The headers are cached in a small index file next to the
+    images, so later sessions only stat the files and reread the ones that changed.
+
+    Attributes:
+        folder (str): The folder holding the images.
+        base_name (str): The base name shared by every modality, up to the modality.
+        primary_modality (str): The modality of the image being cropped.
+        workers (int): The number of threads reading headers.
+        use_cache (bool): Whether to read and write the index file.
+
+    Methods:
+        __init__: Initializes an empty index.
+        build: Reads the headers of every modality, reusing cached ones that are still valid.
+        get_problems: Returns a description of every modality that doesn't match the primary image.
+        get_modalities: Returns the modalities that can be cropped along with the primary image.
+
+    If the header of the primary image can't be read, the others can't be checked against
+    it, so that is reported as a problem and only the primary modality is kept.
+    """
+
+    def __init__(self, folder, base_name, primary_modality, workers=8, use_cache=True):
+
+        self.folder = folder
+        self.base_name = base_name
+        self.primary_modality = primary_modality
+        self.workers = workers
+        self.use_cache = use_cache
+
+        self.index_path = folder + "//" + "." + base_name + "modality_index.json"
+        self.headers = {}  # header of each modality, by modality name
+
+    def build(self):
+
+        files = {}
+
+        # only tiffs of this subject and eye are modalities, others in the folder are ignored
+        for entry in os.scandir(self.folder):
+
+            if entry.name.startswith(self.base_name) and entry.name.endswith(".tif") and entry.is_file():
+
+                stat = entry.stat()
+                modality = entry.name[len(self.base_name):-len(".tif")]
+                files[modality] = {"file_size" : stat.st_size, "mtime_ns" : stat.st_mtime_ns}
+
+        cached = self.read_index() if self.use_cache else {}
+
+        # a cached header is only trusted if the file hasn't changed since it was read
+        self.headers = {modality: cached[modality] for modality, stat in files.items()
+                        if modality in cached and all(cached[modality].get(k) == v for k, v in stat.items())}
+
+        stale = [modality for modality in files if modality not in self.headers]
+
+        if stale:
+
+            paths = [self.get_path(modality) for modality in stale]
+
+            with ThreadPoolExecutor(max(1, min(self.workers, len(stale)))) as pool:
+                for modality, header in zip(stale, pool.map(read_header, paths)):
+                    self.headers[modality] = dict(header, **files[modality])
+
+            if self.use_cache:
+                self.write_index()
+
+        return self
+
+    def get_path(self, modality):
+
+        return self.folder + "//" + self.base_name + modality + ".tif"
+
+    def get_problems(self):
+
+        primary = self.headers.get(self.primary_modality)
+
+        # without the primary header nothing can be checked, which is a problem in itself
+        if primary is None:
+            return [self.primary_modality + ": not found in " + self.folder + ", so the other modalities were not checked"]
+
+        if "error" in primary:
+            return [self.primary_modality + ": could not be read (" + primary["error"] + "), so the other modalities were not checked"]
+
+        problems = []
+
+        for modality, header in sorted(self.headers.items()):
+
+            if modality == self.primary_modality:
+                continue
+
+            if "error" in header:
+                problems.append(modality + ": could not be read (" + header["error"] + ")")
+                continue
+
+            if (header["width"], header["height"]) != (primary["width"], primary["height"]):
+                problems.append(modality + ": " + str(header["width"]) + "x" + str(header["height"]) + " pixels, but "
+                                + self.primary_modality + " is " + str(primary["width"]) + "x" + str(primary["height"]))
+
+            if header["bits"] != primary["bits"]:
+                problems.append(modality + ": " + str(header["bits"]) + " bit, but "
+                                + self.primary_modality + " is " + str(primary["bits"]) + " bit")
+
+        return problems
+
+    def get_modalities(self):
+
+        primary = self.headers.get(self.primary_modality)
+
+        # unchecked modalities are never exported
+        if primary is None or "error" in primary:
+            return [self.primary_modality]
+
+        modalities = []
+
+        for modality, header in sorted(self.headers.items()):
+
+            # crops of a differently sized image would be in the wrong place, so it is left out
+            if modality != self.primary_modality:
+                if "error" in header or (header["width"], header["height"]) != (primary["width"], primary["height"]):
+                    continue
+
+            modalities.append(modality)
+
+        return modalities
+
+    def read_index(self):
+
+        try:
+            with open(self.index_path, encoding="utf-8") as index_file:
+                index = json.load(index_file)
+        except (OSError, ValueError):
+            return {}
+
+        if not isinstance(index, dict) or index.get("version") != INDEX_VERSION:
+            return {}
+
+        return index.get("headers", {})
+
+    def write_index(self):
+
+        # unreadable files are looked at again next time rather than cached
+        headers = {modality: header for modality, header in self.headers.items() if "error" not in header}
+
+        try:
+            with open(self.index_path + ".tmp", "w", encoding="utf-8") as index_file:
+                json.dump({"version" : INDEX_VERSION, "headers" : headers}, index_file)
+
+            os.replace(self.index_path + ".tmp", self.index_path)
+
+        except OSError as e:
+            print("Warning: The modality index could not be saved - " + str(e))
+
+def read_header(path):
+    """
+    Reads the size and bit depth of an image from its header, without loading its pixels.
+
+    Args:
+        path (str): The path to the image.
+
+    Returns:
+        dict: The width, height, mode and bits per sample of the image, or the error if it
+            can't be read.
+    """
+
+    try:
+        with Image.open(path) as image:
+            width, height = image.size
+            mode = image.mode
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        return {"error" : str(e)}
+
+    return {"width" : width, "height" : height, "mode" : mode, "bits" : MODE_BITS.get(mode, 0)}
@@ -0,0 +1,123 @@
+import numpy as np
+from PIL import Image
+
+# modes that PIL can't reduce or box resample, which are shown through an 8 bit copy
+SIXTEEN_BIT_MODES = ("I;16", "I;16B", "I;16L", "I;16N")
+
+# rows converted at a time, so the conversion never holds a wide copy of a whole montage
+CONVERT_ROWS = 1024
+
+class ImagePyramid:
+    """
+    A stack of successively downsampled copies of a large image.
+
+    Level 0 is the full resolution image and every following level is half the size of the
+    one before it (1/2, 1/4, 1/8 ...). When the canvas is zoomed out, regions are resampled
+    from the level closest to the display scale, so each redraw only touches roughly as many
+    pixels as are shown on the screen rather than the whole of the full resolution region.
+
+    The pyramid can also be built from a thumbnail of the image, for showing something
+    while the full image loads. Its levels are then all smaller than the image they stand
+    in for, but are rendered in full resolution coordinates in exactly the same way.
+
+    16 bit images are shown through an 8 bit copy (see display_image), as PIL can only
+    reduce and resample 8 bit, 32 bit and floating point images.
+
+    Attributes:
+        image (PIL.Image): The full resolution image, or a thumbnail of it. 16 bit images are
+            replaced by an 8 bit copy for display.
+        min_size (int): No further levels are built once the shorter side would drop below this.
+        size (tuple, optional): The (width, height) of the full resolution image, if image is a thumbnail.
+        scale (float): The size of image relative to the full resolution image.
+        levels (list of PIL.Image, optional): Already downsampled levels following image, e.g.
+            from the disk cache, used instead of building them.
+
+    Methods:
+        __init__: Builds the downsampled levels from the full resolution image.
+        select_level: Returns the index of the best level for a given display scale.
+        get_level: Returns the image stored at a given level.
+        get_level_scale: Returns the size of a level relative to the full resolution image.
+        render: Resamples a region of the full resolution image to a given display size,
+            optionally from a coarser level than needed for a cheaper preview.
+    """
+
+    def __init__(self, image, min_size=512, size=None, scale=1.0, levels=None):
+
+        image = display_image(image)
+
+        self.image = image
+        self.min_size = min_size
+        self.width, self.height = size if size is not None else image.size
+
+        self.levels = [image]
+
+        if levels is not None:
+            self.levels += levels
+
+        # halve the previous level until the shorter side gets too small to be worth it
+        while levels is None and min(self.levels[-1].size) // 2 >= self.min_size:
+            self.levels.append(self.levels[-1].reduce(2))
+
+        self.level_scales = [scale * level.width / image.width for level in self.levels]
+
+    def select_level(self, scale):
+
+        # the coarsest level that still has at least as many pixels as the display
+        for i in range(len(self.levels) - 1, 0, -1):
+            if self.level_scales[i] >= scale:
+                return i
+
+        return 0
+
+    def get_level(self, i):
+
+        return self.levels[i]
+
+    def get_level_scale(self, i):
+
+        return self.level_scales[i]
+
+    def render(self, box, size, resample=Image.BICUBIC, coarser=0):
+
+        # box is in full resolution coordinates, size is the output size on screen
+        scale = size[0] / max(box[2] - box[0], 1e-9)
+        i = min(self.select_level(scale) + coarser, len(self.levels) - 1)
+
+        level = self.levels[i]
+        level_scale = self.level_scales[i]
+
+        level_box = (max(box[0] * level_scale, 0),
+                     max(box[1] * level_scale, 0),
+                     min(box[2] * level_scale, level.width),
+                     min(box[3] * level_scale, level.height))
+
+        return level.resize(size, resample, box=level_box)
+
+def display_image(image):
+    """
+    Returns an 8 bit copy of a 16 bit image for display, and any other image as it is.
+
+    The grey levels are scaled so the highest power of two the image reaches maps to white,
+    so a thumbnail and the full image it was sampled from almost always get the same scaling,
+    and the view doesn't change brightness when the full image replaces the thumbnail.
+
+    Args:
+        image (PIL.Image): The image.
+
+    Returns:
+        PIL.Image: The image, or its 8 bit copy.
+    """
+
+    if image.mode not in SIXTEEN_BIT_MODES:
+        return image
+
+    array = np.asarray(image)
+    top = 2**max(int(array.max()).bit_length(), 8) - 1
+
+    lut = (np.arange(65536, dtype=np.uint32) * 255 // top).clip(0, 255).astype(np.uint8)
+    display = np.empty(array.shape, np.uint8)
+
+    for y in range(0, array.shape[0], CONVERT_ROWS):
+        display[y:y + CONVERT_ROWS] = lut[array[y:y + CONVERT_ROWS]]
+
+    return Image.fromarray(display)
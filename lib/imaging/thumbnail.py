@@ -0,0 +1,62 @@
+import math
+from PIL import Image
+
+from .tiff_reader import TiffReader, UnsupportedTiffError
+
+def read_thumbnail(path, max_size):
+    """
+    Reads a small preview of a large tiff without decoding the whole image.
+
+    Every nth pixel of every nth row is picked straight out of the memory-mapped file, so
+    only a fraction of the file is read, and the preview can be shown within moments of
+    opening even the largest montages. Tiffs the memory-mapped reader can't handle (such
+    as compressed ones) have no preview.
+
+    Args:
+        path (str): The path to the tiff file.
+        max_size (int): The longest side of the thumbnail, at most.
+
+    Returns:
+        tuple: A tuple containing:
+            - thumbnail (PIL.Image or None): The thumbnail, or None if it can't be sampled.
+            - size (tuple or None): The (width, height) of the full resolution image.
+            - scale (float or None): The size of the thumbnail relative to the full image.
+    """
+
+    try:
+        reader = TiffReader(path)
+    except (UnsupportedTiffError, OSError):
+        return None, None, None
+
+    with reader:
+
+        step = max(math.ceil(max(reader.size) / max_size), 1)
+        thumbnail = reader.sample(step)
+
+        return thumbnail, reader.size, 1 / step
+
+def read_placeholder(path, max_size):
+    """
+    Makes a blank stand-in for the thumbnail of a tiff that can't be sampled.
+
+    Only the header is read, for the size of the image, so the viewer can be laid out at
+    the right size straight away while the full image is decoded in the background.
+
+    Args:
+        path (str): The path to the tiff file.
+        max_size (int): The longest side of the placeholder, at most.
+
+    Returns:
+        tuple: A tuple containing:
+            - placeholder (PIL.Image): A black image in place of the thumbnail.
+            - size (tuple): The (width, height) of the full resolution image.
+            - scale (float): The size of the placeholder relative to the full image.
+    """
+
+    with Image.open(path) as image:
+        size = image.size
+
+    step = max(math.ceil(max(size) / max_size), 1)
+    placeholder = Image.new("L", (math.ceil(size[0] / step), math.ceil(size[1] / step)))
+
+    return placeholder, size, 1 / step
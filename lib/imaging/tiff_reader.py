@@ -0,0 +1,312 @@
+import mmap
+import struct
+import numpy as np
+from PIL import Image
+
+# tiff tag numbers used by the reader
+IMAGE_WIDTH = 256
+IMAGE_LENGTH = 257
+BITS_PER_SAMPLE = 258
+COMPRESSION = 259
+PHOTOMETRIC = 262
+STRIP_OFFSETS = 273
+SAMPLES_PER_PIXEL = 277
+ROWS_PER_STRIP = 278
+PLANAR_CONFIGURATION = 284
+TILE_WIDTH = 322
+TILE_LENGTH = 323
+TILE_OFFSETS = 324
+SAMPLE_FORMAT = 339
+
+# struct codes for the tiff field types (classic and BigTIFF)
+FIELD_TYPES = {1: "B", 2: "c", 3: "H", 4: "I", 5: "II", 6: "b", 7: "B", 8: "h",
+               9: "i", 10: "ii", 11: "f", 12: "d", 13: "I", 16: "Q", 17: "q", 18: "Q"}
+
+# PIL modes for the supported (photometric, samples per pixel, bits per sample) layouts
+MODES = {(1, 1, 8): "L", (1, 1, 16): "I;16", (2, 3, 8): "RGB", (2, 4, 8): "RGBA"}
+
+class UnsupportedTiffError(Exception):
+    """
+    Raised when a file cannot be read directly by the memory-mapped tiff reader.
+    """
+
+class TiffReader:
+    """
+    A random-access reader for uncompressed striped or tiled tiff files.
+
+    The file is memory-mapped rather than decoded, and crops are assembled row by row from
+    only the strips or tiles they overlap, so the cost of a crop is proportional to its area
+    rather than to the size of the image. Both classic tiff and BigTIFF are understood, but
+    only uncompressed, chunky, unsigned 8 or 16 bit greyscale and 8 bit RGB(A) images are
+    supported. Anything else raises UnsupportedTiffError.
+
+    Attributes:
+        path (str): The path to the tiff file.
+
+    Methods:
+        __init__: Memory-maps the file and parses the first image file directory.
+        crop: Returns a region of the image, in the same way as PIL's Image.crop.
+        sample: Returns every nth pixel of every nth row, as a quick thumbnail.
+        offset: Returns the file position of the first pixel of a region.
+        close: Unmaps and closes the file.
+    """
+
+    def __init__(self, path):
+
+        self.path = path
+        self.file = open(path, "rb")
+
+        try:
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.parse_header()
+        except (UnsupportedTiffError, ValueError, struct.error) as e:
+            self.close()
+            raise UnsupportedTiffError(str(e))
+
+    def __enter__(self):
+
+        return self
+
+    def __exit__(self, *args):
+
+        self.close()
+
+    def parse_header(self):
+
+        byte_order = self.map[0:2]
+
+        if byte_order == b"II":
+            self.endian = "<"
+        elif byte_order == b"MM":
+            self.endian = ">"
+        else:
+            raise UnsupportedTiffError("Not a tiff file")
+
+        magic = self.unpack("H", 2)[0]
+
+        if magic == 42:
+            self.bigtiff = False
+            ifd_offset = self.unpack("I", 4)[0]
+        elif magic == 43:
+            self.bigtiff = True
+            ifd_offset = self.unpack("Q", 8)[0]
+        else:
+            raise UnsupportedTiffError("Not a tiff file")
+
+        tags = self.read_ifd(ifd_offset)
+
+        self.width = tags[IMAGE_WIDTH][0]
+        self.height = tags[IMAGE_LENGTH][0]
+        self.size = (self.width, self.height)
+
+        bits = tags.get(BITS_PER_SAMPLE, (1,))
+        samples = tags.get(SAMPLES_PER_PIXEL, (1,))[0]
+        photometric = tags.get(PHOTOMETRIC, (1,))[0]
+
+        if tags.get(COMPRESSION, (1,))[0] != 1:
+            raise UnsupportedTiffError("Compressed tiff")
+        if samples > 1 and tags.get(PLANAR_CONFIGURATION, (1,))[0] != 1:
+            raise UnsupportedTiffError("Planar tiff")
+        if any(f != 1 for f in tags.get(SAMPLE_FORMAT, (1,))):
+            raise UnsupportedTiffError("Signed or floating point tiff")
+        if len(set(bits)) != 1 or (photometric, samples, bits[0]) not in MODES:
+            raise UnsupportedTiffError("Unsupported pixel layout")
+
+        self.mode = MODES[(photometric, samples, bits[0])]
+
+        if self.mode == "I;16" and self.endian == ">":
+            self.mode = "I;16B"
+
+        self.pixel_bytes = samples * bits[0] // 8
+
+        if TILE_OFFSETS in tags:
+            self.tiled = True
+            self.chunk_width = tags[TILE_WIDTH][0]
+            self.chunk_height = tags[TILE_LENGTH][0]
+            self.offsets = tags[TILE_OFFSETS]
+        else:
+            self.tiled = False
+            self.chunk_width = self.width
+            self.chunk_height = min(tags.get(ROWS_PER_STRIP, (self.height,))[0], self.height)
+            self.offsets = tags[STRIP_OFFSETS]
+
+        self.chunks_across = -(-self.width // self.chunk_width)
+        self.chunk_row_bytes = self.chunk_width * self.pixel_bytes
+
+    def read_ifd(self, offset):
+
+        if self.bigtiff:
+            count = self.unpack("Q", offset)[0]
+            entry_size, count_code, value_size = 20, "Q", 8
+            offset += 8
+        else:
+            count = self.unpack("H", offset)[0]
+            entry_size, count_code, value_size = 12, "I", 4
+            offset += 2
+
+        tags = {}
+
+        for i in range(count):
+
+            entry = offset + i * entry_size
+            tag, field_type = self.unpack("HH", entry)
+            value_count = self.unpack(count_code, entry + 4)[0]
+
+            if field_type not in FIELD_TYPES:
+                continue
+
+            code = FIELD_TYPES[field_type] * value_count
+            value_offset = entry + 4 + value_size
+
+            # values that do not fit in the entry are stored elsewhere in the file
+            if struct.calcsize(self.endian + code) > value_size:
+                value_offset = self.unpack(count_code, value_offset)[0]
+
+            tags[tag] = self.unpack(code, value_offset)
+
+        return tags
+
+    def unpack(self, code, offset):
+
+        return struct.unpack_from(self.endian + code, self.map, offset)
+
+    def crop(self, box):
+
+        # round the box and pad outside the image with zeros, the same as PIL
+        x0, y0, x1, y1 = map(int, map(round, box))
+
+        width = max(x1 - x0, 0)
+        height = max(y1 - y0, 0)
+        row_bytes = width * self.pixel_bytes
+
+        data = bytearray(row_bytes * height)
+
+        # the part of the box that lies inside the image
+        ix0, iy0 = max(x0, 0), max(y0, 0)
+        ix1, iy1 = min(x1, self.width), min(y1, self.height)
+
+        for y in range(iy0, iy1):
+
+            chunk_y, row = divmod(y, self.chunk_height)
+            x = ix0
+
+            while x < ix1:
+
+                chunk_x, column = divmod(x, self.chunk_width)
+                run = min(ix1 - x, self.chunk_width - column)
+
+                chunk_offset = self.offsets[chunk_y * self.chunks_across + chunk_x]
+                start = chunk_offset + row * self.chunk_row_bytes + column * self.pixel_bytes
+                end = start + run * self.pixel_bytes
+
+                target = (y - y0) * row_bytes + (x - x0) * self.pixel_bytes
+                data[target:target + (end - start)] = self.map[start:end]
+
+                x += run
+
+        return Image.frombytes(self.mode, (width, height), bytes(data))
+
+    def sample(self, step):
+
+        rows = []
+
+        # only every nth row is read from the file, rather than decoding the whole image
+        for y in range(0, self.height, step):
+
+            chunk_y, row = divmod(y, self.chunk_height)
+            pieces = []
+
+            for chunk_x in range(self.chunks_across):
+                start = self.offsets[chunk_y * self.chunks_across + chunk_x] + row * self.chunk_row_bytes
+                pieces.append(np.frombuffer(self.map, np.uint8, self.chunk_row_bytes, start))
+
+            # join the row across the tiles, cut off the padding, and keep every nth pixel
+            line = np.concatenate(pieces)[:self.width * self.pixel_bytes]
+            rows.append(line.reshape(-1, self.pixel_bytes)[::step])
+
+        data = np.stack(rows)
+
+        return Image.frombytes(self.mode, (data.shape[1], data.shape[0]), data.tobytes())
+
+    def offset(self, box):
+
+        x = min(max(int(round(box[0])), 0), self.width - 1)
+        y = min(max(int(round(box[1])), 0), self.height - 1)
+
+        chunk_y, row = divmod(y, self.chunk_height)
+        chunk_x, column = divmod(x, self.chunk_width)
+
+        chunk_offset = self.offsets[chunk_y * self.chunks_across + chunk_x]
+
+        return chunk_offset + row * self.chunk_row_bytes + column * self.pixel_bytes
+
+    def close(self):
+
+        if getattr(self, "map", None) is not None:
+            self.map.close()
+            self.map = None
+
+        self.file.close()
+
+class PilReader:
+    """
+    A fallback reader that crops through PIL, for images the tiff reader cannot map.
+
+    The image is decoded in full on the first crop, and later crops reuse the decoded data.
+
+    Attributes:
+        path (str): The path to the image file.
+
+    Methods:
+        __init__: Opens the image with PIL.
+        crop: Returns a region of the image.
+        offset: Returns the row-major position of the first pixel of a region.
+        close: Closes the image.
+    """
+
+    def __init__(self, path):
+
+        self.path = path
+        self.image = Image.open(path)
+        self.size = self.image.size
+        self.width, self.height = self.size
+        self.mode = self.image.mode
+
+    def __enter__(self):
+
+        return self
+
+    def __exit__(self, *args):
+
+        self.close()
+
+    def crop(self, box):
+
+        return self.image.crop(box)
+
+    def offset(self, box):
+
+        x = min(max(int(round(box[0])), 0), self.width - 1)
+        y = min(max(int(round(box[1])), 0), self.height - 1)
+
+        return y * self.width + x
+
+    def close(self):
+
+        self.image.close()
+
+def open_reader(path):
+    """
+    Opens an image for cropping, memory-mapping it when the tiff layout allows.
+
+    Args:
+        path (str): The path to the image file.
+
+    Returns:
+        TiffReader or PilReader: A reader with crop, close and context manager support.
+    """
+
+    try:
+        return TiffReader(path)
+    except UnsupportedTiffError:
+        return PilReader(path)
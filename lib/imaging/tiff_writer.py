@@ -0,0 +1,249 @@
+import math
+import struct
+from PIL import Image
+
+# (photometric interpretation, samples per pixel) for the supported image modes
+MODE_LAYOUTS = {"L": (1, 1), "RGB": (2, 3), "RGBA": (2, 4)}
+
+# tiff field types, LONG8 and IFD8 are BigTIFF only
+SHORT = 3
+LONG = 4
+LONG8 = 16
+IFD8 = 18
+
+FIELD_CODES = {SHORT: "H", LONG: "I", LONG8: "Q", IFD8: "Q"}
+
+class TiledTiffWriter:
+    """
+    A streaming writer for tiled BigTIFF files with optional reduced-resolution levels.
+
+    The image is handed to the writer as horizontal bands, top to bottom, and every full
+    row of tiles is written out as soon as it is complete, so memory use is bounded by the
+    band height rather than the size of the image. Reduced-resolution copies (1/2, 1/4 ...)
+    are built from the same bands as they stream past and stored as sub-IFDs of the main
+    image, which lets viewers show the whole image without reading every full size tile.
+    Tiles are stored uncompressed.
+
+    Attributes:
+        path (str): The path of the tiff file to write.
+        size (tuple): The (width, height) of the full resolution image.
+        mode (str): The PIL mode of the bands, one of "L", "RGB" or "RGBA".
+        tile_size (int): The edge length of the square tiles.
+        levels (int): The number of reduced-resolution levels to write.
+
+    Methods:
+        __init__: Opens the file and prepares the tile rows of every level.
+        write_band: Adds the next band of full resolution rows.
+        close: Writes the remaining tiles and the image file directories.
+    """
+
+    def __init__(self, path, size, mode, tile_size=256, levels=0):
+
+        if mode not in MODE_LAYOUTS:
+            raise ValueError("Tiled tiffs can only be written from L, RGB or RGBA images")
+
+        self.path = path
+        self.size = size
+        self.mode = mode
+        self.tile_size = tile_size
+        self.levels = levels
+
+        # each level is half the size of the one above it, rounding up
+        self.level_sizes = [size]
+
+        for _ in range(levels):
+            width, height = self.level_sizes[-1]
+            self.level_sizes.append((math.ceil(width / 2), math.ceil(height / 2)))
+
+        # rows waiting to become tiles, and rows waiting to be halved into the next level
+        self.tile_rows = [None] * (levels + 1)
+        self.reduce_rows = [None] * (levels + 1)
+
+        self.tile_offsets = [[] for _ in range(levels + 1)]
+        self.tile_byte_counts = [[] for _ in range(levels + 1)]
+
+        self.file = open(path, "wb")
+
+        # BigTIFF header, the offset of the first directory is filled in on close
+        self.file.write(b"II" + struct.pack("<HHHQ", 43, 8, 0, 0))
+
+    def __enter__(self):
+
+        return self
+
+    def __exit__(self, *args):
+
+        self.close()
+
+    def write_band(self, band):
+
+        if band.mode != self.mode or band.width != self.size[0]:
+            raise ValueError("Bands must be full width and match the writer mode")
+
+        self.add_rows(0, band)
+
+    def add_rows(self, level, rows):
+
+        self.tile_rows[level] = stack_rows(self.tile_rows[level], rows)
+
+        while self.tile_rows[level].height >= self.tile_size:
+            self.write_tile_row(level, self.tile_rows[level])
+            self.tile_rows[level] = split_rows(self.tile_rows[level], self.tile_size)
+
+        if level < self.levels:
+
+            # halve an even number of rows at a time so pairs of rows are never split
+            self.reduce_rows[level] = stack_rows(self.reduce_rows[level], rows)
+            even = self.reduce_rows[level].height // 2 * 2
+
+            if even:
+                pairs = self.reduce_rows[level].crop((0, 0, self.reduce_rows[level].width, even))
+                self.reduce_rows[level] = split_rows(self.reduce_rows[level], even)
+                self.add_rows(level + 1, pairs.reduce(2))
+
+    def write_tile_row(self, level, rows):
+
+        width = self.level_sizes[level][0]
+        size = self.tile_size
+
+        for x in range(0, width, size):
+
+            # tiles are always full size, so the right and bottom edges are padded
+            tile = rows.crop((x, 0, x + size, size))
+
+            self.tile_offsets[level].append(self.file.tell())
+            self.tile_byte_counts[level].append(self.file.write(tile.tobytes()))
+
+    def close(self):
+
+        if self.file.closed:
+            return
+
+        for level in range(self.levels + 1):
+
+            # the last odd row of a level still becomes a row of the next level
+            if level < self.levels and self.reduce_rows[level] is not None and self.reduce_rows[level].height:
+                self.add_rows(level + 1, self.reduce_rows[level].reduce(2))
+
+            if self.tile_rows[level] is not None and self.tile_rows[level].height:
+                self.write_tile_row(level, self.tile_rows[level])
+
+            self.tile_rows[level] = None
+            self.reduce_rows[level] = None
+
+        sub_ifd_offsets = [self.write_ifd(level) for level in range(1, self.levels + 1)]
+        main_ifd_offset = self.write_ifd(0, sub_ifd_offsets)
+
+        self.file.seek(8)
+        self.file.write(struct.pack("<Q", main_ifd_offset))
+        self.file.close()
+
+    def write_ifd(self, level, sub_ifd_offsets=()):
+
+        width, height = self.level_sizes[level]
+        photometric, samples = MODE_LAYOUTS[self.mode]
+
+        entries = [
+            (254, LONG, [0 if level == 0 else 1]),  # new subfile type, 1 for reduced resolution
+            (256, LONG, [width]),
+            (257, LONG, [height]),
+            (258, SHORT, [8] * samples),  # bits per sample
+            (259, SHORT, [1]),  # no compression
+            (262, SHORT, [photometric]),
+            (277, SHORT, [samples]),
+            (284, SHORT, [1]),  # chunky planar configuration
+            (322, LONG, [self.tile_size]),
+            (323, LONG, [self.tile_size]),
+            (324, LONG8, self.tile_offsets[level]),
+            (325, LONG8, self.tile_byte_counts[level])
+            ]
+
+        if sub_ifd_offsets:
+            entries.append((330, IFD8, list(sub_ifd_offsets)))
+
+        if self.mode == "RGBA":
+            entries.append((338, SHORT, [2]))  # unassociated alpha
+
+        return write_ifd(self.file, entries)
+
+def write_ifd(tiff, entries, bigtiff=True):
+    """
+    Writes an image file directory, with its larger values ahead of it.
+
+    Args:
+        tiff (file): The tiff file, positioned where the directory should go.
+        entries (list of tuple): The (tag, field type, values) of each entry, in tag order.
+        bigtiff (bool): Whether the file is a BigTIFF, with 8 byte offsets and counts.
+
+    Returns:
+        int: The file offset of the directory.
+    """
+
+    value_size = 8 if bigtiff else 4
+    values = []
+
+    for tag, field_type, data in entries:
+
+        packed = struct.pack("<" + FIELD_CODES[field_type] * len(data), *data)
+
+        # values that don't fit in the entry are written ahead of the directory
+        if len(packed) > value_size:
+            offset = tiff.tell()
+            tiff.write(packed)
+            packed = struct.pack("<Q" if bigtiff else "<I", offset)
+
+        values.append(packed.ljust(value_size, b"\0"))
+
+    # directories start on a word boundary
+    if tiff.tell() % 2:
+        tiff.write(b"\0")
+
+    ifd_offset = tiff.tell()
+
+    if bigtiff:
+        tiff.write(struct.pack("<Q", len(entries)))
+    else:
+        tiff.write(struct.pack("<H", len(entries)))
+
+    for (tag, field_type, data), value in zip(entries, values):
+        count = struct.pack("<Q" if bigtiff else "<I", len(data))
+        tiff.write(struct.pack("<HH", tag, field_type) + count + value)
+
+    tiff.write(b"\0" * value_size)  # no next directory
+
+    return ifd_offset
+
+def stack_rows(top, bottom):
+    """
+    Joins two images of the same width vertically.
+
+    Args:
+        top (PIL.Image or None): The upper rows, or None.
+        bottom (PIL.Image): The lower rows.
+
+    Returns:
+        PIL.Image: The joined image.
+    """
+
+    if top is None or top.height == 0:
+        return bottom
+
+    stacked = Image.new(bottom.mode, (bottom.width, top.height + bottom.height))
+    stacked.paste(top, (0, 0))
+    stacked.paste(bottom, (0, top.height))
+
+    return stacked
+
+def split_rows(rows, count):
+    """
+    Returns the rows of an image below the first count rows.
+
+    Args:
+        rows (PIL.Image): The image.
+        count (int): The number of rows to drop from the top.
+
+    Returns:
+        PIL.Image: The remaining rows (possibly zero rows high).
+    """
+
+    return rows.crop((0, count, rows.width, rows.height))
@@ -0,0 +1,211 @@
+import math
+from collections import OrderedDict
+from PIL import Image
+
+# bytes used by one pixel of each image mode, for estimating tile memory
+MODE_BYTES = {"1": 1, "L": 1, "P": 1, "LA": 2, "I;16": 2, "I;16B": 2, "RGB": 3, "RGBA": 4, "I": 4, "F": 4}
+
+class TileCache:
+    """
+    A least recently used cache of rendered viewport tiles with a memory limit.
+
+    Tiles are keyed by (zoom scale, tile_x, tile_y, quality). When the total size of the cached
+    tiles goes above the memory limit, the least recently used tiles are evicted until
+    it fits again. Hit, miss and eviction counters are kept so the limit can be tuned.
+
+    Attributes:
+        max_bytes (int): The memory limit for all cached tiles, in bytes.
+
+    Methods:
+        __init__: Initializes an empty cache with the given memory limit.
+        get: Returns a cached tile (or None) and updates the counters.
+        contains: Returns whether a tile is cached, without touching the counters.
+        put: Adds a tile to the cache, evicting old tiles if over the limit.
+        clear: Removes every tile from the cache.
+        get_stats: Returns the cache counters and current memory use.
+    """
+
+    def __init__(self, max_bytes):
+
+        self.max_bytes = max_bytes
+        self.tiles = OrderedDict()
+        self.nbytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+
+        tile = self.tiles.get(key)
+
+        if tile is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.tiles.move_to_end(key)
+
+        return tile
+
+    def contains(self, key):
+
+        return key in self.tiles
+
+    def put(self, key, tile):
+
+        if key in self.tiles:
+            self.nbytes -= tile_nbytes(self.tiles.pop(key))
+
+        self.tiles[key] = tile
+        self.nbytes += tile_nbytes(tile)
+
+        # drop the least recently used tiles, but always keep the newest one
+        while self.nbytes > self.max_bytes and len(self.tiles) > 1:
+            _, old_tile = self.tiles.popitem(last=False)
+            self.nbytes -= tile_nbytes(old_tile)
+            self.evictions += 1
+
+    def clear(self):
+
+        self.tiles.clear()
+        self.nbytes = 0
+
+    def get_stats(self):
+
+        stats = {
+            "hits" : self.hits,
+            "misses" : self.misses,
+            "evictions" : self.evictions,
+            "tiles" : len(self.tiles),
+            "megabytes" : round(self.nbytes / 2**20, 1),
+            "limit_megabytes" : round(self.max_bytes / 2**20, 1)
+            }
+
+        return stats
+
+class TiledRenderer:
+    """
+    Renders regions of an image pyramid for the viewer out of fixed size cached tiles.
+
+    The image, drawn at the current zoom scale, is split into a grid of square tiles
+    anchored at its top left corner. Each tile is resampled from the pyramid once and kept
+    in the tile cache, so when the view is panned only the tiles newly exposed at the edges
+    have to be rendered, and the rest are pasted straight from the cache.
+
+    Tiles come in two qualities. Preview tiles are cheap nearest neighbour resamples from a
+    coarser pyramid level, used while the view is being dragged or zoomed, and full tiles
+    are proper resamples, which can be filled in a few at a time once the view is still.
+
+    Attributes:
+        pyramid (ImagePyramid): The image pyramid to render from.
+        cache (TileCache): The cache the rendered tiles are stored in.
+        tile_size (int): The edge length of a tile in screen pixels.
+        preview_coarser (int): How many pyramid levels coarser preview tiles are taken from.
+
+    Methods:
+        __init__: Initializes the renderer with a pyramid and a tile cache.
+        render: Returns the visible region of the image at a given scale.
+        refine: Renders some of the missing full quality tiles of a region.
+        get_tiles: Returns the tile grid positions covering a region.
+        render_tile: Resamples a single tile from the pyramid.
+    """
+
+    def __init__(self, pyramid, cache, tile_size=256, preview_coarser=1):
+
+        self.pyramid = pyramid
+        self.cache = cache
+        self.tile_size = tile_size
+        self.preview_coarser = preview_coarser
+        self.complete = True  # whether the last render only used full quality tiles
+
+    def render(self, scale, region, preview=False):
+
+        # region is (x1, y1, x2, y2) in screen pixels relative to the image top left corner
+        x1, y1 = int(region[0]), int(region[1])
+        x2, y2 = int(region[2]), int(region[3])
+
+        view = Image.new(self.pyramid.image.mode, (x2 - x1, y2 - y1))
+
+        size = self.tile_size
+        self.complete = True
+
+        for tx, ty in self.get_tiles(region):
+
+            key = (scale, tx, ty, "full")
+
+            # previews still use full quality tiles when they are already cached
+            if preview and not self.cache.contains(key):
+                key = (scale, tx, ty, "preview")
+                self.complete = False
+
+            tile = self.cache.get(key)
+
+            if tile is None:
+                tile = self.render_tile(scale, tx, ty, preview=key[3] == "preview")
+                self.cache.put(key, tile)
+
+            view.paste(tile, (tx * size - x1, ty * size - y1))
+
+        return view
+
+    def refine(self, scale, region, max_tiles):
+
+        rendered = 0
+
+        for tx, ty in self.get_tiles(region):
+
+            key = (scale, tx, ty, "full")
+
+            if self.cache.contains(key):
+                continue
+
+            if rendered == max_tiles:
+                return False
+
+            self.cache.put(key, self.render_tile(scale, tx, ty))
+            rendered += 1
+
+        return True
+
+    def get_tiles(self, region):
+
+        size = self.tile_size
+
+        x1, y1 = int(region[0]), int(region[1])
+        x2, y2 = int(region[2]), int(region[3])
+
+        return [(tx, ty) for ty in range(y1 // size, math.ceil(y2 / size))
+                         for tx in range(x1 // size, math.ceil(x2 / size))]
+
+    def render_tile(self, scale, tx, ty, preview=False):
+
+        size = self.tile_size
+
+        # tiles along the right and bottom edges are cut short by the image border
+        x0 = tx * size
+        y0 = ty * size
+        x1 = min((tx + 1) * size, self.pyramid.width * scale)
+        y1 = min((ty + 1) * size, self.pyramid.height * scale)
+
+        tile_width = max(math.ceil(x1) - x0, 1)
+        tile_height = max(math.ceil(y1) - y0, 1)
+
+        box = (x0 / scale, y0 / scale, x1 / scale, y1 / scale)
+
+        if preview:
+            return self.pyramid.render(box, (tile_width, tile_height), Image.NEAREST, self.preview_coarser)
+
+        return self.pyramid.render(box, (tile_width, tile_height))
+
+def tile_nbytes(tile):
+    """
+    Estimates the memory used by the pixel data of a tile.
+
+    Args:
+        tile (PIL.Image): The tile image.
+
+    Returns:
+        int: The approximate size of the tile in bytes.
+    """
+
+    return tile.width * tile.height * MODE_BYTES.get(tile.mode, 4)
@@ -0,0 +1,270 @@
+import os
+import csv
+import copy
+import time
+import datetime
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image
+
+from . import parse
+from . import export
+from .enums import Eye
+from .util_func import define_parameters, get_base_name, set_max_pixels
+
+SUMMARY_HEADER = ("Image", "Eye", "Status", "Crops", "Modalities", "Seconds", "Output", "Error")
+
+def read_manifest(manifest_path):
+    """
+    Reads a batch manifest listing the subjects to export.
+
+    The manifest is a CSV file with the columns image_path, eye, mpp, axial_length and
+    crop_csv. The mpp and axial_length columns may be left empty to use the config values,
+    and relative paths are taken relative to the manifest.
+
+    Args:
+        manifest_path (str): The path to the manifest CSV.
+
+    Returns:
+        list of dict: One subject per row of the manifest.
+    """
+
+    root = os.path.dirname(os.path.abspath(manifest_path))
+    subjects = []
+
+    with open(manifest_path, newline='') as csvFile:
+
+        for row in csv.DictReader(csvFile):
+
+            subjects.append({
+                "image_path" : os.path.join(root, row["image_path"].strip()),
+                "eye" : parse.eye(row["eye"].strip()),
+                "mpp" : float(row["mpp"]) if row.get("mpp", "").strip() else None,
+                "axial_length" : float(row["axial_length"]) if row.get("axial_length", "").strip() else None,
+                "crop_csv" : os.path.join(root, row["crop_csv"].strip())
+                })
+
+    return subjects
+
+def discover_subjects(study_root):
+    """
+    Finds every previously cropped subject below a study root folder.
+
+    A subject is any folder holding an ao_crops output with a crop_location_data.csv. The
+    most recent output is used, and the image is picked from the tiffs sharing the base name
+    of the session (see find_session_image), so stray tiffs in the folder are ignored. Folders
+    holding several subjects that can't be told apart are skipped and reported. The eye is
+    taken from an OD or OS part of the image file name, and mpp and axial length come from
+    the config file.
+
+    Args:
+        study_root (str): The folder containing the subject folders.
+
+    Returns:
+        list of dict: One subject per folder found, in folder name order.
+    """
+
+    subjects = []
+
+    for folder, folder_names, file_names in os.walk(study_root):
+
+        outputs = sorted(name for name in folder_names if name.startswith("ao_crops_") and not name.endswith(".partial"))
+        outputs = [name for name in outputs if os.path.isfile(folder + "//" + name + "//crop_location_data.csv")]
+        tiffs = sorted(name for name in file_names if name.endswith(".tif"))
+
+        # don't walk through the exported crops themselves
+        folder_names[:] = sorted(name for name in folder_names if not name.startswith("ao_crops_"))
+
+        if not outputs or not tiffs:
+            continue
+
+        image, problem = find_session_image(tiffs, folder + "//" + outputs[-1])
+
+        if image is None:
+            print("Skipping " + folder + ": " + problem)
+            continue
+
+        # the eye is the first OD/OS part of the image name
+        eyes = [part for part in image[:-4].split("_") if part in Eye.__members__]
+
+        if not eyes:
+            print("Skipping " + folder + ": no OD or OS in the image name")
+            continue
+
+        subjects.append({
+            "image_path" : folder + "//" + image,
+            "eye" : Eye[eyes[0]],
+            "mpp" : None,
+            "axial_length" : None,
+            "crop_csv" : folder + "//" + outputs[-1] + "//crop_location_data.csv"
+            })
+
+    subjects.sort(key=lambda subject: subject["image_path"])
+
+    return subjects
+
+def find_session_image(tiffs, output_folder):
+    """
+    Picks the image a previous session was cropped from, out of the tiffs in its folder.
+
+    The tiffs are grouped by base name, as the modalities of an image share it. The canvases
+    of the output are named after the subject ID, eye and modality of the session, so the
+    group they match best is the session's. Without canvases to go by, a folder with a
+    single base name is used as it is.
+
+    Args:
+        tiffs (list of str): The names of the tiffs in the subject folder.
+        output_folder (str): The folder of the export being redone.
+
+    Returns:
+        tuple: A tuple containing:
+            - image (str or None): The name of the image, or None if it can't be told.
+            - problem (str or None): Why no image was picked.
+    """
+
+    groups = {}
+
+    for tiff in sorted(tiffs):
+        base_name, modality = get_base_name(tiff)
+        groups.setdefault(base_name, []).append(modality)
+
+    # canvases are saved as <id>_<eye>_crop_locations_<modality>.tif
+    canvas_folder = output_folder + "//Canvases"
+    canvases = os.listdir(canvas_folder) if os.path.isdir(canvas_folder) else []
+    sessions = set()
+
+    for canvas in canvases:
+        if "_crop_locations_" in canvas and canvas.endswith(".tif") and not canvas.endswith("_overview.tif"):
+            prefix, modality = canvas[:-4].split("_crop_locations_", 1)
+            sessions.add((prefix + "_", modality))
+
+    if sessions:
+
+        # how many of the exported modalities each group of tiffs holds
+        scores = {base_name: sum(1 for prefix, modality in sessions if base_name.startswith(prefix) and modality in modalities)
+                  for base_name, modalities in groups.items()}
+        best = max(scores.values())
+        matches = [base_name for base_name, score in scores.items() if score == best]
+
+        if best == 0:
+            return None, "no tiffs match the subject of " + os.path.basename(output_folder)
+
+    else:
+        matches = list(groups)
+
+    if len(matches) > 1:
+        return None, "several subjects in one folder (" + ", ".join(matches) + ")"
+
+    base_name = matches[0]
+
+    return base_name + groups[base_name][0] + ".tif", None
+
+def export_subject(subject, settings):
+    """
+    Re-exports a single subject, catching any failure so the rest of the batch carries on.
+
+    Args:
+        subject (dict): A subject from read_manifest or discover_subjects.
+        settings (dict): Settings from the config file.
+
+    Returns:
+        dict: A summary of the export keyed by the SUMMARY_HEADER columns.
+    """
+
+    start = time.perf_counter()
+
+    summary = {
+        "Image" : subject["image_path"],
+        "Eye" : subject["eye"].name,
+        "Status" : "failed",
+        "Crops" : 0,
+        "Modalities" : 0,
+        "Seconds" : 0,
+        "Output" : "",
+        "Error" : ""
+        }
+
+    try:
+
+        # per subject scaling overrides the config defaults
+        subject_settings = copy.deepcopy(settings)
+        subject_settings["export"]["workers"] = 1
+
+        if subject["mpp"] is not None:
+            subject_settings["units"]["mpp"] = parse.mpp(subject["mpp"])
+        if subject["axial_length"] is not None:
+            subject_settings["units"]["axial_length"] = parse.axial_length(subject["axial_length"])
+
+        image_path = parse.path(subject["image_path"])
+        parameters = define_parameters(image_path, subject["eye"], subject_settings)
+
+        crops, crosshair = export.load_session(subject["crop_csv"], parameters, subject_settings)
+
+        output_folder = parameters["folder"] + "//" + "ao_crops_" + datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+        task = export.ExportTask(output_folder, crops, crosshair, parameters, subject_settings)
+        task.run()
+
+        if task.error is not None:
+            raise task.error
+
+        summary["Status"] = "ok"
+        summary["Crops"] = len(crops)
+        summary["Modalities"] = len(parameters["modalities"])
+        summary["Output"] = output_folder
+
+    except Exception as e:
+
+        summary["Error"] = repr(e)
+
+    summary["Seconds"] = round(time.perf_counter() - start, 2)
+
+    return summary
+
+def run_batch(subjects, settings, workers):
+    """
+    Exports every subject, in parallel across a pool of worker processes.
+
+    Args:
+        subjects (list of dict): The subjects to export.
+        settings (dict): Settings from the config file.
+        workers (int): The maximum number of worker processes.
+
+    Returns:
+        list of dict: The export summaries, in the same order as the subjects.
+    """
+
+    workers = max(min(workers, len(subjects)), 1)
+
+    # spawned workers start with PIL's default pixel limit, so they are given this process's
+    with ProcessPoolExecutor(max_workers=workers, initializer=set_max_pixels, initargs=(Image.MAX_IMAGE_PIXELS,)) as pool:
+
+        futures = [pool.submit(export_subject, subject, settings) for subject in subjects]
+        summaries = []
+
+        for subject, future in zip(subjects, futures):
+
+            # a worker that dies outright still only fails its own subject
+            try:
+                summary = future.result()
+            except Exception as e:
+                summary = {"Image" : subject["image_path"], "Eye" : subject["eye"].name, "Status" : "failed", "Error" : repr(e)}
+
+            print(summary["Image"] + ": " + summary["Status"])
+            summaries.append(summary)
+
+    return summaries
+
+def write_summary(summary_path, summaries):
+    """
+    Writes the per-subject timing and success summary of a batch to a CSV file.
+
+    Args:
+        summary_path (str): The path of the summary CSV.
+        summaries (list of dict): The summaries returned by run_batch.
+    """
+
+    with open(summary_path, "w", newline='') as csvFile:
+        writer = csv.DictWriter(csvFile, fieldnames=SUMMARY_HEADER, restval="")
+        writer.writeheader()
+        writer.writerows(summaries)
+
+    print("Batch summary saved to " + summary_path)
@@ -0,0 +1,822 @@
+import os
+import ast
+import csv
+import copy
+import time
+import queue
+import shutil
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image, ImageDraw, ImageFont
+
+from ..assets.crop_box import CropBox
+from ..assets.crop_store import CropStore
+from ..assets.crosshair import Crosshair
+from ..imaging.extraction import extract_crops
+from ..imaging.pyramid import SIXTEEN_BIT_MODES
+from ..imaging.tiff_reader import open_reader
+from ..imaging.tiff_writer import TiledTiffWriter
+from . import incremental
+from . import profiling
+from .enums import Eye
+from .util_func import set_max_pixels
+
+# grey levels kept in palette canvases, leaving the rest of the palette for annotation colours
+PALETTE_GREYS = 254
+
+LOCATIONS_HEADER = ("Crop Number", "CoordV (°)", "MeridianV", "CoordH (°)", "MeridianH", "Distance (°)", "Distance (um)", "Centre Pixel (x)", "Centre Pixel (y)")
+
+class ExportCancelled(Exception):
+    """
+    Raised inside an export when the operator has asked for it to be cancelled.
+    """
+
+def create_results_folders(output_folder, modalities):
+    """
+    Creates the output folder with a crops subfolder per modality and a canvases folder.
+
+    Args:
+        output_folder (str): The path of the main output folder.
+        modalities (list of str): The modalities that will be exported.
+
+    Returns:
+        tuple: A tuple containing:
+            - crops_folder (str): The folder containing a subfolder for each modality.
+            - canvas_folder (str): The folder for the canvases showing the crop locations.
+    """
+
+    os.makedirs(output_folder)
+
+    # folder to store the crop tifs
+    crops_folder = output_folder + "//Crops"
+    os.makedirs(crops_folder)
+
+    # folder to store the canvases displaying the crop locations
+    canvas_folder = output_folder + "//Canvases"
+    os.makedirs(canvas_folder)
+
+    # folders for each modality within the crops folder
+    for modality in modalities:
+        os.makedirs(crops_folder + "//" + modality)
+
+    return crops_folder, canvas_folder
+
+def create_locations_csv(output_folder, crops):
+    """
+    Writes the location data of every crop to crop_location_data.csv.
+
+    The header is kept as it has always been written, the whole of LOCATIONS_HEADER in a
+    single cell, so existing scripts reading these files keep working. read_locations_csv
+    also accepts a header with one cell per column.
+
+    Args:
+        output_folder (str): The path of the main output folder.
+        crops (list of CropBox): The crops to record.
+    """
+
+    csv_path = output_folder + "//" + "crop_location_data.csv"
+    header = [LOCATIONS_HEADER]
+    location_data = [crop.get_location_data() for crop in crops]
+
+    # utf-8 so the degree signs in the header read back the same on every platform
+    with open(csv_path, "w", newline='', encoding="utf-8") as csvFile:
+        writer = csv.writer(csvFile)
+        writer.writerow(header)
+        writer.writerows(location_data)
+
+    print("Crop location data CSV saved")
+
+def read_locations_csv(csv_path):
+    """
+    Reads back the crop location data written by create_locations_csv.
+
+    The header is written as a single cell holding the whole tuple, but may have been split
+    into columns by hand, and older files may not be utf-8 encoded, so columns are matched by
+    name where possible and otherwise by their standard position.
+
+    Args:
+        csv_path (str): The path to a crop_location_data.csv file.
+
+    Returns:
+        list of dict: One dictionary per crop, keyed by the LOCATIONS_HEADER column names.
+    """
+
+    with open(csv_path, newline='', encoding="utf-8", errors="replace") as csvFile:
+        rows = [row for row in csv.reader(csvFile) if row]
+
+    header = rows[0]
+
+    if len(header) == 1 and header[0].startswith("("):
+        header = list(ast.literal_eval(header[0]))
+
+    columns = {}
+
+    for position, name in enumerate(LOCATIONS_HEADER):
+        columns[name] = header.index(name) if name in header else position
+
+    locations = []
+
+    for row in rows[1:]:
+
+        location = {name : row[i] for name, i in columns.items()}
+
+        for name in LOCATIONS_HEADER:
+            if name == "Crop Number":
+                location[name] = int(location[name])
+            elif not name.startswith("Meridian"):
+                location[name] = float(location[name])
+
+        locations.append(location)
+
+    return locations
+
+def find_foveal_centre(locations, eye):
+    """
+    Recovers the foveal centre that a set of crop locations was measured from.
+
+    Each crop's signed offset from the centre, in pixels, follows from its ophthalmic
+    coordinates and the pixels per degree the file was written with (the ratio of the two
+    distance columns), so this does not depend on the current config values.
+
+    Args:
+        locations (list of dict): Crop locations from read_locations_csv.
+        eye (Eye): The eye in the image.
+
+    Returns:
+        tuple: The (x, y) absolute pixel coordinates of the foveal centre.
+    """
+
+    centres = []
+
+    for location in locations:
+
+        distance_pix = location["Distance (um)"]
+        distance_deg = location["Distance (°)"]
+
+        # a crop exactly on the centre gives the centre directly
+        if distance_deg == 0:
+            centres.append((location["Centre Pixel (x)"], location["Centre Pixel (y)"]))
+            continue
+
+        ppd = distance_pix / distance_deg
+
+        x_degrees = location["CoordH (°)"] * (1 if location["MeridianH"] == "N" else -1)
+        y_degrees = location["CoordV (°)"] * (1 if location["MeridianV"] == "I" else -1)
+
+        # undo the flip of the x coordinate for the left eye
+        if eye == Eye.OS:
+            x_degrees = x_degrees * (-1)
+
+        centres.append((location["Centre Pixel (x)"] - (x_degrees * ppd),
+                        location["Centre Pixel (y)"] - (y_degrees * ppd)))
+
+    if not centres:
+        raise ValueError("No crop locations to find the foveal centre from")
+
+    x_centre = sum(c[0] for c in centres) / len(centres)
+    y_centre = sum(c[1] for c in centres) / len(centres)
+
+    return (x_centre, y_centre)
+
+def load_session(csv_path, parameters, settings):
+    """
+    Rebuilds the crops and foveal centre of a session from its crop_location_data.csv.
+
+    Args:
+        csv_path (str): The path to a crop_location_data.csv file.
+        parameters (dict): User parameters for the image being exported.
+        settings (dict): Settings from the config file.
+
+    Returns:
+        tuple: A tuple containing:
+            - crops (list of CropBox): The crops, located relative to the foveal centre.
+            - crosshair (Crosshair): The foveal centre crosshair.
+    """
+
+    locations = read_locations_csv(csv_path)
+    centre = find_foveal_centre(locations, parameters["eye"])
+
+    # absolute coordinates are canvas coordinates at a scale of 1 with no offset
+    crosshair = Crosshair(coordinates=centre,
+                          top_left=(0, 0),
+                          scale=1.0,
+                          parameters=parameters,
+                          settings=settings["crosshair"])
+
+    crops = []
+    store = CropStore(parameters["ppd"], parameters["eye"])
+
+    # the store needs crops in order of increasing ID
+    for location in sorted(locations, key=lambda location: location["Crop Number"]):
+
+        crop = CropBox(ID=location["Crop Number"],
+                       coordinates=(location["Centre Pixel (x)"], location["Centre Pixel (y)"]),
+                       top_left=(0, 0),
+                       scale=1.0,
+                       parameters=parameters,
+                       settings=settings["crop_box"])
+
+        store.add(crop)
+        crops.append(crop)
+
+    # locate every crop in relation to the foveal centre at once
+    store.relocate(crosshair.get_abs_location())
+
+    return crops, crosshair
+
+def create_lut(output_folder, id_number, mpp):
+    """
+    Writes the look-up table of subject ID and microns per pixel to LUT.csv.
+
+    Args:
+        output_folder (str): The path of the main output folder.
+        id_number (str): The subject ID.
+        mpp (float): Microns per pixel.
+    """
+
+    lut_data = (id_number, mpp)
+    lut_path = output_folder + "//" + "LUT.csv"
+
+    with open(lut_path, "w") as csvFile:
+        writer = csv.writer(csvFile)
+        writer.writerow(lut_data)
+
+    print("LUT.csv saved")
+
+def create_canvas_tiff(modality_path, crosshair, mode="rgba", scale=1.0):
+    """
+    Creates a colour copy of a modality image with the foveal centre stamped on it.
+
+    In "rgba" mode the canvas is a full colour copy of the image (4 bytes per pixel). In
+    "palette" mode it is a palette image (1 byte per pixel) holding the grey levels of the
+    image plus the annotation colours, which keeps memory close to the size of the source.
+    The canvas can also be downsampled to give a smaller overview of the crop locations.
+
+    Args:
+        modality_path (str): The path to the modality image.
+        crosshair (Crosshair): The foveal centre crosshair.
+        mode (str): Either "rgba" or "palette".
+        scale (float): The size of the canvas relative to the modality image.
+
+    Returns:
+        tuple: A tuple containing:
+            - canvas_colour (PIL.Image): The colour canvas image.
+            - draw_canvas (PIL.ImageDraw): A draw object for stamping onto the canvas.
+    """
+
+    with profiling.span("create_canvas_tiff", mode=mode, scale=scale):
+
+        canvas_grey = Image.open(modality_path)
+
+        if scale != 1.0:
+            size = (max(int(round(canvas_grey.width * scale)), 1), max(int(round(canvas_grey.height * scale)), 1))
+
+            # PIL can't box filter 16 bit images, 32 bit ones keep the same grey levels
+            if canvas_grey.mode in SIXTEEN_BIT_MODES:
+                canvas_grey = canvas_grey.convert("I")
+
+            canvas_grey = canvas_grey.resize(size, Image.BOX)
+
+        if mode == "palette":
+            canvas_colour = palette_canvas(canvas_grey)
+        elif mode == "rgba":
+            canvas_colour = Image.new("RGBA", canvas_grey.size)
+            canvas_colour.paste(canvas_grey)
+        else:
+            raise ValueError("Canvas mode should be rgba or palette, not " + str(mode))
+
+        del canvas_grey
+
+    draw_canvas = ImageDraw.Draw(canvas_colour)
+
+    draw_canvas = crosshair.stamp(draw_canvas, scale)
+
+    return canvas_colour, draw_canvas
+
+def palette_canvas(canvas_grey):
+    """
+    Converts a greyscale image to a palette image with room left for annotation colours.
+
+    The grey levels are squeezed into the first PALETTE_GREYS palette entries, so the
+    remaining entries are free for the crop box and crosshair colours to be added as they
+    are drawn.
+
+    Args:
+        canvas_grey (PIL.Image): The greyscale image.
+
+    Returns:
+        PIL.Image: The palette image.
+    """
+
+    if canvas_grey.mode != "L":
+        canvas_grey = canvas_grey.convert("L")
+
+    lut = [round(v * (PALETTE_GREYS - 1) / 255) for v in range(256)]
+    palette = [round(i * 255 / (PALETTE_GREYS - 1)) for i in range(PALETTE_GREYS) for _ in range(3)]
+
+    canvas_palette = canvas_grey.point(lut)
+    canvas_palette.putpalette(palette)
+
+    return canvas_palette
+
+def create_overview_tiff(modality_path, crops, crosshair, mode, scale, font_size):
+    """
+    Creates a downsampled canvas with the foveal centre and every crop stamped on it.
+
+    Args:
+        modality_path (str): The path to the modality image.
+        crops (list of CropBox): The crops to stamp.
+        crosshair (Crosshair): The foveal centre crosshair.
+        mode (str): Either "rgba" or "palette".
+        scale (float): The size of the overview relative to the modality image.
+        font_size (int): The full size font size for the crop numbers.
+
+    Returns:
+        PIL.Image: The overview image.
+    """
+
+    font = ImageFont.truetype("arial.ttf", max(int(round(font_size * scale)), 1))
+
+    overview, overview_draw = create_canvas_tiff(modality_path, crosshair, mode, scale)
+
+    for crop in crops:
+        overview_draw = crop.stamp(overview_draw, font, scale)
+
+    return overview
+
+def write_tiled_canvas(modality_path, canvas_path, crops, crosshair, font, tile_size, levels):
+    """
+    Streams an annotated canvas to a tiled BigTIFF, one band of rows at a time.
+
+    Each band is read from the modality image, coloured, and stamped with only the crop
+    boxes and crosshair lines that overlap it. Reduced-resolution copies are written as
+    sub-IFDs. Peak memory is only bounded by the band height, rather than the size of the
+    image, when the modality can be memory-mapped by the TiffReader (uncompressed tiffs).
+    Compressed or otherwise unsupported tiffs fall back to the PilReader, which decodes
+    the whole image on the first band and keeps it until the canvas is written.
+
+    Args:
+        modality_path (str): The path to the modality image.
+        canvas_path (str): The path to save the canvas tiff to.
+        crops (list of CropBox): The crops to stamp.
+        crosshair (Crosshair): The foveal centre crosshair.
+        font (PIL.ImageFont): The font for the crop numbers on the canvas.
+        tile_size (int): The edge length of the tiles, which is also the band height.
+        levels (int): The number of reduced-resolution levels to write.
+    """
+
+    # room around a crop box for its outline and number
+    margin = font.size + 40 if hasattr(font, "size") else 100
+    crosshair_x, crosshair_y = crosshair.get_abs_location()
+
+    with open_reader(modality_path) as reader:
+
+        width, height = reader.size
+
+        with TiledTiffWriter(canvas_path, (width, height), "RGB", tile_size, levels) as writer:
+
+            for y0 in range(0, height, tile_size):
+
+                y1 = min(y0 + tile_size, height)
+
+                band = reader.crop((0, y0, width, y1))
+
+                if band.mode not in ("L", "RGB"):
+                    band = band.convert("L")
+
+                band = band.convert("RGB")
+                draw_band = ImageDraw.Draw(band)
+
+                if crosshair_y - 10000 - 4 < y1 and crosshair_y + 10000 + 4 > y0:
+                    crosshair.stamp(draw_band, offset=(0, y0))
+
+                for crop in crops:
+
+                    crop_y0, crop_y1 = crop.get_crop_corners()[1::2]
+
+                    if crop_y0 - margin < y1 and crop_y1 + margin > y0:
+                        crop.stamp(draw_band, font, offset=(0, y0))
+
+                writer.write_band(band)
+
+def create_crop_tiffs(modality, modality_path, crops, crops_folder, canvas, font, progress=None, cancel=None):
+    """
+    Saves a tiff of every crop from one modality and stamps the crops onto its canvas.
+
+    Args:
+        modality (str): The name of the modality.
+        modality_path (str): The path to the modality image.
+        crops (list of CropBox): The crops to save.
+        crops_folder (str): The folder containing a subfolder for each modality.
+        canvas (PIL.ImageDraw or None): A draw object for the canvas of this modality, or
+            None if the canvas is drawn separately.
+        font (PIL.ImageFont): The font for the crop numbers on the canvas.
+        progress (queue.Queue, optional): Receives ("crop", modality) after each crop is saved.
+        cancel (threading.Event, optional): Stops the export with ExportCancelled once set.
+
+    Returns:
+        PIL.ImageDraw: The draw object with every crop stamped on.
+    """
+
+    # create tifs of every crop location in one pass over the current modality
+    for crop, image, filename in extract_crops(modality, modality_path, crops):
+
+        if cancel is not None and cancel.is_set():
+            raise ExportCancelled()
+
+        with profiling.span("tiff_encode", crop=crop.get_ID()):
+            image.save(crops_folder + "/" + modality + "/" + filename)
+
+        print(filename + " saved")
+
+        if progress is not None:
+            progress.put(("crop", modality))
+
+        # stamp each crop location on to the draw object canvas for this modality
+        if canvas is not None:
+            canvas = crop.stamp(canvas, font)
+
+    return canvas
+
+def export_modality(job, progress=None, cancel=None):
+    """
+    Writes the crop tiffs and the crop location canvas for a single modality.
+
+    This is the unit of work handed to the export worker processes, so everything it
+    needs is passed in the job dictionary and the font is loaded inside the worker.
+
+    Args:
+        job (dict): A dictionary containing:
+            modality (str): The name of the modality.
+            modality_path (str): The path to the modality image.
+            crops (list of CropBox): The crops to save.
+            crosshair (Crosshair): The foveal centre crosshair.
+            crops_folder (str): The folder containing a subfolder for each modality.
+            canvas_path (str): The path to save the canvas tiff to.
+            font_size (int): The font size for the crop numbers on the canvas.
+            canvas (dict): The canvas settings from the config file, with the canvas mode,
+                the scale of the overview canvas (0 for no overview), and the tile size and
+                number of reduced-resolution levels for tiled canvases.
+            new_crops (list of CropBox, optional): The crops to write tiffs for, if not all
+                of them, for incremental exports.
+            write_canvas (bool, optional): Whether to draw the canvas, True by default.
+        progress (queue.Queue, optional): Receives a message after each crop and modality.
+        cancel (threading.Event, optional): Stops the export with ExportCancelled once set.
+
+    Returns:
+        dict: A summary of the export containing the modality, crop count and time taken.
+    """
+
+    if cancel is not None and cancel.is_set():
+        raise ExportCancelled()
+
+    # worker processes record their own spans, which are handed back with the result
+    if job.get("profile"):
+        profiling.enable()
+
+    first_event = profiling.PROFILER.count
+    start = time.perf_counter()
+
+    font = ImageFont.truetype("arial.ttf", job["font_size"])
+
+    canvas_mode = job["canvas"]["mode"]
+    overview_scale = job["canvas"]["overview_scale"]
+
+    # overviews are small enough to be drawn in memory, so tiled canvases get a full colour one
+    overview_mode = "rgba" if canvas_mode == "tiled" else canvas_mode
+
+    # incremental exports may only need some of the crops written, or no new canvas
+    new_crops = job.get("new_crops", job["crops"])
+    write_canvas = job.get("write_canvas", True)
+
+    if not write_canvas:
+
+        create_crop_tiffs(job["modality"], job["modality_path"], new_crops, job["crops_folder"], None, font, progress, cancel)
+
+    elif canvas_mode == "tiled":
+
+        # the canvas is streamed band by band after the crops, instead of held in memory
+        create_crop_tiffs(job["modality"], job["modality_path"], new_crops, job["crops_folder"], None, font, progress, cancel)
+        with profiling.span("write_tiled_canvas"):
+            write_tiled_canvas(job["modality_path"], job["canvas_path"], job["crops"], job["crosshair"], font,
+                               job["canvas"]["tile_size"], job["canvas"]["levels"])
+
+    else:
+
+        canvas_tiff, canvas_draw = create_canvas_tiff(job["modality_path"], job["crosshair"], canvas_mode)
+        create_crop_tiffs(job["modality"], job["modality_path"], new_crops, job["crops_folder"], canvas_draw, font, progress, cancel)
+
+        # crops that were already exported still belong on the canvas
+        if new_crops is not job["crops"]:
+
+            written = set(crop.get_ID() for crop in new_crops)
+
+            for crop in job["crops"]:
+                if crop.get_ID() not in written:
+                    canvas_draw = crop.stamp(canvas_draw, font)
+
+        with profiling.span("canvas_encode", mode=canvas_mode):
+            canvas_tiff.save(job["canvas_path"])
+
+        # free the full size canvas before making the overview
+        del canvas_tiff, canvas_draw
+
+    if write_canvas:
+        print(os.path.basename(job["canvas_path"]) + " saved")
+
+    if write_canvas and overview_scale:
+        overview_path = job["canvas_path"][:-4] + "_overview.tif"
+        with profiling.span("create_overview_tiff"):
+            overview = create_overview_tiff(job["modality_path"], job["crops"], job["crosshair"], overview_mode, overview_scale, job["font_size"])
+            overview.save(overview_path)
+        print(os.path.basename(overview_path) + " saved")
+
+    if progress is not None:
+        progress.put(("modality", job["modality"]))
+
+    end = time.perf_counter()
+    profiling.PROFILER.add("export_modality", start, end, {"modality" : job["modality"]})
+
+    result = {
+        "modality" : job["modality"],
+        "crops" : len(new_crops),
+        "seconds" : end - start,
+        "trace" : profiling.PROFILER.get_events(first_event)
+        }
+
+    return result
+
+def export_modalities(jobs, workers, progress=None, cancel=None):
+    """
+    Exports several modalities, in parallel across a pool of worker processes if allowed.
+
+    Args:
+        jobs (list of dict): One export_modality job for each modality.
+        workers (int): The maximum number of worker processes. With 1 (or a single job)
+            everything runs in the current process.
+        progress (queue.Queue, optional): Receives a message after each crop and modality.
+            Must be a multiprocessing manager queue when more than one worker is used.
+        cancel (threading.Event, optional): Stops the export with ExportCancelled once set.
+            Must be a multiprocessing manager event when more than one worker is used.
+
+    Returns:
+        list of dict: The export summaries, in the same order as the jobs.
+    """
+
+    workers = min(workers, len(jobs))
+
+    if workers <= 1:
+        return [export_modality(job, progress, cancel) for job in jobs]
+
+    # spawned workers start with PIL's default pixel limit, so they are given this process's
+    with ProcessPoolExecutor(max_workers=workers, initializer=set_max_pixels, initargs=(Image.MAX_IMAGE_PIXELS,)) as pool:
+
+        futures = [pool.submit(export_modality, job, progress, cancel) for job in jobs]
+
+        # collect in submission order so the results are deterministic
+        results = [future.result() for future in futures]
+
+    return results
+
+class ExportTask:
+    """
+    A complete save of crops, canvases, location data and LUT, runnable off the gui thread.
+
+    Everything is written into a temporary ".partial" folder next to the output folder,
+    which is only renamed to the output folder once the whole export has finished. If the
+    export is cancelled or fails, the partial folder is removed so no half-written output
+    is left behind. The crops and crosshair are copied when the task is created, so the
+    session can carry on being edited while the export runs.
+
+    Incremental exports instead update the same output folder every time, using a manifest
+    of the last export to only write new or moved crops, delete removed ones and redraw
+    canvases that have changed. The manifest is only replaced once an export finishes, so
+    an interrupted incremental export is simply picked up again by the next one.
+
+    Attributes:
+        output_folder (str): The folder the export is written to.
+        crops (list of CropBox): The crops to export.
+        crosshair (Crosshair): The foveal centre crosshair.
+        parameters (dict): User parameters.
+        settings (dict): Settings from the config file.
+
+    Methods:
+        __init__: Prepares the export and its progress counters.
+        define_jobs: Returns an export_modality job for every modality.
+        start: Runs the export in a background thread.
+        run: Runs the export in the current thread.
+        run_full: Writes a complete export into a new folder.
+        run_incremental: Updates an existing export with only what has changed.
+        cancel: Asks a running export to stop and clean up.
+        poll: Updates the progress counters from the worker messages.
+        is_running: Returns whether the export is still in progress.
+        join: Waits for a background export to finish, including its cleanup.
+        get_progress: Returns the crops and modalities done and the throughput.
+    """
+
+    def __init__(self, output_folder, crops, crosshair, parameters, settings):
+
+        self.output_folder = output_folder
+        self.partial_folder = output_folder + ".partial"
+        self.crops = copy.deepcopy(list(crops))
+        self.crosshair = copy.deepcopy(crosshair)
+        self.parameters = parameters
+        self.settings = settings
+
+        self.modalities = list(parameters["modalities"])
+        self.workers = settings["export"]["workers"]
+        self.incremental = settings["export"].get("incremental", False)
+
+        self.crops_total = len(self.crops) * len(self.modalities)
+        self.modalities_total = len(self.modalities)
+        self.crops_done = 0
+        self.modalities_done = 0
+
+        self.start_time = None
+        self.end_time = None
+        self.thread = None
+        self.finished = False
+        self.cancelled = False
+        self.error = None
+        self.results = []
+        self.lock = threading.Lock()
+
+        # worker processes need manager proxies, a single process can use plain objects
+        if min(self.workers, self.modalities_total) > 1:
+            self.manager = multiprocessing.Manager()
+            self.progress = self.manager.Queue()
+            self.cancel_event = self.manager.Event()
+        else:
+            self.manager = None
+            self.progress = queue.Queue()
+            self.cancel_event = threading.Event()
+
+    def define_jobs(self, crops_folder, canvas_folder):
+
+        p = self.parameters
+        jobs = []
+
+        for modality in self.modalities:
+
+            canvas_tiff_name = p["id_number"] + "_" + p["eye"].name + "_crop_locations_" + modality + ".tif"
+
+            jobs.append({
+                "modality" : modality,
+                "modality_path" : p["folder"] + "/" + p["base_name"] + modality + ".tif",
+                "crops" : self.crops,
+                "crosshair" : self.crosshair,
+                "crops_folder" : crops_folder,
+                "canvas_path" : canvas_folder + "//" + canvas_tiff_name,
+                "font_size" : self.settings["text"]["font_size"],
+                "canvas" : self.settings["canvas"],
+                "profile" : profiling.is_enabled()
+                })
+
+        return jobs
+
+    def start(self):
+
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+
+        print("Saving crops as tiffs...")
+
+        self.start_time = time.perf_counter()
+        first_event = profiling.PROFILER.count
+
+        try:
+
+            if self.incremental:
+                self.run_incremental()
+            else:
+                self.run_full()
+
+            print("Saving complete!")
+
+        except ExportCancelled:
+
+            self.cancelled = True
+            print("Saving cancelled.")
+
+        except Exception as e:
+
+            self.error = e
+            print("Error: Saving failed - " + str(e))
+
+        finally:
+
+            # spans recorded by the worker processes join the ones recorded here
+            for result in self.results:
+                profiling.PROFILER.merge(result.get("trace", []))
+
+            profiling.PROFILER.add("export", self.start_time, time.perf_counter(),
+                                   {"crops" : len(self.crops), "modalities" : len(self.modalities), "incremental" : self.incremental})
+
+            if os.path.isdir(self.partial_folder):
+                shutil.rmtree(self.partial_folder, ignore_errors=True)
+
+            if self.manager is not None:
+                self.poll()
+                self.manager.shutdown()
+
+            self.end_time = time.perf_counter()
+            self.finished = True
+
+    def run_full(self):
+
+        crops_folder, canvas_folder = create_results_folders(self.partial_folder, self.modalities)
+        create_locations_csv(self.partial_folder, self.crops)
+
+        # create crops/canvases for every modality found in the original folder
+        jobs = self.define_jobs(crops_folder, canvas_folder)
+        self.results = export_modalities(jobs, self.workers, self.progress, self.cancel_event)
+
+        create_lut(self.partial_folder, self.parameters["id_number"], self.parameters["mpp"])
+
+        os.rename(self.partial_folder, self.output_folder)
+
+    def run_incremental(self):
+
+        crops_folder = self.output_folder + "//Crops"
+        canvas_folder = self.output_folder + "//Canvases"
+
+        for modality in self.modalities:
+            os.makedirs(crops_folder + "//" + modality, exist_ok=True)
+
+        os.makedirs(canvas_folder, exist_ok=True)
+
+        jobs = self.define_jobs(crops_folder, canvas_folder)
+        plan = incremental.plan_export(self.output_folder, jobs, self.crops, self.crosshair, self.parameters)
+
+        incremental.apply_plan(plan)
+
+        for job in jobs:
+            job["new_crops"] = plan["write"][job["modality"]]
+            job["write_canvas"] = plan["canvases"][job["modality"]]
+
+        # modalities with nothing new are skipped entirely
+        jobs = [job for job in jobs if job["new_crops"] or job["write_canvas"]]
+
+        self.crops_total = sum(len(job["new_crops"]) for job in jobs)
+        self.modalities_total = len(jobs)
+
+        print(str(self.crops_total) + " crop tiffs to write, " + str(len(plan["rename"])) + " to rename and "
+              + str(len(plan["delete"])) + " to delete")
+
+        self.results = export_modalities(jobs, self.workers, self.progress, self.cancel_event)
+
+        create_locations_csv(self.output_folder, self.crops)
+        create_lut(self.output_folder, self.parameters["id_number"], self.parameters["mpp"])
+
+        incremental.write_export_manifest(self.output_folder, plan["manifest"])
+
+    def cancel(self):
+
+        self.cancel_event.set()
+
+    def poll(self):
+
+        # the gui thread and the export thread may both drain the queue
+        with self.lock:
+
+            while True:
+
+                try:
+                    kind, _ = self.progress.get_nowait()
+                except (queue.Empty, EOFError, OSError):
+                    break
+
+                if kind == "crop":
+                    self.crops_done += 1
+                elif kind == "modality":
+                    self.modalities_done += 1
+
+    def is_running(self):
+
+        return not self.finished
+
+    def join(self, timeout=None):
+
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+    def get_progress(self):
+
+        if self.manager is None or not self.finished:
+            self.poll()
+
+        elapsed = (self.end_time or time.perf_counter()) - (self.start_time or time.perf_counter())
+        throughput = self.crops_done / elapsed if elapsed > 0 else 0.0
+
+        progress = {
+            "crops_done" : self.crops_done,
+            "crops_total" : self.crops_total,
+            "modalities_done" : self.modalities_done,
+            "modalities_total" : self.modalities_total,
+            "crops_per_second" : throughput
+            }
+
+        return progress
@@ -0,0 +1,179 @@
+import os
+import json
+
+MANIFEST_NAME = "export_manifest.json"
+MANIFEST_VERSION = 1
+
+def source_fingerprint(path):
+    """
+    Returns a cheap fingerprint of a modality image, which changes if the file is replaced.
+
+    Args:
+        path (str): The path to the modality image.
+
+    Returns:
+        dict: The size and modification time of the file.
+    """
+
+    stat = os.stat(path)
+
+    return {"size" : stat.st_size, "mtime_ns" : stat.st_mtime_ns}
+
+def read_export_manifest(output_folder):
+    """
+    Reads the manifest of a previous incremental export, if there is a usable one.
+
+    Args:
+        output_folder (str): The incremental export folder.
+
+    Returns:
+        dict or None: The manifest, or None if it is missing, unreadable or out of date.
+    """
+
+    try:
+        with open(output_folder + "//" + MANIFEST_NAME, encoding="utf-8") as manifest_file:
+            manifest = json.load(manifest_file)
+    except (OSError, ValueError):
+        return None
+
+    if manifest.get("version") != MANIFEST_VERSION:
+        return None
+
+    return manifest
+
+def write_export_manifest(output_folder, manifest):
+    """
+    Writes the manifest of an incremental export, replacing the old one in a single step.
+
+    Args:
+        output_folder (str): The incremental export folder.
+        manifest (dict): The manifest from plan_export.
+    """
+
+    manifest_path = output_folder + "//" + MANIFEST_NAME
+
+    with open(manifest_path + ".tmp", "w", encoding="utf-8") as manifest_file:
+        json.dump(manifest, manifest_file)
+
+    os.replace(manifest_path + ".tmp", manifest_path)
+
+def plan_export(output_folder, jobs, crops, crosshair, parameters):
+    """
+    Works out what an incremental export has to write, rename and delete.
+
+    A crop tiff is only written again if the crop is new, has moved or changed size, its
+    modality image has changed, or its file is missing. A crop whose pixels are unchanged
+    but whose name changed (because the foveal centre moved) is renamed instead, and the
+    files of deleted crops are removed. A canvas is only redrawn when anything drawn on it
+    or the canvas settings have changed.
+
+    Args:
+        output_folder (str): The incremental export folder.
+        jobs (list of dict): The export_modality jobs of every modality.
+        crops (list of CropBox): The crops to export.
+        crosshair (Crosshair): The foveal centre crosshair.
+        parameters (dict): User parameters.
+
+    Returns:
+        dict: A dictionary containing:
+            write (dict): The crops to write, by modality.
+            canvases (dict): Whether to redraw the canvas, by modality.
+            rename (list of tuple): The (old path, new path) of crop tiffs to rename.
+            delete (list of str): The paths of crop tiffs to delete.
+            manifest (dict): The manifest to write once the export has finished.
+    """
+
+    old = read_export_manifest(output_folder)
+
+    session = {
+        "id_number" : parameters["id_number"],
+        "eye" : parameters["eye"].name,
+        "mpp" : parameters["mpp"],
+        "ppd" : parameters["ppd"],
+        "crop_size" : parameters["crop_size_μm"]
+        }
+
+    # a different session scale or subject means nothing from the old export can be kept
+    if old is not None and old["session"] != session:
+        old_crops, old_sources, old_canvases = old["crops"], {}, {}
+    elif old is not None:
+        old_crops, old_sources, old_canvases = old["crops"], old["sources"], old["canvases"]
+    else:
+        old_crops, old_sources, old_canvases = {}, {}, {}
+
+    plan = {"write" : {}, "canvases" : {}, "rename" : [], "delete" : []}
+    manifest = {"version" : MANIFEST_VERSION, "session" : session, "sources" : {}, "canvases" : {}, "crops" : {}}
+
+    for crop in crops:
+        manifest["crops"][str(crop.get_ID())] = {"x" : crop.x_absolute, "y" : crop.y_absolute, "size" : crop.size_pix_round, "files" : {}}
+
+    for job in jobs:
+
+        modality = job["modality"]
+        folder = job["crops_folder"] + "/" + modality + "/"
+
+        source = source_fingerprint(job["modality_path"])
+        source_changed = old_sources.get(modality) != source
+        manifest["sources"][modality] = source
+
+        plan["write"][modality] = []
+
+        for crop in crops:
+
+            entry = manifest["crops"][str(crop.get_ID())]
+            old_entry = old_crops.get(str(crop.get_ID()))
+            name = crop.get_tiff_name(modality)
+            entry["files"][modality] = name
+
+            old_name = old_entry["files"].get(modality) if old_entry is not None else None
+            unchanged = (old_entry is not None and not source_changed
+                         and (old_entry["x"], old_entry["y"], old_entry["size"]) == (entry["x"], entry["y"], entry["size"]))
+
+            if unchanged and old_name is not None and os.path.isfile(folder + old_name):
+                if old_name != name:
+                    plan["rename"].append((folder + old_name, folder + name))
+                continue
+
+            plan["write"][modality].append(crop)
+
+            if old_name is not None and old_name != name:
+                plan["delete"].append(folder + old_name)
+
+        # files of crops that have been deleted since the last export
+        for ID, old_entry in old_crops.items():
+            if ID not in manifest["crops"] and modality in old_entry["files"]:
+                plan["delete"].append(folder + old_entry["files"][modality])
+
+        # everything drawn onto the canvas, and how it is drawn
+        canvas_key = {
+            "centre" : list(crosshair.get_abs_location()),
+            "crops" : [[int(ID), entry["x"], entry["y"], entry["size"]] for ID, entry in manifest["crops"].items()],
+            "canvas" : job["canvas"],
+            "font_size" : job["font_size"],
+            "source" : source
+            }
+
+        old_canvas = old_canvases.get(modality)
+        plan["canvases"][modality] = (old_canvas is None or old_canvas["key"] != canvas_key
+                                      or not os.path.isfile(job["canvas_path"]))
+
+        manifest["canvases"][modality] = {"key" : canvas_key}
+
+    plan["manifest"] = manifest
+
+    return plan
+
+def apply_plan(plan):
+    """
+    Deletes the crop tiffs of removed or moved crops and renames the ones whose names changed.
+
+    Args:
+        plan (dict): The plan from plan_export.
+    """
+
+    for path in plan["delete"]:
+        if os.path.isfile(path):
+            os.remove(path)
+
+    for old_path, new_path in plan["rename"]:
+        os.replace(old_path, new_path)
@@ -0,0 +1,164 @@
+import os
+import struct
+
+# file signature, followed by fixed size records of (event, crop ID, x, y)
+MAGIC = b"AOJ1"
+RECORD = struct.Struct("<BIdd")
+
+# journal events, positions are in absolute image coordinates
+CENTRE_PLACED = 1
+CENTRE_REMOVED = 2
+CROP_ADDED = 3
+CROP_DELETED = 4
+CROPS_CLEARED = 5
+
+class SessionJournal:
+    """
+    An append-only, crash-safe journal of the edits made during a cropping session.
+
+    Every centre placement and crop addition or deletion is appended to the journal file
+    as a small fixed size binary record and flushed to disk straight away, so if the
+    application crashes or is closed before saving, the session can be rebuilt by
+    replaying the journal the next time the same image is opened. Records only ever get
+    appended, and compacting rewrites the journal from the replayed state so deleted crops
+    don't build up.
+
+    Attributes:
+        path (str): The path of the journal file.
+        sync (bool): Whether to fsync after every record, as well as flushing.
+
+    Methods:
+        __init__: Opens (or creates) the journal for appending.
+        replay: Rebuilds the session state from the journal.
+        compact: Rewrites the journal to hold only the current state.
+        record: Appends an event to the journal.
+        record_many: Appends several events to the journal with a single flush.
+        reset: Empties the journal, e.g. to start a new session.
+        close: Closes the journal file.
+    """
+
+    def __init__(self, path, sync=True):
+
+        self.path = path
+        self.sync = sync
+        self.file = None
+        self.open()
+
+    def open(self):
+
+        new = not os.path.isfile(self.path) or os.path.getsize(self.path) < len(MAGIC)
+
+        self.file = open(self.path, "wb" if new else "r+b")
+
+        if new:
+            self.file.write(MAGIC)
+            self.flush()
+        elif self.file.read(len(MAGIC)) != MAGIC:
+            self.file.close()
+            raise ValueError(self.path + " is not a session journal")
+
+        # a record cut short by a crash is dropped, so new records line up again
+        records = (os.path.getsize(self.path) - len(MAGIC)) // RECORD.size
+        self.file.seek(len(MAGIC) + records * RECORD.size)
+        self.file.truncate()
+
+    def replay(self):
+
+        state = {"centre": None, "crops": {}, "next_ID": 1, "records": 0}
+
+        with open(self.path, "rb") as journal:
+            data = journal.read()[len(MAGIC):]
+
+        count = len(data) // RECORD.size
+
+        for event, ID, x, y in RECORD.iter_unpack(data[:count * RECORD.size]):
+
+            if event == CENTRE_PLACED:
+                state["centre"] = (x, y)
+            elif event == CENTRE_REMOVED:
+                state["centre"] = None
+            elif event == CROP_ADDED:
+                state["crops"][ID] = (x, y)
+                state["next_ID"] = max(state["next_ID"], ID + 1)
+            elif event == CROP_DELETED:
+                state["crops"].pop(ID, None)
+            elif event == CROPS_CLEARED:
+                state["crops"] = {}
+
+        state["records"] = count
+
+        return state
+
+    def compact(self, state=None):
+
+        if state is None:
+            state = self.replay()
+
+        records = []
+
+        if state["centre"] is not None:
+            records.append(RECORD.pack(CENTRE_PLACED, 0, *state["centre"]))
+
+        for ID, (x, y) in state["crops"].items():
+            records.append(RECORD.pack(CROP_ADDED, ID, x, y))
+
+        # keep the last crop ID even if that crop was deleted, so IDs are never reused
+        last_ID = state["next_ID"] - 1
+
+        if last_ID and last_ID not in state["crops"]:
+            records.append(RECORD.pack(CROP_ADDED, last_ID, 0.0, 0.0))
+            records.append(RECORD.pack(CROP_DELETED, last_ID, 0.0, 0.0))
+
+        # write a new journal alongside and swap it in, so a crash never leaves half of one
+        temp_path = self.path + ".tmp"
+
+        with open(temp_path, "wb") as journal:
+            journal.write(MAGIC + b"".join(records))
+            journal.flush()
+            os.fsync(journal.fileno())
+
+        self.file.close()
+        os.replace(temp_path, self.path)
+        self.open()
+
+    def record(self, event, ID=0, x=0.0, y=0.0):
+
+        self.file.write(RECORD.pack(event, ID, x, y))
+        self.flush()
+
+    def record_many(self, records):
+
+        # one write and one flush for the lot, e.g. for a whole grid of crops
+        self.file.write(b"".join(RECORD.pack(event, ID, x, y) for event, ID, x, y in records))
+        self.flush()
+
+    def flush(self):
+
+        self.file.flush()
+
+        if self.sync:
+            os.fsync(self.file.fileno())
+
+    def reset(self):
+
+        self.file.seek(len(MAGIC))
+        self.file.truncate()
+        self.flush()
+
+    def close(self):
+
+        if self.file is not None and not self.file.closed:
+            self.file.close()
+
+def journal_path(parameters):
+    """
+    Returns the path of the session journal for an image, kept next to the image.
+
+    Args:
+        parameters (dict): User parameters for the image.
+
+    Returns:
+        str: The journal path.
+    """
+
+    return parameters["folder"] + "//" + "." + os.path.splitext(parameters["filename"])[0] + "_session.aoj"
@@ -1,3 +1,4 @@
+import os
 import yaml
 
 from .enums import Eye
@@ -41,6 +42,21 @@ def path(arg):
         
         raise NameError("The image path needs to point to a TIFF file")
 
+def csv_path(arg):
+    """
+    Validates and returns a file path if it points to an existing CSV file.
+    """
+
+    if not arg.endswith(".csv"):
+        
+        raise NameError("The crop location path needs to point to a CSV file")
+
+    if not os.path.isfile(arg):
+
+        raise FileNotFoundError("No such file: " + arg)
+
+    return arg
+
 def mpp(arg):
     """
     Validates and returns the 'microns per pixel' value.
@@ -108,5 +124,16 @@ def crop_size(arg):
     
     return arg
 
+def flags(args, allowed):
+    """
+    Splits optional --flags from the positional arguments, and validates them.
+    """
+
+    positional = [arg for arg in args if not arg.startswith("--")]
+    options = [arg for arg in args if arg.startswith("--")]
 
+    for option in options:
+        if option not in allowed:
+            raise KeyError("Unknown option " + option + " - should be one of " + ", ".join(allowed))
 
+    return positional, set(options)
@@ -0,0 +1,156 @@
+import os
+import json
+import time
+import datetime
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+class Profiler:
+    """
+    Records timing spans around the hot paths of the viewer and export as a Chrome trace.
+
+    Each span is stored as a complete ("X") trace event with its start time, duration,
+    process and thread, so a saved trace can be opened in chrome://tracing or Perfetto and
+    shows where the time of a session went. Spans cost almost nothing while the profiler is
+    disabled. Only the most recent events are kept, so a long session can't run out of
+    memory, and the last duration of every span is kept for showing live.
+
+    Attributes:
+        enabled (bool): Whether spans are being recorded.
+        max_events (int): The number of most recent events kept.
+
+    Methods:
+        __init__: Initializes an empty profiler.
+        span: Times the code inside a with block.
+        add: Records a span from its start and end times.
+        get_events: Returns the events recorded after a given count.
+        merge: Adds events recorded by another process.
+        get_last_ms: Returns the last duration of a span.
+        write: Writes the recorded events as a Chrome trace file.
+    """
+
+    def __init__(self, enabled=False, max_events=500_000):
+
+        self.enabled = enabled
+        self.max_events = max_events
+        self.events = deque(maxlen=max_events)
+        self.count = 0  # events ever recorded, including any that have been dropped
+        self.last_ms = {}
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name, **args):
+
+        if not self.enabled:
+            yield
+            return
+
+        start = time.perf_counter()
+
+        try:
+            yield
+        finally:
+            self.add(name, start, time.perf_counter(), args)
+
+    def add(self, name, start, end, args=None):
+
+        if not self.enabled:
+            return
+
+        # trace timestamps and durations are in microseconds
+        event = {"name" : name, "ph" : "X", "ts" : round(start * 1e6, 1), "dur" : round((end - start) * 1e6, 1),
+                 "pid" : os.getpid(), "tid" : threading.get_ident()}
+
+        if args:
+            event["args"] = args
+
+        with self.lock:
+            self.events.append(event)
+            self.count += 1
+            self.last_ms[name] = (end - start) * 1000
+
+    def get_events(self, since=0):
+
+        with self.lock:
+            new = min(self.count - since, len(self.events))
+            return list(self.events)[len(self.events) - new:]
+
+    def merge(self, events):
+
+        # events from this process are already recorded
+        pid = os.getpid()
+
+        with self.lock:
+            for event in events:
+                if event["pid"] != pid:
+                    self.events.append(event)
+                    self.count += 1
+
+    def get_last_ms(self, name):
+
+        return self.last_ms.get(name)
+
+    def write(self, path):
+
+        events = self.get_events()
+
+        # name the processes so the gui and the export workers are easy to tell apart
+        names = [{"name" : "process_name", "ph" : "M", "pid" : pid,
+                  "args" : {"name" : "main" if pid == os.getpid() else "worker " + str(pid)}}
+                 for pid in sorted(set(event["pid"] for event in events))]
+
+        with open(path, "w", encoding="utf-8") as trace:
+            json.dump({"traceEvents" : names + events, "displayTimeUnit" : "ms"}, trace)
+
+# one profiler per process, shared by every module
+PROFILER = Profiler()
+
+def enable():
+    """
+    Starts recording timing spans in this process.
+    """
+
+    PROFILER.enabled = True
+
+def is_enabled():
+    """
+    Returns whether timing spans are being recorded in this process.
+    """
+
+    return PROFILER.enabled
+
+def span(name, **args):
+    """
+    Times the code inside a with block, if profiling is enabled.
+
+    Args:
+        name (str): The name of the span, e.g. "show_image".
+        **args: Extra values to show with the span in the trace.
+
+    Returns:
+        contextmanager: The span.
+    """
+
+    return PROFILER.span(name, **args)
+
+def write_trace(folder):
+    """
+    Writes the spans recorded so far to a timestamped Chrome trace file, if profiling is enabled.
+
+    Args:
+        folder (str): The folder to save the trace in.
+
+    Returns:
+        str or None: The path of the trace file, or None if profiling is disabled.
+    """
+
+    if not PROFILER.enabled:
+        return None
+
+    trace_path = folder + "//" + "ao_trace_" + datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S") + ".json"
+    PROFILER.write(trace_path)
+
+    print("Profiling trace saved to " + trace_path)
+
+    return trace_path
@@ -1,6 +1,8 @@
 import os
 from PIL import Image
 
+from ..imaging.modality_index import ModalityIndex
+
 def set_max_pixels(max_pixels):
     Image.MAX_IMAGE_PIXELS = max_pixels
 
@@ -27,44 +29,47 @@ def conversions(units):
     
     return crop_size_pix, microns_per_degree, pixels_per_degree
 
-def get_modalities(filename, folder):
+def get_modalities(filename, folder, workers=8, use_cache=True):
     """
-    Extracts modality information from a given filename within a specified folder.
+    Finds the other modalities of an image, checking them against it from their headers.
 
     Args:
         filename (str): The name of the file from which to extract the modalities.
         folder (str): The folder in which the file is located.
+        workers (int): The number of threads reading the image headers.
+        use_cache (bool): Whether to reuse and update the modality index saved in the folder.
 
     Returns:
         tuple: A tuple containing:
-            - modalities (list of str): List of modalities extracted from filenames.
+            - modalities (list of str): List of modalities matching the size of the image.
             - base_name (str): The base name of the file.
             - primary_modality (str): The primary modality extracted from the filename.
+            - problems (list of str): The modalities that don't match the image and why.
     """
 
-    base_end = filename.rfind("_") + 1
-    mod_end = filename.rfind(".")
+    base_name, primary_modality = get_base_name(filename)
 
-    base_name = filename[0:base_end]
-    primary_modality = filename[base_end:mod_end]
+    index = ModalityIndex(folder, base_name, primary_modality, workers, use_cache).build()
 
-    modalities = []
+    return index.get_modalities(), base_name, primary_modality, index.get_problems()
 
-    filenames = os.listdir(folder)
-    tifflist = [file for file in filenames if file.endswith('.tif')]
+def get_base_name(filename):
+    """
+    Splits a filename into the base name shared by every modality and its modality.
 
-    for file in tifflist:
+    Args:
+        filename (str): The name of the image file, e.g. MM_0364_OS_split.tif.
 
-        path = folder + "//" + file
+    Returns:
+        tuple: A tuple containing:
+            - base_name (str): The base name of the file, up to and including the last underscore.
+            - modality (str): The modality of the file.
+    """
 
-        if os.path.isfile(path):
+    base_end = filename.rfind("_") + 1
+    mod_end = filename.rfind(".")
 
-            mod_start = file.rfind("_") + 1
-            mod_end = file.rfind(".")
-            mod_name = file[mod_start:mod_end]
-            modalities.append(mod_name)    
-            
-    return modalities, base_name, primary_modality
+    return filename[0:base_end], filename[base_end:mod_end]
 
 def get_id_number(filename, underscores_in_id_count):
     """
@@ -86,7 +91,7 @@ def get_id_number(filename, underscores_in_id_count):
     
     return id_number
 
-def define_parameters(image_path, eye, settings):
+def define_parameters(image_path, eye, settings, find_modalities=True):
     """
     Defines and returns a dictionary of parameters for image processing.
 
@@ -94,6 +99,8 @@ def define_parameters(image_path, eye, settings):
         image_path (str): The path to the image file.
         eye (Eye): The Eye enumeration indicating whether it's the right or left eye.
         settings (dict): A dictionary of settings from the configuration file.
+        find_modalities (bool): Whether to look for the other modalities now. If not, the
+            modalities are None until they are filled in later (e.g. by the gui's loader).
 
     Returns:
         dict: A dictionary containing various parameters used in image processing.
@@ -101,7 +108,15 @@ def define_parameters(image_path, eye, settings):
     
     folder, filename = os.path.split(image_path)
     crop_size_pix, microns_per_degree, pixels_per_degree = conversions(settings["units"])
-    modalities, base_name, primary_modality = get_modalities(filename, folder)
+    if find_modalities:
+        modalities, base_name, primary_modality, problems = get_modalities(filename, folder, settings["modalities"]["workers"],
+                                                                           settings["modalities"]["index_cache"])
+        for problem in problems:
+            print("Warning: Modality " + problem)
+    else:
+        modalities = None
+        base_name, primary_modality = get_base_name(filename)
+
     id_number = get_id_number(filename, settings["text"]["underscores_in_id_count"])
     
     parameters = {
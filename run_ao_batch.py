@@ -0,0 +1,98 @@
+"""Re-export the AOSLO crops of a whole study in one go.
+
+This script re-exports every subject of a study, without the gui, from
+the crop locations saved in each subject's crop_location_data.csv.
+Subjects are exported in parallel across a pool of worker processes,
+a failure in one subject does not stop the rest, and a summary of the
+timing and success of every subject is written at the end.
+
+Example
+-------
+Re-export every subject found below a study folder::
+
+    $ python run_ao_batch.py D:/studies/cohort_1
+
+Or re-export the subjects listed in a manifest file::
+
+    $ python run_ao_batch.py cohort_1_manifest.csv
+
+Notes
+-----
+    A manifest is a CSV file with the columns image_path, eye, mpp,
+    axial_length and crop_csv, one row per subject. The mpp and
+    axial_length can be left empty to use the values in config.yaml.
+
+    When given a study folder, every folder with an ao_crops output is
+    a subject. Its most recent crop_location_data.csv is used, the image
+    is the one whose name matches the exported canvases, the eye is read
+    from the image file name, and scaling comes from config.yaml. Folders
+    holding several subjects are skipped and reported.
+
+    The summary is saved as ao_batch_summary_<datetime>.csv in the
+    study folder, or next to the manifest.
+
+Arguments
+----------
+source : str
+    A study root folder, or the path to a manifest CSV file.
+"""
+
+import os
+import sys
+import datetime
+
+from lib.utils import parse
+from lib.utils import batch
+from lib.utils.util_func import *
+
+# main loop
+def main():
+    
+    # parse study folder or manifest path
+    SOURCE = parse_args()
+    
+    # load config settings, parse most important
+    SETTINGS = parse.load_config()
+    parse.units(SETTINGS["units"])
+    
+    # increase PIL max image pixels
+    set_max_pixels(SETTINGS["units"]["max_image_pixels"])
+
+    if os.path.isdir(SOURCE):
+        subjects = batch.discover_subjects(SOURCE)
+        summary_folder = SOURCE
+    else:
+        subjects = batch.read_manifest(SOURCE)
+        summary_folder = os.path.dirname(os.path.abspath(SOURCE))
+
+    print("Exporting " + str(len(subjects)) + " subjects...")
+
+    summaries = batch.run_batch(subjects, SETTINGS, SETTINGS["batch"]["workers"])
+
+    summary_path = summary_folder + "//" + "ao_batch_summary_" + datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S") + ".csv"
+    batch.write_summary(summary_path, summaries)
+
+    failed = [summary for summary in summaries if summary["Status"] != "ok"]
+    print(str(len(summaries) - len(failed)) + " subjects exported, " + str(len(failed)) + " failed")
+
+
+def parse_args():
+
+    if len(sys.argv) == 1:
+        
+        raise KeyError("No study folder or manifest specified")
+        
+    elif len(sys.argv) == 2:
+        source = sys.argv[1]
+
+        if not (os.path.isdir(source) or source.endswith(".csv")):
+            raise NameError("The source needs to be a study folder or a manifest CSV file")
+                      
+    else:
+        raise KeyError("Too many input arguments")
+    
+    return source
+
+# the guard keeps the batch worker processes from rerunning the batch
+if __name__ == "__main__":
+    main()
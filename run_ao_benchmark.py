@@ -0,0 +1,75 @@
+"""Benchmark the viewer and export on synthetic AOSLO images.
+
+This script generates synthetic AOSLO-like montages at the sizes, bit
+depths and strip/tile layouts set in config.yaml, each with several fake
+modalities, and times the viewer redraws at several zoom levels and pan
+paths, crop extraction, canvas export and a full save of N crops. The
+wall time and peak memory of every benchmark are written to a JSON
+report, so the performance of different versions can be compared.
+
+Example
+-------
+Run the benchmarks in a scratch folder::
+
+    $ python run_ao_benchmark.py D:/scratch/ao_benchmark
+
+Notes
+-----
+    The synthetic images are kept in a synthetic subfolder of the work
+    folder and reused by later runs, as the largest ones take a while
+    to generate. A 50k x 50k 8 bit image is 2.5 GB per modality.
+
+    Every benchmark runs in a fresh process, so its peak memory is its
+    own. The report is saved as ao_benchmark_<datetime>.json in the work
+    folder.
+
+Arguments
+----------
+work_folder : str
+    The folder for the synthetic images, benchmark outputs and report.
+"""
+
+import os
+import sys
+import datetime
+
+from lib.utils import parse
+from lib.benchmark import suite
+
+# main loop
+def main():
+
+    # parse work folder
+    WORK_FOLDER = parse_args()
+
+    # load config settings, parse most important
+    SETTINGS = parse.load_config()
+    parse.units(SETTINGS["units"])
+
+    os.makedirs(WORK_FOLDER, exist_ok=True)
+
+    options = dict(SETTINGS["benchmark"], work_folder=os.path.abspath(WORK_FOLDER))
+
+    report = suite.run_suite(SETTINGS, options)
+
+    report_path = WORK_FOLDER + "//" + "ao_benchmark_" + datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S") + ".json"
+    suite.write_report(report_path, report)
+
+
+def parse_args():
+
+    if len(sys.argv) == 1:
+
+        raise KeyError("No work folder specified")
+
+    elif len(sys.argv) == 2:
+        work_folder = sys.argv[1]
+
+    else:
+        raise KeyError("Too many input arguments")
+
+    return work_folder
+
+# the guard keeps the benchmark worker processes from rerunning the suite
+if __name__ == "__main__":
+    main()
@@ -17,7 +17,9 @@ Notes
     The file naming format should be IMAGEID_otherinfo_MODALITY.tif. If
     there are underscores within the ID string, this can be programmed
     using the "underscores_in_id_count" setting in the config file. Other
-    tifs in the same folder will be registered as other modalities.
+    tifs in the same folder with the same name up to the modality will
+    be registered as other modalities, and any that don't match the size
+    or bit depth of the image are reported when the cropper starts.
 
 Arguments
 ----------
@@ -27,6 +29,15 @@ image_path : str
     
 eye : str
     The eye in the image, either "OD" or "OS".
+
+Options
+-------
+--profile
+    Time the viewer and export, and save a Chrome trace next to the
+    image on exit (the same as profiling: enabled in config.yaml).
+
+--overlay
+    Show frame time and tile cache state in the corner of the viewer.
 """
 
 import sys
@@ -34,47 +45,63 @@ import tkinter as tk
 
 from lib.gui.cropper import Cropper
 from lib.utils import parse
+from lib.utils import profiling
 from lib.utils.util_func import *
 
 # main loop
 def main():
     
-    # parse image path and eye string
-    IMAGE_PATH, EYE = parse_args()
+    # parse image path, eye string and options
+    IMAGE_PATH, EYE, OPTIONS = parse_args()
     
     # load config settings, parse most important
     SETTINGS = parse.load_config()
     parse.units(SETTINGS["units"])
+
+    # options on the command line switch on profiling on top of the config
+    if "--profile" in OPTIONS:
+        SETTINGS["profiling"]["enabled"] = True
+    if "--overlay" in OPTIONS:
+        SETTINGS["profiling"]["overlay"] = True
+
+    if SETTINGS["profiling"]["enabled"]:
+        profiling.enable()
     
-    # calculate further parameters
-    parameters = define_parameters(IMAGE_PATH, EYE, SETTINGS)
-    
-    # increase PIL max image pixels
+    # increase PIL max image pixels, before any image header is read
     set_max_pixels(SETTINGS["units"]["max_image_pixels"])
+
+    # calculate further parameters, the modalities are found once the gui is up
+    parameters = define_parameters(IMAGE_PATH, EYE, SETTINGS, find_modalities=False)
     
     # run gui
     main = tk.Tk()
     cp = Cropper(main, IMAGE_PATH, parameters, SETTINGS)
     main.mainloop()
 
+    profiling.write_trace(parameters["folder"])
+
 
 def parse_args():
 
-    if len(sys.argv) == 1:
+    args, options = parse.flags(sys.argv[1:], ("--profile", "--overlay"))
+
+    if len(args) == 0:
         
         raise KeyError("No image file specified")
 
-    elif len(sys.argv) == 2:
+    elif len(args) == 1:
         
         raise KeyError("No eye specified")
         
-    elif len(sys.argv) == 3:
-        image_path = parse.path(sys.argv[1])
-        eye = parse.eye(sys.argv[2])
+    elif len(args) == 2:
+        image_path = parse.path(args[0])
+        eye = parse.eye(args[1])
                       
     else:
         raise KeyError("Too many input arguments")
     
-    return image_path, eye
+    return image_path, eye, options
 
-main()
\ No newline at end of file
+# the guard keeps the export worker processes from relaunching the gui
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,108 @@
+"""Re-export AOSLO crops without the gui.
+
+This script regenerates the crop tiffs, crop location canvases and LUT
+of a previously saved session, using the crop locations recorded in its
+crop_location_data.csv. No display is needed, so it can be run over
+many subjects (for example after re-registering or adding a modality).
+
+Example
+-------
+Re-export the crops saved from MM_0364_OS_combined_0p3796umpx_split.tif
+for the Left eye, for every modality now found in the image folder::
+
+    $ python run_ao_export.py MM_0364_OS_combined_0p3796umpx_split.tif OS ao_crops_2024-01-01_12-00-00/crop_location_data.csv
+
+Notes
+-----
+    The crops are written to a new timestamped ao_crops folder next to
+    the image, named in exactly the same way as a save from the gui.
+    Scaling and dimensions are taken from config.yaml as usual.
+
+Arguments
+----------
+image_path : str
+    The relative or absolute path to the image file. This
+    file should be a (single stack) tiff file.
+    
+eye : str
+    The eye in the image, either "OD" or "OS".
+
+csv_path : str
+    The path to the crop_location_data.csv of the session to re-export.
+
+Options
+-------
+--profile
+    Time the export stages, and save a Chrome trace next to the image
+    (the same as profiling: enabled in config.yaml).
+"""
+
+import sys
+import datetime
+
+from lib.utils import parse
+from lib.utils import export
+from lib.utils import profiling
+from lib.utils.util_func import *
+
+# main loop
+def main():
+    
+    # parse image path, eye string, crop locations path and options
+    IMAGE_PATH, EYE, CSV_PATH, OPTIONS = parse_args()
+    
+    # load config settings, parse most important
+    SETTINGS = parse.load_config()
+    parse.units(SETTINGS["units"])
+
+    if SETTINGS["profiling"]["enabled"] or "--profile" in OPTIONS:
+        profiling.enable()
+    
+    # increase PIL max image pixels, before any image header is read
+    set_max_pixels(SETTINGS["units"]["max_image_pixels"])
+
+    # calculate further parameters
+    parameters = define_parameters(IMAGE_PATH, EYE, SETTINGS)
+
+    # rebuild the session and export it
+    crops, crosshair = export.load_session(CSV_PATH, parameters, SETTINGS)
+
+    output_folder = parameters["folder"] + "//" + "ao_crops_" + datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    task = export.ExportTask(output_folder, crops, crosshair, parameters, SETTINGS)
+    task.run()
+
+    profiling.write_trace(parameters["folder"])
+
+    if task.error is not None:
+        raise task.error
+
+
+def parse_args():
+
+    args, options = parse.flags(sys.argv[1:], ("--profile",))
+
+    if len(args) == 0:
+        
+        raise KeyError("No image file specified")
+
+    elif len(args) == 1:
+        
+        raise KeyError("No eye specified")
+
+    elif len(args) == 2:
+        
+        raise KeyError("No crop location csv specified")
+        
+    elif len(args) == 3:
+        image_path = parse.path(args[0])
+        eye = parse.eye(args[1])
+        csv_path = parse.csv_path(args[2])
+                      
+    else:
+        raise KeyError("Too many input arguments")
+    
+    return image_path, eye, csv_path, options
+
+# the guard keeps the export worker processes from rerunning the export
+if __name__ == "__main__":
+    main()